@@ -23,6 +23,45 @@ byte tx_buffer[255]; // I'm sure I will never want this to be larger. NEVER
 uint8_t tx_length;
 byte error_code[2];
 
+// frame version: 2 ends every frame in a CRC-16 and starts it with 0xFD, 1 is the old 0xFE ... 0xAB 0xCD format
+#define FRAME_VERSION 2
+
+// CRC-16/CCITT-FALSE (polynomial 0x1021), one entry per value of the top byte of the CRC xor the next data byte
+const uint16_t crc16_table[256] = {
+  0x0000, 0x1021, 0x2042, 0x3063, 0x4084, 0x50A5, 0x60C6, 0x70E7,
+  0x8108, 0x9129, 0xA14A, 0xB16B, 0xC18C, 0xD1AD, 0xE1CE, 0xF1EF,
+  0x1231, 0x0210, 0x3273, 0x2252, 0x52B5, 0x4294, 0x72F7, 0x62D6,
+  0x9339, 0x8318, 0xB37B, 0xA35A, 0xD3BD, 0xC39C, 0xF3FF, 0xE3DE,
+  0x2462, 0x3443, 0x0420, 0x1401, 0x64E6, 0x74C7, 0x44A4, 0x5485,
+  0xA56A, 0xB54B, 0x8528, 0x9509, 0xE5EE, 0xF5CF, 0xC5AC, 0xD58D,
+  0x3653, 0x2672, 0x1611, 0x0630, 0x76D7, 0x66F6, 0x5695, 0x46B4,
+  0xB75B, 0xA77A, 0x9719, 0x8738, 0xF7DF, 0xE7FE, 0xD79D, 0xC7BC,
+  0x48C4, 0x58E5, 0x6886, 0x78A7, 0x0840, 0x1861, 0x2802, 0x3823,
+  0xC9CC, 0xD9ED, 0xE98E, 0xF9AF, 0x8948, 0x9969, 0xA90A, 0xB92B,
+  0x5AF5, 0x4AD4, 0x7AB7, 0x6A96, 0x1A71, 0x0A50, 0x3A33, 0x2A12,
+  0xDBFD, 0xCBDC, 0xFBBF, 0xEB9E, 0x9B79, 0x8B58, 0xBB3B, 0xAB1A,
+  0x6CA6, 0x7C87, 0x4CE4, 0x5CC5, 0x2C22, 0x3C03, 0x0C60, 0x1C41,
+  0xEDAE, 0xFD8F, 0xCDEC, 0xDDCD, 0xAD2A, 0xBD0B, 0x8D68, 0x9D49,
+  0x7E97, 0x6EB6, 0x5ED5, 0x4EF4, 0x3E13, 0x2E32, 0x1E51, 0x0E70,
+  0xFF9F, 0xEFBE, 0xDFDD, 0xCFFC, 0xBF1B, 0xAF3A, 0x9F59, 0x8F78,
+  0x9188, 0x81A9, 0xB1CA, 0xA1EB, 0xD10C, 0xC12D, 0xF14E, 0xE16F,
+  0x1080, 0x00A1, 0x30C2, 0x20E3, 0x5004, 0x4025, 0x7046, 0x6067,
+  0x83B9, 0x9398, 0xA3FB, 0xB3DA, 0xC33D, 0xD31C, 0xE37F, 0xF35E,
+  0x02B1, 0x1290, 0x22F3, 0x32D2, 0x4235, 0x5214, 0x6277, 0x7256,
+  0xB5EA, 0xA5CB, 0x95A8, 0x8589, 0xF56E, 0xE54F, 0xD52C, 0xC50D,
+  0x34E2, 0x24C3, 0x14A0, 0x0481, 0x7466, 0x6447, 0x5424, 0x4405,
+  0xA7DB, 0xB7FA, 0x8799, 0x97B8, 0xE75F, 0xF77E, 0xC71D, 0xD73C,
+  0x26D3, 0x36F2, 0x0691, 0x16B0, 0x6657, 0x7676, 0x4615, 0x5634,
+  0xD94C, 0xC96D, 0xF90E, 0xE92F, 0x99C8, 0x89E9, 0xB98A, 0xA9AB,
+  0x5844, 0x4865, 0x7806, 0x6827, 0x18C0, 0x08E1, 0x3882, 0x28A3,
+  0xCB7D, 0xDB5C, 0xEB3F, 0xFB1E, 0x8BF9, 0x9BD8, 0xABBB, 0xBB9A,
+  0x4A75, 0x5A54, 0x6A37, 0x7A16, 0x0AF1, 0x1AD0, 0x2AB3, 0x3A92,
+  0xFD2E, 0xED0F, 0xDD6C, 0xCD4D, 0xBDAA, 0xAD8B, 0x9DE8, 0x8DC9,
+  0x7C26, 0x6C07, 0x5C64, 0x4C45, 0x3CA2, 0x2C83, 0x1CE0, 0x0CC1,
+  0xEF1F, 0xFF3E, 0xCF5D, 0xDF7C, 0xAF9B, 0xBFBA, 0x8FD9, 0x9FF8,
+  0x6E17, 0x7E36, 0x4E55, 0x5E74, 0x2E93, 0x3EB2, 0x0ED1, 0x1EF0
+};
+
 char hex_str[512]; // two characters per byte in tx_buffer, plus a newline, plus a null terminator
 char log_name[11];
 
@@ -92,7 +131,7 @@ void setup() {
 
   // Try to initialize the ICM-20948 sensor
   if (!icm.begin_I2C()) {
-    send_telemetry(7, 0);
+    send_telemetry(MSG_DEBUG, MSG_DEBUG_LENGTH);
   }
 
   // Get the sensor objects from the main ICM driver
@@ -186,18 +225,18 @@ void loop() {
   // send the IMU and Barometric Pressure data at 100 Hz
   if (millis() > imu_time + 10) {
 
-    memcpy(tx_buffer+3, &temp.temperature, 4);
+    memcpy(tx_buffer+IMU_ELECTRONICS_TEMPERATURE, &temp.temperature, 4);
     // since we are using bytes, starting at the address plus four will copy into the correct location
-    memcpy(tx_buffer+7, &accel.acceleration.x, 4);
-    memcpy(tx_buffer+11, &accel.acceleration.y, 4);
-    memcpy(tx_buffer+15, &accel.acceleration.z, 4);
+    memcpy(tx_buffer+IMU_ACCEL_X, &accel.acceleration.x, 4);
+    memcpy(tx_buffer+IMU_ACCEL_Y, &accel.acceleration.y, 4);
+    memcpy(tx_buffer+IMU_ACCEL_Z, &accel.acceleration.z, 4);
 
     // now copy in the gyro data
-    memcpy(tx_buffer+19, &gyro.gyro.x, 4);
-    memcpy(tx_buffer+23, &gyro.gyro.y, 4);
-    memcpy(tx_buffer+27, &gyro.gyro.z, 4);
+    memcpy(tx_buffer+IMU_GYRO_X, &gyro.gyro.x, 4);
+    memcpy(tx_buffer+IMU_GYRO_Y, &gyro.gyro.y, 4);
+    memcpy(tx_buffer+IMU_GYRO_Z, &gyro.gyro.z, 4);
 
-    send_telemetry(0x03, 28);
+    send_telemetry(MSG_IMU, MSG_IMU_LENGTH);
 
     imu_time+=10;
   }
@@ -205,30 +244,30 @@ void loop() {
   if (millis() > car_time + 20) {
 
     uint16_t temp_adc = analogRead(34); // analog 1 filtered
-    memcpy(tx_buffer+3, &temp_adc, 2);
+    memcpy(tx_buffer+CAR_BATTERY_VOLTAGE, &temp_adc, 2);
     temp_adc = analogRead(35); // analog 2 filtered
-    memcpy(tx_buffer+5, &temp_adc, 2);
+    memcpy(tx_buffer+CAR_FUEL_GAUGE, &temp_adc, 2);
     temp_adc = analogRead(32); // analog 3 filtered
-    memcpy(tx_buffer+7, &temp_adc, 2);
+    memcpy(tx_buffer+CAR_OIL_PRESSURE, &temp_adc, 2);
     temp_adc = analogRead(25); // analog 4 filtered
-    memcpy(tx_buffer+9, &temp_adc, 2);
+    memcpy(tx_buffer+CAR_COOLANT_TEMPERATURE, &temp_adc, 2);
 
 
     float avg = (float) rpm_delta / number_rpm_measurements;
-    memcpy(tx_buffer+11, &avg, 4);
+    memcpy(tx_buffer+CAR_RPM_PERIOD, &avg, 4);
 
-    send_telemetry(0x05, 12);
+    send_telemetry(MSG_CAR, MSG_CAR_LENGTH);
 
     // driver input updates occur on the same loop
     temp_adc = analogRead(26);
-    memcpy(tx_buffer+3, &temp_adc, 2);
+    memcpy(tx_buffer+DRIVER_STEERING_RAW, &temp_adc, 2);
 
     temp_adc = analogRead(27);
-    memcpy(tx_buffer+5, &temp_adc, 2);
+    memcpy(tx_buffer+DRIVER_PIT_ENTRY, &temp_adc, 2);
     temp_adc = analogRead(14);
-    memcpy(tx_buffer+7, &temp_adc, 2);
+    memcpy(tx_buffer+DRIVER_BRAKE, &temp_adc, 2);
 
-    send_telemetry(0x06, 6);
+    send_telemetry(MSG_DRIVER, MSG_DRIVER_LENGTH);
 
     car_time+=20;
 
@@ -236,27 +275,27 @@ void loop() {
 
   // send a heartbeat message and GPS message at 1 Hz
   if (millis() > heartbeat_time + 1000) {
-    send_telemetry(0x01, 0);
+    send_telemetry(MSG_HEARTBEAT, MSG_HEARTBEAT_LENGTH);
     
     // This is really stupid and inefficient but I am lazy
     double temp = gps.location.lat();
-    memcpy(tx_buffer+3, &temp, 8);
+    memcpy(tx_buffer+GPS_LAT, &temp, 8);
     temp = gps.location.lng();
-    memcpy(tx_buffer+11, &temp, 8);
+    memcpy(tx_buffer+GPS_LON, &temp, 8);
     temp = gps.speed.mph();
-    memcpy(tx_buffer+19, &temp, 8);
+    memcpy(tx_buffer+GPS_GPS_SPEED, &temp, 8);
     temp = gps.course.deg();
-    memcpy(tx_buffer+27, &temp, 8);
+    memcpy(tx_buffer+GPS_HDG, &temp, 8);
     temp = gps.altitude.feet();
-    memcpy(tx_buffer+35, &temp, 8);
+    memcpy(tx_buffer+GPS_GPS_ALTITUDE, &temp, 8);
     uint32_t temp_sats = gps.satellites.value();
-    memcpy(tx_buffer+43, &temp_sats, 4);
+    memcpy(tx_buffer+GPS_NUM_SATELLITES, &temp_sats, 4);
     temp = gps.hdop.hdop();
-    memcpy(tx_buffer+47, &temp, 8);
+    memcpy(tx_buffer+GPS_HDOP, &temp, 8);
 
 
     // GPS Message
-    send_telemetry(0x02, 52);
+    send_telemetry(MSG_GPS, MSG_GPS_LENGTH);
 
     heartbeat_time+=1000;
 
@@ -305,6 +344,9 @@ void loop() {
 * 
 * <START BYTE> <LENGTH BYTE> <MSG ID BYTE> <PAYLOAD> <ERROR CORRECTION BYTES (2)>
 * 
+* With FRAME_VERSION 2 the start byte is 0xFD and the last two bytes are the CRC-16 of the rest of the frame, with
+* FRAME_VERSION 1 the start byte is 0xFE and the last two bytes are always 0xAB 0xCD
+* 
 */
 bool send_telemetry(byte msg_type, uint8_t length)
 {
@@ -313,13 +355,24 @@ bool send_telemetry(byte msg_type, uint8_t length)
   // Calculate the length of the message
   tx_length = length + 5;
 
+#if FRAME_VERSION == 2
+  tx_buffer[0] = static_cast<unsigned char>(0xFD);   // This is the 'start' byte, which also marks the frame as having a CRC
+#else
   tx_buffer[0] = static_cast<unsigned char>(0xFE);   // This is the 'start' byte
+#endif
   tx_buffer[1] = tx_length;   // This is the length of the message
   tx_buffer[2] = msg_type;
 
+#if FRAME_VERSION == 2
+  // Error detection code, a CRC-16 over the start byte, header and payload, sent little endian like the payload
+  uint16_t crc = crc16(tx_buffer, 3+length);
+  error_code[0] = crc & 0xFF;
+  error_code[1] = crc >> 8;
+#else
   // Error correction code
   error_code[0] = 0xAB; 
   error_code[1] = 0xCD;
+#endif
   // Copy the error code into the end of the message
   memcpy(&tx_buffer[3+length], error_code, 2); 
   
@@ -335,6 +388,20 @@ bool send_telemetry(byte msg_type, uint8_t length)
   return true;
 }
 
+/*
+* 
+* CRC-16/CCITT-FALSE of a buffer, a table lookup per byte (frame_parser.py on the dashboard computes the same)
+* 
+*/
+uint16_t crc16(const byte *data, uint8_t length)
+{
+  uint16_t crc = 0xFFFF;
+  for(int i = 0; i < length; i++) {
+    crc = (crc << 8) ^ crc16_table[((crc >> 8) ^ data[i]) & 0xFF];
+  }
+  return crc;
+}
+
 void writeFile(fs::FS &fs, const char * path, const char * message){
   Serial.printf("Writing file: %s\n", path);
 
@@ -20,7 +20,11 @@
 #include "SD.h"
 #include "SPI.h"
 
+// message IDs, payload lengths and field offsets, generated from messages.csv on the dashboard
+#include "telemetry_messages.h"
+
 bool send_telemetry(byte msg_type, uint8_t length);
+uint16_t crc16(const byte *data, uint8_t length);
 
 void writeFile(fs::FS &fs, const char * path, const char * message);
 void appendFile(fs::FS &fs, const char * path, const char * message);
@@ -0,0 +1,51 @@
+// generated from messages.csv by message_schema.py, don't edit by hand
+
+#ifndef telemetry_messages_h
+#define telemetry_messages_h
+
+#define MSG_HEARTBEAT 0x01
+#define MSG_HEARTBEAT_LENGTH 0
+
+#define MSG_GPS 0x02
+#define MSG_GPS_LENGTH 52
+#define GPS_LAT 3 // float64, degrees
+#define GPS_LON 11 // float64, degrees
+#define GPS_HDG 27 // float64, degrees
+#define GPS_GPS_ALTITUDE 35 // float64, feet
+#define GPS_GPS_SPEED 19 // float64, mph
+#define GPS_NUM_SATELLITES 43 // uint32
+#define GPS_HDOP 47 // float64
+
+#define MSG_IMU 0x03
+#define MSG_IMU_LENGTH 28
+#define IMU_ACCEL_X 7 // float32, m/s^2
+#define IMU_ACCEL_Y 11 // float32, m/s^2
+#define IMU_ACCEL_Z 15 // float32, m/s^2
+#define IMU_GYRO_X 19 // float32, rad/s
+#define IMU_GYRO_Y 23 // float32, rad/s
+#define IMU_GYRO_Z 27 // float32, rad/s
+#define IMU_ELECTRONICS_TEMPERATURE 3 // float32, degC
+
+#define MSG_PRESSURE 0x04
+#define MSG_PRESSURE_LENGTH 8
+#define PRESSURE_DPS310_TEMPERATURE 3 // float32, degC
+#define PRESSURE_AMBIENT_PRESSURE 7 // float32, hPa
+
+#define MSG_CAR 0x05
+#define MSG_CAR_LENGTH 12
+#define CAR_RPM_PERIOD 11 // float32, us
+#define CAR_COOLANT_TEMPERATURE 9 // uint16, ADC counts
+#define CAR_BATTERY_VOLTAGE 3 // uint16, ADC counts
+#define CAR_FUEL_GAUGE 5 // uint16, ADC counts
+#define CAR_OIL_PRESSURE 7 // uint16, ADC counts
+
+#define MSG_DRIVER 0x06
+#define MSG_DRIVER_LENGTH 6
+#define DRIVER_STEERING_RAW 3 // uint16, ADC counts
+#define DRIVER_PIT_ENTRY 5 // uint16, ADC counts
+#define DRIVER_BRAKE 7 // uint16, ADC counts
+
+#define MSG_DEBUG 0x07
+#define MSG_DEBUG_LENGTH 0
+
+#endif
@@ -0,0 +1,135 @@
+import csv
+import threading
+from pathlib import Path
+
+
+class AlertRule:
+    """
+    A threshold alert on one decoded channel, with a hysteresis band and a debounce time
+
+    The alert turns on once the value has been past the threshold for `debounce` seconds, and only turns off again
+    once the value has been back past threshold -/+ hysteresis for `debounce` seconds, so a value sitting right on the
+    threshold doesn't make the label flicker
+    """
+
+    def __init__(self, name, channel, comparison, threshold, hysteresis=0.0, debounce=0.0, widget=None):
+        if comparison not in ('>', '<'):
+            raise ValueError(f"Alert {name}: comparison must be '>' or '<', not '{comparison}'")
+
+        self.name = name
+        self.channel = channel
+        self.comparison = comparison
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+        # name of the Data view label this alert colors, if any
+        self.widget = widget
+
+        self.active = False
+        self.value = None
+        # time the value first moved to the other side of the on/off threshold, None while it agrees with the state
+        self.pending_since = None
+
+    def update(self, t, value):
+        """
+        Feeds a new sample to the rule, returns True if the alert state changed
+        """
+        self.value = value
+
+        if self.comparison == '>':
+            wants_change = value < self.threshold - self.hysteresis if self.active else value > self.threshold
+        else:
+            wants_change = value > self.threshold + self.hysteresis if self.active else value < self.threshold
+
+        if not wants_change:
+            self.pending_since = None
+            return False
+
+        if self.pending_since is None:
+            self.pending_since = t
+
+        if t - self.pending_since >= self.debounce:
+            self.active = not self.active
+            self.pending_since = None
+            return True
+
+        return False
+
+
+class AlertEngine:
+    """
+    Evaluates alert rules as samples arrive
+
+    Rules are indexed by the channel they watch, so a new sample only evaluates the rules that depend on that channel.
+    State changes are written to the session log and queued for the UI, which only restyles the labels that changed. The
+    fleet feeds samples from its ingest threads while the GUI thread takes the changes, so the queue is kept under a lock.
+    """
+
+    def __init__(self, rules=None, log_path=None):
+        self.rules = []
+        self.rules_by_channel = {}
+        self.changed = []
+        self.changed_lock = threading.Lock()
+        self.log_path = log_path
+
+        for rule in rules or []:
+            self.add_rule(rule)
+
+        if self.log_path is not None:
+            with open(self.log_path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['Time', 'Alert', 'Channel', 'State', 'Value'])
+
+    @classmethod
+    def from_file(cls, path, log_path=None):
+        """
+        Loads the rules from a .csv configuration file, in the same style as maps/locations.csv, lines starting with # are
+        comments
+        """
+        rules = []
+        if Path(path).exists():
+            with open(path, newline='') as csvfile:
+                reader = csv.DictReader(line for line in csvfile if not line.startswith('#'))
+                for row in reader:
+                    # Name, Channel, Comparison, Threshold, Hysteresis, Debounce, Widget
+                    rules.append(AlertRule(row['Name'], row['Channel'], row['Comparison'], float(row['Threshold']),
+                                           float(row['Hysteresis'] or 0), float(row['Debounce'] or 0),
+                                           row['Widget'] or None))
+        else:
+            print(f"Alert configuration {path} not found, no alerts loaded")
+
+        return cls(rules, log_path)
+
+    def add_rule(self, rule):
+        self.rules.append(rule)
+        self.rules_by_channel.setdefault(rule.channel, []).append(rule)
+
+    def update(self, t, samples):
+        """
+        Feeds new samples ({channel: value}) arriving at time t, evaluating only the rules on those channels
+        """
+        for channel, value in samples.items():
+            for rule in self.rules_by_channel.get(channel, ()):
+                if rule.update(t, value):
+                    with self.changed_lock:
+                        self.changed.append(rule)
+                    self.log(t, rule)
+
+    def log(self, t, rule):
+        if self.log_path is None:
+            return
+        with open(self.log_path, 'a', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([t, rule.name, rule.channel, 'ON' if rule.active else 'OFF', rule.value])
+
+    def pop_changed(self):
+        """
+        Returns the rules whose state changed since the last call, for the UI to restyle
+        """
+        with self.changed_lock:
+            changed, self.changed = self.changed, []
+        return changed
+
+    @property
+    def active(self):
+        return [rule for rule in self.rules if rule.active]
@@ -1,4 +1,3 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
@@ -9,21 +8,24 @@ import cartopy.io.img_tiles as cimgt
 # =========================
 # LOAD DATASETS
 # =========================
-imu1 = pd.read_csv("./logs/1777661479.0555258/imu.csv").sort_values("Time")
-gps1 = pd.read_csv("./logs/1777661479.0555258/gps.csv").sort_values("Time")
+from session_cache import load_session
 
-imu2 = pd.read_csv("./logs/1777836759.181342/imu.csv").sort_values("Time")
-gps2 = pd.read_csv("./logs/1777836759.181342/gps.csv").sort_values("Time")
+# memory mapped columns from the session cache (built from the csv logs the first time, with the rows sorted by time)
+session1 = load_session("./logs/1777661479.0555258")
+imu1, gps1 = session1["imu"], session1["gps"]
+
+session2 = load_session("./logs/1777836759.181342")
+imu2, gps2 = session2["imu"], session2["gps"]
 
 
 # Extract arrays
 def unpack(imu, gps):
     return (
-        imu["Time"].values,
-        imu["Y dot"].values,
-        gps["Time"].values,
-        gps["Lat"].values,
-        gps["Lon"].values
+        imu["Time"],
+        imu["Y dot"],
+        gps["Time"],
+        gps["Lat"],
+        gps["Lon"]
     )
 
 imu_time1, ydot1, gps_time1, lat1_all, lon1_all = unpack(imu1, gps1)
@@ -1,4 +1,3 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
@@ -6,38 +5,43 @@ from matplotlib.widgets import Slider
 # =========================
 # LOAD DATA
 # =========================
-imu = pd.read_csv("./logs/1777836759.181342/imu.csv")
-gps = pd.read_csv("./logs/1777836759.181342/gps.csv")
+from session_cache import load_session
+from pyramid import query
 
-# Ensure sorted by time
-imu = imu.sort_values("Time")
-gps = gps.sort_values("Time")
+# most points drawn per segment, whatever the window length-- zoomed out views come from the min/max pyramid
+MAX_POINTS = 2000
 
-imu_time = imu["Time"].values
-y_dot = imu["Y dot"].values
+# memory mapped columns from the session cache (built from the csv logs the first time, with the rows sorted by time)
+session = load_session("./logs/1777836759.181342")
+imu = session["imu"]
+gps = session["gps"]
 
-gps_time = gps["Time"].values
+imu_time = imu["Time"]
+y_dot = imu["Y dot"]
+
+gps_time = gps["Time"]
 
 
 # =========================
 # HELPER FUNCTIONS
 # =========================
 def get_segment(start_time, duration=20):
-    mask = (imu_time >= start_time) & (imu_time <= start_time + duration)
-    return imu_time[mask], y_dot[mask]
+    return query(session, "Y dot", start_time, start_time + duration, MAX_POINTS)
 
 
 def get_gps_at(time):
-    idx = np.argmin(np.abs(gps_time - time))
-    row = gps.iloc[idx]
-    return row["Lat"], row["Lon"]
+    # the log is in time order, so a binary search finds the nearest fix without scanning the whole column
+    idx = min(np.searchsorted(gps_time, time), len(gps_time) - 1)
+    if idx > 0 and abs(gps_time[idx-1] - time) < abs(gps_time[idx] - time):
+        idx -= 1
+    return gps["Lat"][idx], gps["Lon"][idx]
 
 
 # =========================
 # INITIAL VALUES
 # =========================
-t_min = imu_time.min()
-t_max = imu_time.max() - 20
+t_min = imu_time[0]
+t_max = imu_time[-1] - 20
 
 t1_init = t_min
 t2_init = t_min + 40  # offset so they aren't identical
@@ -47,7 +51,7 @@ t2_init = t_min + 40  # offset so they aren't identical
 # PLOT SETUP
 # =========================
 fig, ax = plt.subplots()
-plt.subplots_adjust(bottom=0.3)
+plt.subplots_adjust(bottom=0.35)
 
 t1, y1 = get_segment(t1_init)
 t2, y2 = get_segment(t2_init)
@@ -68,9 +72,12 @@ gps_text = ax.text(0.02, 0.95, "", transform=ax.transAxes, va='top')
 # =========================
 ax_slider1 = plt.axes([0.15, 0.15, 0.7, 0.03])
 ax_slider2 = plt.axes([0.15, 0.08, 0.7, 0.03])
+ax_slider3 = plt.axes([0.15, 0.22, 0.7, 0.03])
 
 slider1 = Slider(ax_slider1, "Segment 1 Start", t_min, t_max, valinit=t1_init)
 slider2 = Slider(ax_slider2, "Segment 2 Start", t_min, t_max, valinit=t2_init)
+# window length, from the original 20 seconds out to the whole session
+slider3 = Slider(ax_slider3, "Window (s)", 20, max(imu_time[-1] - t_min, 20), valinit=20)
 
 
 # =========================
@@ -80,8 +87,10 @@ def update(val):
     t1_start = slider1.val
     t2_start = slider2.val
 
-    t1, y1 = get_segment(t1_start)
-    t2, y2 = get_segment(t2_start)
+    duration = slider3.val
+
+    t1, y1 = get_segment(t1_start, duration)
+    t2, y2 = get_segment(t2_start, duration)
 
     if len(t1) > 0:
         line1.set_xdata(t1 - t1[0])
@@ -108,6 +117,7 @@ def update(val):
 
 slider1.on_changed(update)
 slider2.on_changed(update)
+slider3.on_changed(update)
 
 # Initial GPS display
 update(None)
@@ -1,11 +1,25 @@
 
+import time
+# taken before anything else is imported, so the startup benchmark includes the imports
+START_TIME = time.time()
+
 from pathlib import Path #needed to reference the stylesheet
 import os #needed to set the environment variable for usb link
 
+# optional-- runs asyncio on the Qt event loop, so the cars are read as soon as their bytes arrive instead of by worker threads
+try:
+    import qasync
+except ImportError:
+    qasync = None
+
 # import necessary classes from Qt modules
 from PySide6.QtCore import (
     QTimer,
 )
+from PySide6.QtGui import (
+    QKeySequence,
+    QShortcut,
+)
 from PySide6.QtWidgets import (
     QApplication,
     QWidget,
@@ -26,8 +40,30 @@ from updateinformation import UpdateInformation
 # import the custom classes defined in the GCS file, which connect to a vehicle and get data from the vehicle
 from connection import Vehicle
 
+# several cars connected at once, each read on its own worker thread
+from fleet import Fleet
+
+# side by side view of every connected car
+from comparison import Comparison
+
+# timing lines for the lap timer
+from lap_timer import TimingLine
+
+# reference centerlines for placing the car on the track
+from track_reference import load_track_reference
+
+# speed and G force over the map
+from heatmap import Heatmap
+
+# multi-resolution tiles of the map images, built in the background
+from map_pyramid import map_pyramids
+
+# per stage timing of the ingest and drawing pipeline, and its on screen overlay
+from profiler import PROFILER, profiled
+from profiler_overlay import ProfilerOverlay
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, loop=None):
         """
         This application is designed as a sequence of widgets and layouts grouping those widgets together into larger and larger layouts
         
@@ -42,9 +78,13 @@ class MainWindow(QMainWindow):
         """
         super().__init__()
 
-        # this DataHandler __init__() without any parameters generates randomly updating data for testing
+        # this DataHandler __init__() without any parameters generates randomly updating data for testing, it is shown until a car
+        # is connected
         self.vehicle = Vehicle()
 
+        # every connected car, self.vehicle is whichever one is selected in the top bar
+        self.fleet = Fleet(loop=loop)
+
         self.setWindowTitle("Rice University 24 Hour of Lemons Telemetry Dashboard")
 
         # create a QWidget and QLayout to hold all of the sub-layouts and widgets for the application
@@ -54,10 +94,12 @@ class MainWindow(QMainWindow):
         
         # create a new top bar object, and connect the button for connecting to the connection method belonging to the mainwindow
         # object (this class)
-        self.top_bar = TopBar()
+        self.top_bar = TopBar(self.fleet)
 
         # connect to the connect_to_vehicle method
         self.top_bar.connect_button.clicked.connect(self.connect_to_vehicle)
+        self.top_bar.vehicle_select.currentTextChanged.connect(self.select_vehicle)
+        self.top_bar.compare_button.toggled.connect(self.toggle_comparison)
 
         # this is a widget designed to split up the UI into top bar and flight view
         divider = QWidget()
@@ -81,6 +123,17 @@ class MainWindow(QMainWindow):
 
         app_layout.addWidget(self.data_view)
 
+        # the comparison takes the place of the data view while the compare button is checked
+        self.comparison = Comparison()
+        self.comparison.hide()
+        app_layout.addWidget(self.comparison)
+
+        # load the timing lines and centerline of the selected track, and again whenever the track changes
+        self.track_references = {}
+        self.data_view.map_location.currentTextChanged.connect(self.apply_track_configuration)
+        self.data_view.set_start_finish.clicked.connect(self.set_start_finish_here)
+        self.apply_track_configuration()
+
         # -------------------------------------------------------------------------
         #
         # set the main app widget to have the layout defined above, and then set the central
@@ -98,21 +151,70 @@ class MainWindow(QMainWindow):
         self.update_timer = QTimer()
         self.update_timer.setInterval(10)
         self.update_timer.timeout.connect(self.update)
+
+        # F12 switches the stage profiler and its overlay on and off, Ctrl+Shift+T saves what it has recorded as a Chrome trace
+        self.profiler_overlay = ProfilerOverlay(self)
+        self.profiler_overlay.set_shown(PROFILER.enabled)
+        QShortcut(QKeySequence("F12"), self, self.toggle_profiler)
+        QShortcut(QKeySequence("Ctrl+Shift+T"), self, self.export_trace)
+
+        # the charts, images and update timer are only started once the window has been drawn, see finish_startup()
+        self.first_frame_time = None
+        self.ready_time = None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_frame_time is None:
+            self.first_frame_time = time.time()
+            # runs once this frame has finished drawing
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        """
+        The parts of startup that don't need to be on screen for the first frame: the charts (and pyqtgraph), the logo and
+        map pyramids (loaded or built on background threads), and the update timer
+        """
+        self.data_view.build_charts()
+
+        # the selected map first, then the rest so switching tracks is instant too
+        maps = [self.data_view.map_locations_dict[location][0] for location in self.data_view.map_locations_dict]
+        selected = str(self.data_view.map_location.currentText())
+        if selected in self.data_view.map_locations_dict:
+            maps.insert(0, self.data_view.map_locations_dict[selected][0])
+        # each map's tile pyramid is hashed and loaded, or built the first time, on a background thread
+        map_pyramids().build("./maps/" + filename for filename in maps)
+        self.top_bar.load_logo()
+        # lists the serial ports in the background and keeps the list current as radios are plugged in
+        self.top_bar.start_port_watcher()
+
         self.update_timer.start()
+        self.ready_time = time.time()
 
+        if os.environ.get("LEMONS_STARTUP_BENCHMARK"):
+            # startup_benchmark.py reads this line and closes the dashboard
+            print(f"STARTUP start={START_TIME:.6f} first_frame={self.first_frame_time:.6f} ready={self.ready_time:.6f}", flush=True)
+            QTimer.singleShot(0, QApplication.instance().quit)
+
+    @profiled("frame")
     def update(self):
-        # update the data_source with whatever messages have been sent since last time this method was called
-        self.vehicle.update(debug=True)
+        # update the data_source with whatever messages have been sent since last time this method was called-- connected cars are
+        # read by their own worker threads, so only the placeholder vehicle is updated here
+        if self.vehicle not in self.fleet.vehicles.values():
+            self.vehicle.update(debug=True)
 
         # call the static function for updating the top bar, since this is always visible
         UpdateInformation.updateTopBar(self.vehicle, self.top_bar)
 
+        if self.comparison.isVisible():
+            UpdateInformation.updateComparison(self.fleet, self.comparison)
+            return
+
         # call the static methods for updating the textual information in the flight view and top bar
         UpdateInformation.updateFlightView(self.vehicle, self.data_view)
 
         # call the static method defined to update the map, with the data source being the data source belonging to this instance
         # of the MainWindow object, and the target being the flight view also belonging to this MainWindow
-        UpdateInformation.updateMap(self.vehicle, self.data_view, self.data_view.map_center, self.data_view.map_zoom_factor)
+        UpdateInformation.updateMap(self.vehicle, self.data_view)
     
     def connect_to_vehicle(self):
         # -------------------------------------------------------------------------
@@ -131,12 +233,17 @@ class MainWindow(QMainWindow):
                 baud = 115200
                 print('Using USB Cable')
 
-            # create a new vehicle to replace the dummy one currently stored by the MainWindow
-            self.vehicle = Vehicle(port=str(self.top_bar.port.currentText()), baud=baud)
+            port = str(self.top_bar.port.currentText())
+            if port not in self.fleet:
+                # add the car to the fleet, the connect button stays enabled so more cars can be added-- the port is opened in the
+                # background and reopened automatically if the link drops, so this never holds up the UI
+                vehicle = self.fleet.add(port, port, baud)
+                self.configure_vehicle(vehicle)
+                self.top_bar.vehicle_select.addItem(port)
+                self.comparison.set_vehicles(self.fleet.names())
 
-            # change the state of the connection button to reflect the vehicle has been connected
-            self.top_bar.connect_button.setText("Connected")
-            self.top_bar.connect_button.setDisabled(True)
+            # selecting the car replaces the dummy vehicle (or the previously selected car) in the data view
+            self.top_bar.vehicle_select.setCurrentText(port)
 
         except Exception as error:
             print("Failed to Connect")
@@ -144,12 +251,118 @@ class MainWindow(QMainWindow):
             print(error)
 
 
+    def select_vehicle(self, name):
+        """
+        Shows the car selected in the top bar in the data view
+        """
+        if name in self.fleet:
+            self.vehicle = self.fleet[name]
+            # the alert labels were styled for the previously selected car
+            UpdateInformation.restyleAlerts(self.vehicle, self.data_view)
+
+    def toggle_comparison(self, checked):
+        self.data_view.setVisible(not checked)
+        self.comparison.setVisible(checked)
+
+    def vehicles(self):
+        """
+        Every connected car, or the placeholder vehicle if no cars are connected
+        """
+        return list(self.fleet.vehicles.values()) or [self.vehicle]
+
+    def apply_track_configuration(self):
+        """
+        Sets up every vehicle for the track selected on the map: timing lines and reference centerline
+        """
+        for vehicle in self.vehicles():
+            self.configure_vehicle(vehicle)
+
+    def configure_vehicle(self, vehicle):
+        self.apply_timing_lines(vehicle)
+        self.apply_track_reference(vehicle)
+        self.apply_heatmap(vehicle)
+
+    def apply_track_reference(self, vehicle):
+        """
+        Gives the vehicle the reference centerline of the selected track, precomputed once per track and then reused
+        """
+        location = str(self.data_view.map_location.currentText())
+        if location not in self.track_references and location in self.data_view.map_locations_dict:
+            self.track_references[location] = load_track_reference(self.data_view.map_locations_dict[location][0])
+
+        # applied by the thread reading the car, which may be using the old one
+        vehicle.configure(track_reference=self.track_references.get(location))
+
+    def apply_heatmap(self, vehicle):
+        """
+        Gives the vehicle an empty heatmap laid over the selected map, or none if the map isn't known
+        """
+        location = str(self.data_view.map_location.currentText())
+        if location not in self.data_view.map_locations_dict:
+            vehicle.configure(heatmap=None)
+            return
+        filename, top_lat, left_lon, bottom_lat, right_lon = self.data_view.map_locations_dict[location]
+        # a cell every four pixels of the un-zoomed map, around 10 m on the maps we have, about the width of a track
+        vehicle.configure(heatmap=Heatmap((top_lat, left_lon, bottom_lat, right_lon),
+                                          (self.data_view.map_dimensions[1]//4, self.data_view.map_dimensions[0]//4)))
+
+    def apply_timing_lines(self, vehicle):
+        """
+        Gives the vehicle's lap timer the start/finish and sector lines of the track selected on the map
+        """
+        lines = self.data_view.timing_lines_dict.get(str(self.data_view.map_location.currentText()), [])
+        timing_lines = [TimingLine(*line) for line in lines]
+
+        vehicle.configure(timing_lines=(timing_lines[0] if timing_lines else None, timing_lines[1:]))
+
+    def set_start_finish_here(self):
+        """
+        Drops a start/finish line across the track at the selected car's current position, keeping any sector lines, and uses it
+        for every car
+        """
+        start_finish = TimingLine.across("Start/Finish", self.vehicle.lat, self.vehicle.lon, self.vehicle.hdg)
+        for vehicle in self.vehicles():
+            vehicle.configure(timing_lines=(start_finish, None))
+        print(f"Start/finish line set at {self.vehicle.lat:.6f}, {self.vehicle.lon:.6f}")
+
+    def toggle_profiler(self):
+        self.profiler_overlay.set_shown(PROFILER.toggle())
+
+    def export_trace(self):
+        # saved with the selected car's logs, open it in chrome://tracing or ui.perfetto.dev
+        path = f"{self.vehicle.log_folder}/trace-{time.time():.0f}.json"
+        events = PROFILER.export_trace(path)
+        print(f"Saved {events} trace events to {path}")
+
+    def closeEvent(self, event):
+        # stop the ingest workers and close every port
+        self.fleet.stop()
+        self.top_bar.port_watcher.stop()
+        super().closeEvent(event)
+
+
 if __name__ == "__main__":
     app = QApplication()
     
     app.setStyleSheet(Path('app.qss').read_text())
 
-    window = MainWindow()
+    if qasync is not None:
+        import asyncio
+
+        # one event loop for Qt and asyncio, the cars' ports and sockets wake it directly when data arrives
+        loop = qasync.QEventLoop(app)
+        asyncio.set_event_loop(loop)
+
+        window = MainWindow(loop)
+        window.showMaximized()
+
+        # run until the window is closed and Qt quits
+        closed = asyncio.Event()
+        app.aboutToQuit.connect(closed.set)
+        with loop:
+            loop.run_until_complete(closed.wait())
+    else:
+        window = MainWindow()
 
-    window.showMaximized()
-    app.exec()
\ No newline at end of file
+        window.showMaximized()
+        app.exec()
\ No newline at end of file
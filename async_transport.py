@@ -0,0 +1,126 @@
+"""
+asyncio transport for Vehicle, reads each car the moment its bytes arrive
+
+On POSIX the serial port's (or subscription socket's) file descriptor is registered with loop.add_reader, so the OS wakes
+the event loop when data arrives and it goes straight to the frame parser: no polling interval to wait for and no wakeups
+while the radio is quiet. Windows COM ports can't be watched that way, so there a blocking read runs in the loop's
+default executor instead.
+
+Run under a Qt event loop bridge such as qasync (app.py uses it when it is installed), one thread serves several cars,
+the pub/sub sockets and the UI.
+"""
+import asyncio
+import time
+
+import serial
+
+
+class AsyncTransport:
+    """
+    Feeds a Vehicle from an asyncio event loop
+
+    Initiated with the Vehicle and the loop to run on. A supervising task opens the port in the loop's executor (so a slow
+    open never stalls the loop), checks the link twice a second and watches the new port whenever it is reopened.
+    """
+
+    # seconds between link checks
+    CHECK_INTERVAL = 0.5
+
+    def __init__(self, vehicle, loop=None):
+        self.vehicle = vehicle
+        self.loop = loop or asyncio.get_event_loop()
+        self.fileno = None
+        self.watching = None
+        self.reader = None
+        self.supervisor = None
+
+    def start(self):
+        self.supervisor = self.loop.create_task(self.supervise())
+
+    def stop(self):
+        self.unwatch()
+        if self.supervisor is not None:
+            self.supervisor.cancel()
+            self.supervisor = None
+
+    async def supervise(self):
+        while True:
+            if self.vehicle.link_open:
+                # only drops a quiet link, which is quick
+                self.vehicle.check_link()
+            else:
+                self.unwatch()
+                # opening a port (or connecting a socket) can take a while, so it happens off the loop
+                await self.loop.run_in_executor(None, self.vehicle.check_link)
+
+            if self.vehicle.link_open and self.watching is not self.link():
+                self.watch()
+            elif not self.vehicle.link_open:
+                self.unwatch()
+
+            self.vehicle.heartbeat_time = round((time.time() - self.vehicle.last_heartbeat)*100)/100
+            await asyncio.sleep(self.CHECK_INTERVAL)
+
+    def link(self):
+        return self.vehicle.subscription if self.vehicle.subscription is not None else self.vehicle.ser
+
+    def watch(self):
+        self.unwatch()
+        self.watching = self.link()
+
+        if self.vehicle.subscription is not None:
+            self.fileno = self.vehicle.subscription.connection.fileno()
+            self.loop.add_reader(self.fileno, self.subscription_readable)
+            return
+
+        try:
+            self.fileno = self.vehicle.ser.fileno()
+            self.loop.add_reader(self.fileno, self.serial_readable)
+            # the reader only runs when there are bytes waiting, so reads must never wait for more
+            self.vehicle.ser.timeout = 0
+        except (AttributeError, NotImplementedError, serial.SerialException):
+            # no file descriptor to watch (Windows COM ports, or a loop without add_reader)
+            self.fileno = None
+            self.reader = self.loop.create_task(self.read_in_executor(self.vehicle.ser))
+
+    def unwatch(self):
+        if self.fileno is not None:
+            self.loop.remove_reader(self.fileno)
+            self.fileno = None
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        self.watching = None
+
+    def serial_readable(self):
+        try:
+            data = self.vehicle.ser.read(self.vehicle.ser.in_waiting or 1)
+        except serial.SerialException as error:
+            # the port went away (cable pulled, radio unplugged), stop watching it and let the supervisor reopen it
+            self.vehicle.counters['read_errors'] += 1
+            print(f"Serial read error: {error}")
+            self.unwatch()
+            self.vehicle.link_failed()
+            return
+
+        if data:
+            self.vehicle.receive(data, time.time())
+
+    def subscription_readable(self):
+        self.vehicle.handle_messages(self.vehicle.subscription.receive())
+        if not self.vehicle.subscription.is_open:
+            self.unwatch()
+
+    async def read_in_executor(self, ser):
+        while ser.is_open:
+            try:
+                # blocks in a worker thread until a byte arrives or the port's timeout passes
+                data = await self.loop.run_in_executor(None, lambda: ser.read(max(ser.in_waiting, 1)))
+            except serial.SerialException as error:
+                self.vehicle.counters['read_errors'] += 1
+                print(f"Serial read error: {error}")
+                self.vehicle.link_failed()
+                return
+
+            if data:
+                self.vehicle.receive(data, time.time())
@@ -0,0 +1,221 @@
+"""
+Command line batch runner for analysing every logged session at once
+
+Runs the per-session analyses in ANALYSES over every session folder under ./logs on a process pool, caches each
+session's results next to its logs, and writes everything to one consolidated JSON file
+
+    python batch_analysis.py --logs ./logs --output batch_results.json
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from derived_channels import GRAVITY, evaluate_log
+from lap_alignment import split_laps
+
+# name of the per-session cache file written next to the csv logs
+CACHE_NAME = "analysis.json"
+# bump this when an analysis changes so old caches are recomputed
+CACHE_VERSION = 2
+
+LOG_NAMES = ("imu", "gps", "car")
+
+
+# =========================
+# ANALYSES
+# =========================
+def summary_statistics(logs, options):
+    """
+    Sample counts, duration and min/mean/max of every column of every log
+    """
+    summary = {}
+    for name, frame in logs.items():
+        if frame.empty:
+            summary[name] = {"samples": 0}
+            continue
+
+        described = frame.drop(columns="Time").agg(["min", "mean", "max"])
+        summary[name] = {
+            "samples": int(len(frame)),
+            "duration": float(frame["Time"].iloc[-1] - frame["Time"].iloc[0]),
+            "columns": {column: {stat: float(value) for stat, value in described[column].items()}
+                        for column in described.columns},
+        }
+    return summary
+
+
+def lap_table(logs, options):
+    """
+    Lap number, start time and lap time of every complete lap, split at the start/finish point
+    """
+    gps = logs["gps"]
+    if gps.empty:
+        return []
+
+    start_lat, start_lon = options["start"] if options["start"] else (gps["Lat"].iloc[0], gps["Lon"].iloc[0])
+    crossings = split_laps(gps["Time"].to_numpy(), gps["Lat"].to_numpy(), gps["Lon"].to_numpy(),
+                           start_lat, start_lon, options["gate_radius"])
+
+    lap_times = np.diff(crossings)
+    return [{"lap": i+1, "start": float(start), "time": float(lap_time)}
+            for i, (start, lap_time) in enumerate(zip(crossings[:-1], lap_times))]
+
+
+def max_g(logs, options):
+    """
+    Peak lateral (Y) and longitudinal (Z, forward on the dashboard charts) acceleration in G
+    """
+    imu = logs["imu"]
+    if imu.empty:
+        return {}
+
+    lateral = imu["Y dot"].to_numpy() / GRAVITY
+    longitudinal = imu["Z dot"].to_numpy() / GRAVITY
+    # combined G comes from the same derived channel the live dashboard shows
+    combined = evaluate_log("imu", imu)["combined_g"]
+    return {
+        "max_lateral": float(np.abs(lateral).max()),
+        "max_acceleration": float(longitudinal.max()),
+        "max_braking": float(-longitudinal.min()),
+        "max_combined": float(np.nanmax(combined)),
+    }
+
+
+# analyses run for every session, keyed by the name used in the output
+ANALYSES = {
+    "summary": summary_statistics,
+    "laps": lap_table,
+    "max_g": max_g,
+}
+
+
+# =========================
+# PER-SESSION WORK
+# =========================
+def session_folders(logs_folder):
+    """
+    Every folder under logs_folder that contains at least one of the csv logs
+    """
+    return sorted(folder for folder in Path(logs_folder).iterdir()
+                  if folder.is_dir() and any((folder / f"{name}.csv").exists() for name in LOG_NAMES))
+
+
+def cache_is_current(folder, options):
+    """
+    A session's cache is current if it was written by this version of the analyses, with the same options, after the logs
+    last changed
+    """
+    cache = folder / CACHE_NAME
+    if not cache.exists():
+        return False
+
+    newest_log = max((folder / f"{name}.csv").stat().st_mtime for name in LOG_NAMES if (folder / f"{name}.csv").exists())
+    if cache.stat().st_mtime < newest_log:
+        return False
+
+    try:
+        with open(cache) as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return False
+    # compared as they come back from JSON, where the start point's tuple is a list
+    return cached.get("version") == CACHE_VERSION and cached.get("options") == json.loads(json.dumps(options))
+
+
+def load_logs(folder):
+    logs = {}
+    for name in LOG_NAMES:
+        path = folder / f"{name}.csv"
+        logs[name] = pd.read_csv(path).sort_values("Time") if path.exists() else pd.DataFrame(columns=["Time"])
+    return logs
+
+
+def analyse_session(folder, options):
+    """
+    Runs every analysis on one session and writes the results to the session's cache file
+
+    This runs in a worker process, so everything it takes and returns has to be picklable
+    """
+    folder = Path(folder)
+    logs = load_logs(folder)
+
+    # the options are kept with the results, so changing one (the start point, the gate radius) makes the cache stale
+    results = {"version": CACHE_VERSION, "options": options, "session": folder.name}
+    for name, analysis in ANALYSES.items():
+        try:
+            results[name] = analysis(logs, options)
+        except Exception as error:
+            # one bad log shouldn't stop the rest of the season from being analysed
+            results[name] = {"error": f"{type(error).__name__}: {error}"}
+
+    # write to a temporary file first so a killed run never leaves a half written cache behind
+    temporary = folder / (CACHE_NAME + ".tmp")
+    with open(temporary, "w") as file:
+        json.dump(results, file, indent=1)
+    os.replace(temporary, folder / CACHE_NAME)
+
+    return results
+
+
+def load_cached(folder):
+    with open(Path(folder) / CACHE_NAME) as file:
+        return json.load(file)
+
+
+# =========================
+# BATCH RUNNER
+# =========================
+def run_batch(logs_folder, output, workers=None, force=False, options=None):
+    """
+    Analyses every session under logs_folder, skipping sessions with a current cache unless force is set, and writes
+    the consolidated results to output
+    """
+    options = options or {"start": None, "gate_radius": 15.0}
+
+    folders = session_folders(logs_folder)
+    stale = [folder for folder in folders if force or not cache_is_current(folder, options)]
+    print(f"{len(folders)} sessions found, {len(folders)-len(stale)} up to date, {len(stale)} to analyse")
+
+    results = {folder.name: load_cached(folder) for folder in folders if folder not in stale}
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(analyse_session, str(folder), options): folder for folder in stale}
+            for future in as_completed(futures):
+                folder = futures[future]
+                try:
+                    results[folder.name] = future.result()
+                    print(f"  > Analysed {folder.name}")
+                except Exception as error:
+                    print(f"  > Failed to analyse {folder.name}: {error}")
+
+    with open(output, "w") as file:
+        json.dump({name: results[name] for name in sorted(results)}, file, indent=1)
+    print(f"Wrote results for {len(results)} sessions to {output}")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the batch analyses over every logged session")
+    parser.add_argument("--logs", default="./logs", help="folder containing one folder per session")
+    parser.add_argument("--output", default="batch_results.json", help="consolidated results file")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per core)")
+    parser.add_argument("--force", action="store_true", help="reanalyse sessions even if their cache is current")
+    parser.add_argument("--start", type=float, nargs=2, metavar=("LAT", "LON"), default=None,
+                        help="start/finish point for splitting laps (default: first GPS fix of each session)")
+    parser.add_argument("--gate-radius", type=float, default=15.0, help="start/finish gate radius in meters")
+    args = parser.parse_args()
+
+    if not Path(args.logs).is_dir():
+        print(f"Log folder {args.logs} does not exist")
+        sys.exit(1)
+
+    run_batch(args.logs, args.output, args.workers, args.force,
+              {"start": args.start, "gate_radius": args.gate_radius})
@@ -0,0 +1,76 @@
+from PySide6.QtWidgets import (
+    QLabel,
+    QWidget,
+    QGridLayout,
+    QVBoxLayout,
+)
+
+# rows of the comparison, as (label, key the UpdateInformation.updateComparison method fills in)
+COMPARISON_ROWS = [
+    ("Speed (mph)", "speed"),
+    ("Engine RPM", "rpm"),
+    ("Combined G", "combined_g"),
+    ("Lap", "lap"),
+    ("Current Lap", "current_lap"),
+    ("Last Lap", "last_lap"),
+    ("Best Lap", "best_lap"),
+    ("Delta", "delta"),
+    ("Track Position", "track_position"),
+    ("Coolant Temperature", "coolant_temperature"),
+    ("Oil Pressure", "oil_pressure"),
+    ("Fuel Gauge", "fuel_gauge"),
+    ("Battery Voltage", "battery_voltage"),
+    ("Heartbeat Time", "heartbeat"),
+    ("Frames Received", "frames"),
+]
+
+
+class Comparison(QWidget):
+    """
+    Side by side view of every connected car, one column per car
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        layout = QVBoxLayout()
+        self.grid = QGridLayout()
+        layout.addLayout(self.grid)
+        layout.addStretch()
+        self.setLayout(layout)
+
+        # row labels down the left hand side
+        for row, (label, key) in enumerate(COMPARISON_ROWS):
+            self.grid.addWidget(QLabel(label), row+1, 0)
+
+        self.names = []
+        # value labels for each car, keyed by car name and then by row key
+        self.values = {}
+
+    def set_vehicles(self, names):
+        """
+        Rebuilds the columns when cars are connected or disconnected
+        """
+        if list(names) == self.names:
+            return
+
+        for labels in self.values.values():
+            for label in labels.values():
+                self.grid.removeWidget(label)
+                label.deleteLater()
+        self.values = {}
+        self.names = list(names)
+
+        for column, name in enumerate(self.names):
+            header = QLabel(name)
+            header.setObjectName("car_data")
+            self.grid.addWidget(header, 0, column+1)
+            labels = {"header": header}
+
+            for row, (label, key) in enumerate(COMPARISON_ROWS):
+                value = QLabel("--")
+                value.setObjectName("car_data")
+                self.grid.addWidget(value, row+1, column+1)
+                labels[key] = value
+
+            self.values[name] = labels
@@ -1,19 +1,56 @@
-# import the serial library for using the radio
-import serial
-from serial.tools import list_ports
+# the serial library for using the radio is imported where a port is opened, read and closed: the dashboard starts
+# without it and a subscription never needs it
 # import the sys library for accessing command-line arguments
 import sys
 # import time for delays
 import time
+# the dashboard's configuration changes are handed to whichever thread reads the car
+import threading
 # used for logging information
 import csv
 from pathlib import Path
 
-# rolling list of length 240 items for GPS location tracking
-from collections import deque
+# the layout of every message, for decoding them, logging them and naming their channels
+from message_schema import SCHEMA
 
-# for unpacking bytes to floats
-import struct
+# incremental lap and sector timing from the GPS fixes
+from lap_timer import LapTimer
+
+# threshold alerts on the decoded channels
+from alerts import AlertEngine
+
+# fuses the IMU and GPS into position, heading and speed at the IMU rate
+from fusion import FusionFilter
+
+# the whole session's track, for the map
+from track_store import TrackStore
+
+# subscribing to another process's connection instead of opening a serial port
+from telemetry_server import Subscription, is_subscription
+
+# splits the radio's byte stream into frames
+from frame_parser import FrameParser, check_frame
+
+# per stage timing, does nothing unless profiling has been switched on
+from profiler import PROFILER
+
+# derived channels, computed in batches from the raw decoded values
+import numpy as np
+from derived_channels import GRAVITY, LOG_CHANNELS, default_registry
+
+# raw channels of each message that feed the derived channels, in the order they are stored
+RAW_CHANNELS = SCHEMA.raw_channels()
+
+# the car sends a heartbeat every second, so this long without one means the link is gone
+HEARTBEAT_TIMEOUT = 3.0
+# wait before each reconnection attempt, doubling after every failed attempt up to the maximum
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+# frames read together are spread back over at most this long before the read, see spread_times()
+MAX_SPREAD = 1.0
+
+# names of the message IDs, used for the per-message counters
+MESSAGE_NAMES = SCHEMA.names()
 
 def sublist(main_list, sublist):
     # Convert to string representation
@@ -27,23 +64,44 @@ class Vehicle:
     """
     Class which handles the link to the microcontroller transmitting data from the vehicle
 
-    Initiated with the port and baud rate the radio is connected to
+    Initiated with the port and baud rate the radio is connected to, verbose prints a line for every frame received
+
+    The port can also be the address of a telemetry_server (tcp://host:port or unix:///path), in which case the frames
+    come from the process holding the radio and the baud rate is ignored
+
+    If the port fails or the heartbeat stops, the port is reopened automatically (see check_link) into the same session,
+    so the logs, history and lap timing carry on as if nothing happened. With connect set to False the port is only
+    opened by the first update(), so it can be opened on a background thread.
     """
 
-    def __init__(self, port=None, baud=None):
+    def __init__(self, port=None, baud=None, verbose=True, read_timeout=0.5, connect=True):
 
         # serial port variables
         self.port = port
         self.baud = baud
+        self.ser = None
+        self.subscription = None
+        # longest a blocking update waits for data
+        self.read_timeout = read_timeout
+        self.verbose = verbose
 
-        self.initialized = False if self.port == None else True
+        # state of the link for reconnecting: when it was last opened, and when and how soon to try again
+        self.link_opened = None
+        self.next_reconnect = 0.0
+        self.reconnect_delay = RECONNECT_MIN_DELAY
 
-        if self.initialized:
-            self.initialize_port()
+        # called with (time, frame) for every frame that passes the checksum, used to publish frames to subscribers
+        self.frame_callbacks = []
+
+        # running totals of what has come over the link, for monitoring a long recording
+        self.counters = {'bytes': 0, 'frames': 0, 'checksum_failures': 0, 'discarded_bytes': 0, 'read_errors': 0,
+                         'reconnects': 0}
+        self.counters.update({name: 0 for name in MESSAGE_NAMES.values()})
+
+        self.initialized = False if self.port == None else True
 
-        self.rx_buffer = bytearray()
-        self.packet_start_time = None
-        self.PACKET_TIMEOUT = 0.5  # seconds
+        # adds its checksum failures and skipped bytes to the counters
+        self.parser = FrameParser(self.counters)
 
         current_time = time.time()
         self.log_folder = f"./logs/{current_time}"
@@ -51,130 +109,224 @@ class Vehicle:
         # Create a folder to hold the log files for this particular vehicle class
         Path(self.log_folder).mkdir(parents=True, exist_ok=True)
 
-        with open(self.log_folder +"/imu.csv", 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Time','X dot','Y dot','Z dot','Omega X', 'Omega Y', 'Omega Z', 'Temperature'])
-        with open(self.log_folder +"/gps.csv", 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Time','Lat','Lon','Heading','Altitude', 'Speed', 'Satellites', 'HDOP'])
-        with open(self.log_folder +"/car.csv", 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Time','Engine RPM','Coolant Temperature','Battery Voltage','Fuel Gauge', 'Oil Pressure'])
+        # one log per message in messages.csv with logged fields, rows are written a batch at a time by evaluate_derived
+        for group, columns in LOG_CHANNELS.items():
+            with open(f"{self.log_folder}/{group}.csv", 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(list(columns))
+
+        # alert rules from the configuration file, with state changes logged alongside the rest of the session
+        self.alerts = AlertEngine.from_file("./alerts.csv", log_path=self.log_folder + "/alerts.csv")
 
         # vehicle data variables
-        
-        # Interrupt driven values
-        # self.mph = 0.0
-        self.rpm = 0.0
-        # ADC specific values
-        self.car_time = current_time
-        self.coolant_temperature = 0.0
-        self.battery_voltage = 0.0
-        self.fuel_gauge = 0.0
-        self.oil_pressure = 0.0
-
-        # IMU data variables
-        self.imu_time = current_time
-        self.accel = [0.0,0.0,0.0]
-        self.gyro = [0.0,0.0,0.0]
-        self.magnetometer = [0.0,0.0,0.0]
-
-        # GPS related variables
-        self.gps_time = current_time
-        self.hdg = 0.0
-        self.lat = 0.0
-        self.lon = 0.0
-        self.hdop = 100
-        self.gps_speed = 0.0
-        self.gps_altitude = 0.0
-        self.num_satellites = 0
 
-        self.last_heartbeat = current_time
-        self.heartbeat_time = 0
-        self.electronics_temperature = 0.0
+        # every field of every message in messages.csv, and the time its message last arrived
+        for message in SCHEMA.messages.values():
+            if message.names:
+                setattr(self, message.time_channel, current_time)
+        for field in SCHEMA.fields():
+            setattr(self, field.name, 0 if field.type.startswith(('uint', 'int')) else 0.0)
+
+        # until their first message, the GPS has no fix and the steering is centred
+        self.hdop = 100
+        self.steering_raw = 2048
 
-        # Driver Input Sensors
-        self.driver_time = current_time
+        # derived from the fields, see derived_channels.py
+        self.rpm = 0.0
         self.steering_angle = 0.0
-        self.pit_entry = 0.0
-        # self.brake = 0.0
 
-        self.location_history = deque(maxlen=60)
+        self.last_heartbeat = current_time
+        self.heartbeat_time = 0
+        # time of the last batch of frames handled, the earliest the next batch's frames can have arrived
+        self.last_received = None
+
+        # derived channels (RPM, steering, combined G, rates), evaluated once per batch of samples in update()
+        self.derived = default_registry()
+        self.pending_samples = {group: [] for group in RAW_CHANNELS}
+        self.combined_g = 0.0
+        self.steering_rate = 0.0
+        self.fuel_rate = 0.0
+
+        # every GPS fix of the session, simplified for drawing at any zoom
+        self.track = TrackStore()
+        # speed and G force accumulated over the selected map, set by the dashboard (see heatmap.py)
+        self.heatmap = None
+
+        # GPS/IMU fusion, predicted with every IMU frame and corrected with every GPS fix
+        self.fusion = FusionFilter()
+        self.fused_lat = self.lat
+        self.fused_lon = self.lon
+        self.fused_speed = 0.0
+        self.fused_heading = 0.0
+
+        # lap timer, the start/finish and sector lines are set by the dashboard for the selected track
+        self.lap_timer = LapTimer()
+
+        # reference centerline of the selected track, gives each fix a distance along the track and a lap fraction
+        self.track_reference = None
+        self.track_distance = None
+        self.lap_fraction = None
+
+        # track configuration from the dashboard, waiting to be applied by the thread reading the car (see configure)
+        self.pending_configuration = {}
+        self.configuration_lock = threading.Lock()
+
+        # opened last, so the link state starts out consistent with the heartbeat time above
+        if self.initialized and connect:
+            self.initialize_port()
 
         if self.initialized == False:
-            self.location_history.append([29.715,-95.40])
-            self.location_history.append([29.715,-95.405])
-            self.location_history.append([29.717,-95.407])
-            self.location_history.append([29.718,-95.407])
-            self.location_history.append([29.721,-95.405])
+            self.track.append(0.0, 29.715,-95.40)
+            self.track.append(1.0, 29.715,-95.405)
+            self.track.append(2.0, 29.717,-95.407)
+            self.track.append(3.0, 29.718,-95.407)
+            self.track.append(4.0, 29.721,-95.405)
 
 
     def initialize_port(self):
-        try:
-            self.ser = serial.Serial(self.port, self.baud, timeout=1)
-            print(f'Connected to serial port {self.ser.name} at {self.ser.baudrate} baud')
+        """
+        Opens the port (or subscribes), returns True if it worked
+
+        There is no waiting for the port to settle: the parser resyncs on the start byte, and the link counts as up once
+        the first heartbeat arrives (see link_status)
+        """
+        # a partial frame from before a reconnect would only be garbage
+        self.parser.reset()
+
+        if is_subscription(self.port):
+            try:
+                self.subscription = Subscription(self.port)
+                print(f'Subscribed to telemetry from {self.port}')
+            except (OSError, ValueError) as e:
+                print(f'Error subscribing to {self.port}: {e}')
+                return False
+        else:
+            import serial
 
-            # wait to ensure serial port fully initializes
-            time.sleep(2)
+            try:
+                self.ser = serial.Serial(self.port, self.baud, timeout=self.read_timeout)
+                print(f'Connected to serial port {self.ser.name} at {self.ser.baudrate} baud')
+            except (serial.SerialException, ValueError) as e:
+                print(f'Error connecting to serial port: {e}')
+                return False
 
-        except serial.SerialException as e:
-            print(f'Error connecting to serial port: {e}')
+        self.link_opened = time.time()
+        return True
+
+    @property
+    def link_open(self):
+        if self.subscription is not None:
+            return self.subscription.is_open
+        return self.ser is not None and self.ser.is_open
+
+    @property
+    def link_status(self):
+        if not self.initialized:
+            return "no port"
+        if not self.link_open:
+            return "reconnecting"
+        if self.last_heartbeat < self.link_opened:
+            return "waiting for data"
+        return "connected"
+
+    def close_link(self):
+        """
+        Closes the port or subscription, keeping everything else (session, logs, history, timing) for when it reopens
+        """
+        if self.ser is not None:
+            import serial
+
+            try:
+                self.ser.close()
+            except serial.SerialException:
+                pass
+            self.ser = None
+        if self.subscription is not None:
+            self.subscription.close()
+            self.subscription = None
+
+    def link_failed(self):
+        """
+        Closes the link and schedules the next attempt to reopen it, backing off while the attempts keep failing
+        """
+        self.close_link()
+        self.next_reconnect = time.time() + self.reconnect_delay
+        self.reconnect_delay = min(self.reconnect_delay*2, RECONNECT_MAX_DELAY)
+
+    def check_link(self):
+        """
+        Reopens the link once it is due after a failure, and drops a serial link that has stopped sending heartbeats
+
+        A subscription is only reopened when its socket closes-- no heartbeat over a subscription means the radio link of
+        the process publishing it is down, which reconnecting to that process won't fix
+        """
+        if not self.initialized:
+            return
+
+        now = time.time()
+        if self.link_open:
+            if self.ser is not None and now - max(self.last_heartbeat, self.link_opened) > HEARTBEAT_TIMEOUT:
+                print(f"No heartbeat for {HEARTBEAT_TIMEOUT:.0f} s, reopening {self.port}")
+                self.link_failed()
+            return
+
+        if now < self.next_reconnect:
+            return
+
+        was_opened = self.link_opened is not None
+        if self.initialize_port():
+            if was_opened:
+                self.counters['reconnects'] += 1
+        else:
+            self.link_failed()
+
+    def process_serial_data(self, block=False):
+        """
+        Reads the bytes waiting on the serial port and returns the complete messages in the buffer
 
-    def process_serial_data(self):
-        messages_found = []
+        With block set and nothing waiting, this sleeps in the serial read until a byte arrives (or the port's timeout
+        passes) instead of returning straight away, so a loop around it doesn't spin the CPU
+        """
+        # already imported by initialize_port, so this is only a lookup
+        import serial
 
         try:
             waiting = self.ser.in_waiting
             if waiting > 0:
-                new_bytes = self.ser.read(waiting)
-                self.rx_buffer.extend(new_bytes)
+                with PROFILER.stage("serial read"):
+                    new_bytes = self.ser.read(waiting)
+            elif block:
+                # the time spent waiting for a byte isn't work, so only the read of the rest is timed
+                new_bytes = self.ser.read(1)
+                if new_bytes and self.ser.in_waiting:
+                    with PROFILER.stage("serial read"):
+                        new_bytes += self.ser.read(self.ser.in_waiting)
+            else:
+                new_bytes = b''
 
         except serial.SerialException as e:
+            self.counters['read_errors'] += 1
             print(f"Serial read error: {e}")
+            # the port has gone away (radio unplugged), reopen it once it comes back
+            self.link_failed()
             return []
         except Exception as e:
+            self.counters['read_errors'] += 1
             print(f"Error: {e}")
             return []
 
-        while True:
-            start_index = self.rx_buffer.find(0xFE)
-
-            if start_index == -1:
-                self.packet_start_time = None
-                break
-
-            # Discard garbage before start byte
-            if start_index > 0:
-                self.rx_buffer = self.rx_buffer[start_index:]
-
-            # Start timeout tracking
-            if self.packet_start_time is None:
-                self.packet_start_time = time.monotonic()
-
-            # Timeout check
-            if time.monotonic() - self.packet_start_time > self.PACKET_TIMEOUT:
-                print("Packet timeout — discarding partial data")
-                self.rx_buffer = self.rx_buffer[1:]  # drop start byte
-                self.packet_start_time = None
-                continue
-
-            if len(self.rx_buffer) < 2:
-                break
+        return self.feed(new_bytes)
 
-            payload_len = self.rx_buffer[1]
-            total_message_len = payload_len
+    def feed(self, data):
+        """
+        Hands received bytes to the frame parser (see frame_parser.py) and returns the complete messages they finish
 
-            if len(self.rx_buffer) < total_message_len:
-                break
-
-            # Full packet received
-            message = bytes(self.rx_buffer[:total_message_len])
-            messages_found.append(message)
-
-            self.rx_buffer = self.rx_buffer[total_message_len:]
-            self.packet_start_time = None  # reset after success
-
-        return messages_found
+        The parser is kept apart from reading, so any transport (polled, blocking or event driven) can hand it whatever bytes it
+        has as soon as it has them
+        """
+        self.counters['bytes'] += len(data)
+        with PROFILER.stage("parse"):
+            return self.parser.feed(data)
 
     # def process_serial_data(self):
     #     """
@@ -248,132 +400,223 @@ class Vehicle:
         
     #     return messages_found
 
-    def process_message(self, msg):
-        # First, the checksum
-        if (msg[-2] != 0xAB or msg[-1] != 0xCD):
+    def process_message(self, msg, received=None):
+        # frames from a subscription carry the time the publishing process received them
+        now = time.time() if received is None else received
+
+        # First, the checksum-- frames from the parser have already passed it, but frames from a subscription haven't been
+        # through this process's parser
+        if not check_frame(msg):
             print(f"Checksum failed, message: {msg}")
+            self.counters['checksum_failures'] += 1
             return False
-        
-
-        if msg[2] == 0x01:
-            # We have a new heartbeat message
-            self.last_heartbeat = time.time()
-            print('Heartbeat Received')
-        elif msg[2] == 0x02:
-            self.gps_time = time.time()
-            # GPS Data
-            print('GPS Data Received')
-            self.lat = struct.unpack('<d', bytes(msg[3:11]))[0]
-            self.lon = struct.unpack('<d', bytes(msg[11:19]))[0]
-            self.gps_speed = struct.unpack('<d', bytes(msg[19:27]))[0]
-            self.hdg = struct.unpack('<d', bytes(msg[27:35]))[0]
-            self.gps_altitude = struct.unpack('<d', bytes(msg[35:43]))[0]
-            self.num_satellites = int.from_bytes(bytes(msg[43:47]), 'little') # uint32_t is little endian on ESP32
-            self.hdop = struct.unpack('<d', bytes(msg[47:55]))[0]
-
-            with open(self.log_folder +"/gps.csv", 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([self.gps_time,
-                                  self.lat,
-                                  self.lon,
-                                  self.hdg,
-                                  self.gps_altitude,
-                                  self.gps_speed,
-                                  self.num_satellites,
-                                  self.hdop])
-                
-            self.location_history.append([self.lat,self.lon]) # O(1) time complexity for adding new items and removing old ones
-
-        elif msg[2] == 0x03:
-            print('IMU Data Received')
-            # IMU Data
-            self.imu_time = time.time()
-
-            # Temperature bytes (float)
-            self.electronics_temperature = struct.unpack('<f', bytes(msg[3:7]))[0]
-
-            # Acceleration bytes (three floats)
-            self.accel = [struct.unpack('<f', bytes(msg[7:11]))[0],
-                            struct.unpack('<f', bytes(msg[11:15]))[0],
-                            struct.unpack('<f', bytes(msg[15:19]))[0]]
-            
-            # Gyroscope bytes (three floats)
-            self.gyro = [struct.unpack('<f', bytes(msg[19:23]))[0],
-                            struct.unpack('<f', bytes(msg[23:27]))[0],
-                            struct.unpack('<f', bytes(msg[27:31]))[0]]
-            
-            with open(self.log_folder +"/imu.csv", 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([self.imu_time,
-                                  self.accel[0],
-                                  self.accel[1],
-                                  self.accel[2],
-                                  self.gyro[0],
-                                  self.gyro[1],
-                                  self.gyro[2],
-                                  self.electronics_temperature])
-        
-        elif msg[2] == 0x04:
-            print('Pressure Data Received')
-            # Pressure Data
-
-            # # Temperature bytes (float)
-            # self.dps310_temperature = struct.unpack('<f', bytes(msg[3:7]))[0]
-            # # Pressure bytes (float)
-            # self.ambient_pressure = struct.unpack('<f', bytes(msg[7:11]))[0]
-        elif msg[2] == 0x05:
-            print('Car Data Received')
-
-            self.battery_voltage = int.from_bytes(bytes(msg[3:5]), 'little')
-            self.fuel_gauge = int.from_bytes(bytes(msg[5:7]), 'little')
-            self.oil_pressure = int.from_bytes(bytes(msg[7:9]), 'little')
-            self.coolant_temperature = int.from_bytes(bytes(msg[9:11]), 'little')
-
-            self.rpm = 60000000/struct.unpack('<f', bytes(msg[11:15]))[0] # data arrives as period measured in us
-            # self.mph = struct.unpack('<f', bytes(msg[15:19]))[0]/1000000 * 1.12 # convert to pulses per second, then scale from 2/(m/s) to get mph
-
-            self.car_time = time.time()
-
-            with open(self.log_folder +"/car.csv", 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([self.car_time,
-                                 self.rpm,
-                                 self.coolant_temperature,
-                                 self.battery_voltage,
-                                 self.fuel_gauge,
-                                 self.oil_pressure])
-        elif msg[2] == 0x06:
-            print('Driver Input Data Received')
-
-            self.steering_angle = int.from_bytes(bytes(msg[3:5]), 'little') - 2048
-            self.pit_entry = int.from_bytes(bytes(msg[5:7]), 'little')
-            # self.brake = int.from_bytes(bytes(msg[7:9]), 'little')
 
-            self.driver_time = time.time()
+        self.counters['frames'] += 1
+        message = SCHEMA.messages.get(msg[2])
+        if message is None:
+            return True
+        self.counters[message.name] += 1
+        if self.verbose:
+            print(f'{message.name} message received')
+
+        if message.names:
+            # one precompiled struct per message (see messages.csv) decodes the whole payload, into the attributes named
+            # after its channels
+            values = message.decode(msg)
+            self.__dict__.update(zip(message.names, values))
+            setattr(self, message.time_channel, now)
+            # logged once the derived channels have been evaluated for this batch
+            self.pending_samples[message.name].append((now, *values))
+
+        if message.name == 'heartbeat':
+            self.last_heartbeat = now
+            # the link is healthy again, so the next failure retries quickly
+            self.reconnect_delay = RECONNECT_MIN_DELAY
+        elif message.name == 'gps':
+            self.track.append(self.gps_time, self.lat, self.lon) # amortized O(1), the simplification runs once every CHUNK fixes
+
+            self.fusion.correct(self.gps_time, self.lat, self.lon, self.gps_speed, self.hdg)
+            self.update_fused_position()
+
+            # nearest segment lookup through the reference line's grid buckets, None when off the track
+            if self.track_reference is not None:
+                position = self.track_reference.locate(self.fused_lat, self.fused_lon)
+                self.track_distance, self.lap_fraction = position if position is not None else (None, None)
+        elif message.name == 'imu':
+            # Z is forward and X points up, so the yaw rate is gyro X
+            self.fusion.predict(self.imu_time, self.accel_z, self.gyro_x)
+            self.update_fused_position()
 
-
-
-            
         return True
 
-    def update(self, debug=False):
+    def update_fused_position(self):
+        """
+        Copies the fusion filter's state to the vehicle and feeds the fused position to the lap timer
+
+        The lap timer sees a position every IMU frame instead of every GPS fix, so line crossings are interpolated over
+        ~10 ms instead of a whole second between fixes
+        """
+        if not self.fusion.initialized:
+            return
+        self.fused_lat = self.fusion.lat
+        self.fused_lon = self.fusion.lon
+        self.fused_speed = self.fusion.speed_mph
+        self.fused_heading = self.fusion.heading_deg
+
+        # constant work per position, only the segment from the previous position is tested against the timing lines
+        self.lap_timer.add_fix(self.fusion.time, self.fused_lat, self.fused_lon)
+
+        # also constant work, one grid cell per channel, in the order of HEATMAP_CHANNELS
+        if self.heatmap is not None:
+            self.heatmap.add(self.fused_lat, self.fused_lon, (self.fused_speed, abs(self.accel_y)/GRAVITY,
+                                                                   self.accel_z/GRAVITY))
+
+    def evaluate_derived(self):
+        """
+        Evaluates the derived channels over every sample decoded since the last call, one NumPy batch per message group
+
+        Each derived channel is computed once per batch, the latest values are stored as attributes for the UI, and the
+        alert rules see every sample of the channels they watch, raw or derived
+        """
+        for group, rows in self.pending_samples.items():
+            if not rows:
+                continue
+            self.pending_samples[group] = []
+
+            batch = dict(zip(RAW_CHANNELS[group], np.array(rows, dtype=np.float64).T))
+            results = self.derived.evaluate(batch)
+
+            for name in self.derived.derived_names(batch):
+                if name in results:
+                    setattr(self, name, float(results[name][-1]))
+
+            columns = LOG_CHANNELS.get(group)
+            if columns:
+                with PROFILER.stage("csv write"), open(f"{self.log_folder}/{group}.csv", 'a', newline='') as file:
+                    writer = csv.writer(file)
+                    writer.writerows(zip(*(results[channel] for channel in columns.values())))
+
+            # only the channels alert rules watch are passed on, sample by sample, and a group none of them are on skips
+            # the per sample loop entirely
+            watched = [(name, values) for name, values in results.items() if name in self.alerts.rules_by_channel]
+            if watched:
+                times = results[RAW_CHANNELS[group][0]]
+                for i in range(len(rows)):
+                    self.alerts.update(times[i], {name: values[i] for name, values in watched})
+
+    def configure(self, **settings):
+        """
+        Changes the track configuration from any thread, applied by the thread reading the car at the start of its next
+        update, so nothing is swapped out while a fix is being processed. Later settings replace earlier ones not yet
+        applied
+
+        timing_lines is (start/finish line, sector lines), with the sectors None to keep the current ones, track_reference
+        is the selected track's centerline, and heatmap the empty heatmap for the selected map
+        """
+        with self.configuration_lock:
+            if settings.get('timing_lines', (None, ()))[1] is None and 'timing_lines' in self.pending_configuration:
+                settings['timing_lines'] = (settings['timing_lines'][0], self.pending_configuration['timing_lines'][1])
+            self.pending_configuration.update(settings)
+
+    def apply_configuration(self):
+        # checked without the lock first, as there is almost never anything waiting
+        if not self.pending_configuration:
+            return
+        with self.configuration_lock:
+            settings, self.pending_configuration = self.pending_configuration, {}
+
+        if 'timing_lines' in settings:
+            start_finish, sectors = settings['timing_lines']
+            self.lap_timer.set_lines(start_finish, self.lap_timer.sectors if sectors is None else sectors)
+        if 'track_reference' in settings:
+            self.track_reference = settings['track_reference']
+            self.track_distance = None
+            self.lap_fraction = None
+        if 'heatmap' in settings:
+            self.heatmap = settings['heatmap']
+
+    def update(self, debug=False, block=False):
+        self.apply_configuration()
+
         # get tenth of a second precision on heartbeat times
         self.heartbeat_time = round((time.time() - self.last_heartbeat)*100)/100
         # print(f"Heartbeat Time: {self.heartbeat_time}; Time: {time.time()}")
 
         if self.initialized:
+            # reopen the port if it has failed or gone quiet
+            self.check_link()
+
             # loop through all of the data which is in the receive buffer
-            # Process serial data and get any new messages
-            new_messages = self.process_serial_data()
-            
-            if new_messages:
-                for msg in new_messages:
-                    # Process each message
-                    print(f"  > Processing message: {msg.hex()}")
-                    self.process_message(msg)
+            # Process serial data and get any new messages, stamped with the time they were read
+            if self.subscription is not None:
+                new_messages = self.subscription.receive(self.read_timeout if block else 0)
+            elif self.ser is not None:
+                new_messages = self.process_serial_data(block)
+                received = time.time()
+                new_messages = [(received, msg) for msg in new_messages]
+            else:
+                new_messages = []
+                if block:
+                    # nothing to block on until the port is reopened
+                    time.sleep(min(self.read_timeout, max(self.next_reconnect - time.time(), 0.01)))
+
+            self.handle_messages(new_messages)
         else:
             return None
 
+    def receive(self, data, received=None):
+        """
+        Parses and processes bytes handed over by a transport (see async_transport.py) as soon as they arrive
+        """
+        self.apply_configuration()
+        received = time.time() if received is None else received
+        self.handle_messages([(received, msg) for msg in self.feed(data)])
+
+    def handle_messages(self, messages):
+        """
+        Processes a list of (time received, message), then evaluates the derived channels over all of them in one batch
+        """
+        if not messages:
+            return
+
+        for received, msg in self.spread_times(messages):
+            # Process each message
+            if self.verbose:
+                print(f"  > Processing message: {msg.hex()}")
+            # the decode stage includes the csv write stages inside it
+            with PROFILER.stage("decode"):
+                decoded = self.process_message(msg, received)
+            if decoded:
+                for callback in self.frame_callbacks:
+                    callback(received, msg)
+
+        # derived channels for everything that arrived this update, in one batch
+        with PROFILER.stage("derived"):
+            self.evaluate_derived()
+
+    def spread_times(self, messages):
+        """
+        Frames read together all carry the time of the read, which would give the fusion filter no time between the IMU
+        frames of a batch. Gives each frame of a run with the same time its own, spread evenly between the previous read
+        (at most MAX_SPREAD before) and the read, in the order they arrived, the last frame keeping the time of the read
+        """
+        spread = []
+        start = 0
+        while start < len(messages):
+            received = messages[start][0]
+            end = start + 1
+            while end < len(messages) and messages[end][0] == received:
+                end += 1
+
+            previous = received - MAX_SPREAD if self.last_received is None else max(self.last_received, received - MAX_SPREAD)
+            step = max(received - previous, 0.0)/(end - start)
+            for i in range(start, end):
+                spread.append((received - step*(end - 1 - i), messages[i][1]))
+
+            self.last_received = received
+            start = end
+        return spread
+
     def send_data(self, message):
         # send data through the serial port
         self.ser.write(message)
@@ -384,14 +627,15 @@ class Vehicle:
         return None
 
     def close_port(self):
-        # close the serial port to release it back to the computer
+        # close the serial port to release it back to the computer, and stop reconnecting to it
         if self.ser and self.ser.is_open:
-            self.ser.close()
-
             print("Vehicle serial port closed")
+        self.close_link()
+        self.initialized = False
 
-# if this script is called directly, initiate a text-based interface for debugging
+# if this script is called directly, initiate a text-based interface for debugging (recorder.py is the headless recorder)
 if __name__ == "__main__":
+    from serial.tools import list_ports
 
     if len(sys.argv) == 3:
         # basically, when calling the file, the user can specify the port and baud rate as command line arguments
@@ -418,7 +662,7 @@ if __name__ == "__main__":
     try:
         print("Reading data from serial port:")
         while True:
-            vehicle.update(debug=True)
+            vehicle.update(debug=True, block=True)
 
     # make sure to relinquish control over the serial port
     except KeyboardInterrupt:
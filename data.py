@@ -14,8 +14,9 @@ from PySide6.QtWidgets import (
     QPushButton,
 )
 
-from rolling_chart import StreamingLineChart
-from rolling_chart_one_item import StreamingLineChartOneItem
+from heatmap import HEATMAP_CHANNELS
+from message_schema import SCHEMA
+from map_view import MapView
 
 class Data(QWidget):
     def __init__(self):
@@ -41,42 +42,51 @@ class Data(QWidget):
         car_info_layout = QGridLayout()
         car_info_layout.setSpacing(3)
 
-        # since these need to be reference later, along with all of the labels above containing dynamic information, these need
-        # to be fields of the object, initialized with self.<name>
-        # self.mph = QLabel("-- mph")
-        self.pit_entry = QLabel("--")
-        self.coolant_temperature = QLabel("--")
-        self.battery_voltage = QLabel("-- volts")
-        self.fuel_gauge = QLabel("--")
-        self.oil_pressure = QLabel("--")
-        
-        # this object name is purely to set the minimum length of the heading label, to prevent the
-        # items moving around when the numbers change
-        # self.mph.setObjectName("car_data")
-        self.pit_entry.setObjectName("car_data")
-        self.coolant_temperature.setObjectName("car_data")
-        self.battery_voltage.setObjectName("car_data")
-        self.fuel_gauge.setObjectName("car_data")
-        self.oil_pressure.setObjectName("car_data")
-
-        # create labels as an array to efficiently add them to the QGridLayout
-        labels = [QLabel("Pit Entry Switch: "), QLabel("Coolant Temperature: "),
-                  QLabel("Battery Voltage: "), QLabel("Fuel Gauge: "), QLabel("Oil Pressure: ")]
-        # iterate through the labels, setting the object name as 'small' and then adding to the appropriate row
+        # the labels of the message fields shown here come from messages.csv, and are fields of the object named after their
+        # channels, so they can be referenced later (the "car_data" object name sets their minimum width, to prevent the
+        # items moving around when the numbers change)
+        self.add_fields(car_info_layout, "car", "car_data")
+
+        # add the "car_info_layout" QFormLayout to the information layout
+        information_layout.addLayout(car_info_layout)
+
+        # -------------------------------------------------------------------------
+        #
+        # Lap timing information
+        #
+        # -------------------------------------------------------------------------
+        lap_timing_layout = QGridLayout()
+        lap_timing_layout.setSpacing(3)
+
+        self.current_lap = QLabel("--")
+        self.last_lap = QLabel("--")
+        self.best_lap = QLabel("--")
+        self.lap_delta = QLabel("--")
+        self.sector_splits = QLabel("--")
+
+        self.current_lap.setObjectName("car_data")
+        self.last_lap.setObjectName("car_data")
+        self.best_lap.setObjectName("car_data")
+        self.lap_delta.setObjectName("car_data")
+        self.sector_splits.setObjectName("small")
+
+        labels = [QLabel("Current Lap: "), QLabel("Last Lap: "), QLabel("Best Lap: "), QLabel("Delta: "), QLabel("Sectors: ")]
         for i, label in enumerate(labels):
             label.setObjectName("small")
-            car_info_layout.addWidget(label, i, 0)
+            lap_timing_layout.addWidget(label, i, 0)
 
-        # add the information labels to the QGridLayout
-        # car_info_layout.addWidget(self.mph, 0, 1)
-        car_info_layout.addWidget(self.pit_entry, 0, 1)
-        car_info_layout.addWidget(self.coolant_temperature, 1, 1)
-        car_info_layout.addWidget(self.battery_voltage, 2, 1)
-        car_info_layout.addWidget(self.fuel_gauge, 3, 1)
-        car_info_layout.addWidget(self.oil_pressure, 4, 1)
+        lap_timing_layout.addWidget(self.current_lap, 0, 1)
+        lap_timing_layout.addWidget(self.last_lap, 1, 1)
+        lap_timing_layout.addWidget(self.best_lap, 2, 1)
+        lap_timing_layout.addWidget(self.lap_delta, 3, 1)
+        lap_timing_layout.addWidget(self.sector_splits, 4, 1)
 
-        # add the "car_info_layout" QFormLayout to the information layout
-        information_layout.addLayout(car_info_layout)
+        # tracks without a start/finish line in maps/timing_lines.csv can have one dropped at the car's current position
+        self.set_start_finish = QPushButton("Set Start/Finish Here")
+        self.set_start_finish.setToolTip("Place the start/finish line across the track at the car's current GPS position")
+        lap_timing_layout.addWidget(self.set_start_finish, 5, 0, 1, 2)
+
+        information_layout.addLayout(lap_timing_layout)
 
         # -------------------------------------------------------------------------
         #
@@ -84,17 +94,14 @@ class Data(QWidget):
         #
         # -------------------------------------------------------------------------
 
-        self.lateral_accel_chart = StreamingLineChart(window_seconds=30, label1="Lateral Acceleration", label2="Steering Input")
-        self.lateral_accel_chart.resize(425, 150)
-        information_layout.addWidget(self.lateral_accel_chart)
-
-        self.forward_accel_chart = StreamingLineChartOneItem(window_seconds=30, data_label="Forward Acceleration")
-        self.forward_accel_chart.resize(425, 150)
-        information_layout.addWidget(self.forward_accel_chart)
+        # the charts (and pyqtgraph, which is most of the dashboard's import time) are only built by build_charts(), once the
+        # window has been drawn for the first time
+        self.chart_layout = QVBoxLayout()
+        information_layout.addLayout(self.chart_layout)
 
-        self.throttle_brake_chart = StreamingLineChartOneItem(window_seconds=30, data_label="Vertical Acceleration")
-        self.throttle_brake_chart.resize(425, 150)
-        information_layout.addWidget(self.throttle_brake_chart)
+        self.lateral_accel_chart = None
+        self.forward_accel_chart = None
+        self.throttle_brake_chart = None
 
 
         # -------------------------------------------------------------------------
@@ -116,31 +123,17 @@ class Data(QWidget):
         telemetry_info_layout.setSpacing(3)
 
 
-        self.accel_x = QLabel("--")
-        self.accel_y = QLabel("--")
-        self.accel_z = QLabel("--")
-        self.gyro_x = QLabel("--")
-        self.gyro_y = QLabel("--")
-        self.gyro_z = QLabel("--")
+        rows = self.add_fields(telemetry_info_layout, "imu")
+        self.combined_g = QLabel("--")
 
         # This is bad code-- need to set the minimum width of this stupid label and for some reason "mph"
         # is what the style name is called
         self.accel_x.setObjectName("min_width")
 
-        # create labels as an array to efficiently add them to the QGridLayout
-        labels = [QLabel("Accel X: "), QLabel("Accel Y: "), QLabel("Accel Z: "),
-                  QLabel("Gyro X: "), QLabel("Gyro Y: "), QLabel("Gyro Z: ")]
-        # iterate through the labels, setting the object name as 'small' and then adding to the appropriate row
-        for i, label in enumerate(labels):
-            label.setObjectName("small")
-            telemetry_info_layout.addWidget(label, i, 0)
-
-        telemetry_info_layout.addWidget(self.accel_x, 0, 1)
-        telemetry_info_layout.addWidget(self.accel_y, 1, 1)
-        telemetry_info_layout.addWidget(self.accel_z, 2, 1)
-        telemetry_info_layout.addWidget(self.gyro_x, 3, 1)
-        telemetry_info_layout.addWidget(self.gyro_y, 4, 1)
-        telemetry_info_layout.addWidget(self.gyro_z, 5, 1)
+        label = QLabel("Combined G: ")
+        label.setObjectName("small")
+        telemetry_info_layout.addWidget(label, rows, 0)
+        telemetry_info_layout.addWidget(self.combined_g, rows, 1)
 
         data_layout.addLayout(telemetry_info_layout) # add this to the bottom bar below the map
 
@@ -151,11 +144,11 @@ class Data(QWidget):
         # -------------------------------------------------------------------------
 
         map_layout = QVBoxLayout()
-        self.gps_map = QLabel()
 
+        # the map's size in pixels when it isn't zoomed in, which is also the size of its scene
         self.map_dimensions = (950,594)
-        self.map_center = [self.map_dimensions[0]//2, self.map_dimensions[1]//2]
-        self.map_zoom_factor = 1
+        # dragged to pan and scrolled to zoom, as well as the navigation buttons
+        self.gps_map = MapView(self.map_dimensions)
 
         map_layout.addWidget(self.gps_map)
 
@@ -169,29 +162,14 @@ class Data(QWidget):
         gps_info_layout = QGridLayout()
         gps_info_layout.setSpacing(3)
 
-        # since these need to be reference later, along with all of the labels above containing dynamic information, these need
-        # to be fields of the object, initialized with self.<name>
-        self.lat = QLabel("-- degrees")
-        self.lon = QLabel("-- degrees")
-        self.hdg = QLabel("-- degrees")
-        self.hdop = QLabel("--")
+        # the speed shown is the fused speed rather than the GPS message's, so it isn't one of the GPS panel's fields
+        rows = self.add_fields(gps_info_layout, "gps")
         self.gps_speed = QLabel("--")
-        self.num_satellites = QLabel("--")
-
-        # create labels as an array to efficiently add them to the QGridLayout
-        labels = [QLabel("Latitude: "), QLabel("Longitude: "), QLabel("Heading: "), QLabel("HDOP: "), QLabel("GPS Speed: "), QLabel("# of Sats: ")]
-        # iterate through the labels, setting the object name as 'small' and then adding to the appropriate row
-        for i, label in enumerate(labels):
-            label.setObjectName("small")
-            gps_info_layout.addWidget(label, i, 0)
 
-        # add the information labels to the QGridLayout
-        gps_info_layout.addWidget(self.lat, 0, 1)
-        gps_info_layout.addWidget(self.lon, 1, 1)
-        gps_info_layout.addWidget(self.hdg, 2, 1)
-        gps_info_layout.addWidget(self.hdop, 3, 1)
-        gps_info_layout.addWidget(self.gps_speed, 4, 1)
-        gps_info_layout.addWidget(self.num_satellites, 5, 1)
+        label = QLabel("GPS Speed: ")
+        label.setObjectName("small")
+        gps_info_layout.addWidget(label, rows, 0)
+        gps_info_layout.addWidget(self.gps_speed, rows, 1)
 
         data_layout.addLayout(gps_info_layout)
 
@@ -252,8 +230,16 @@ class Data(QWidget):
         # Now create a QComboBox to select which GPS map screenshot is used for the display
         self.map_location = QComboBox()
         self.map_locations_dict = self.getMapLocations()
+        self.timing_lines_dict = self.getTimingLines()
         data_layout.addWidget(self.map_location)
 
+        # colours the track on the map by one of the heatmap channels
+        self.heatmap_channel = QComboBox()
+        self.heatmap_channel.addItem("Heatmap Off", None)
+        for channel, (label, low, high, diverging) in HEATMAP_CHANNELS.items():
+            self.heatmap_channel.addItem(f"Heatmap: {label}", channel)
+        data_layout.addWidget(self.heatmap_channel)
+
         # to set the size of this widget to ensure sufficient spacing for the GPS map image, we create a widget for it and assign the layout to the widget
         data_widget = QWidget()
         data_widget.setLayout(data_layout)
@@ -286,6 +272,43 @@ class Data(QWidget):
         # finally, set the layout for the 'self' QWidget to be the main_layout, which contains as sub-layouts all of the items created
         self.setLayout(main_layout)
 
+    def add_fields(self, layout, panel, object_name=None):
+        """
+        Adds a row to the QGridLayout for every message field shown in the panel (see messages.csv), with the value label as
+        a field of the object named after the channel. Returns the number of rows added
+        """
+        fields = SCHEMA.panel(panel)
+        for row, field in enumerate(fields):
+            label = QLabel(f"{field.label}: ")
+            label.setObjectName("small")
+            layout.addWidget(label, row, 0)
+
+            value = QLabel("--")
+            if object_name is not None:
+                value.setObjectName(object_name)
+            setattr(self, field.name, value)
+            layout.addWidget(value, row, 1)
+        return len(fields)
+
+    def build_charts(self):
+        """
+        Creates the streaming charts, deferred until after the first frame so the window appears sooner
+        """
+        from rolling_chart import StreamingLineChart
+        from rolling_chart_one_item import StreamingLineChartOneItem
+
+        self.lateral_accel_chart = StreamingLineChart(window_seconds=30, label1="Lateral Acceleration", label2="Steering Input")
+        self.lateral_accel_chart.resize(425, 150)
+        self.chart_layout.addWidget(self.lateral_accel_chart)
+
+        self.forward_accel_chart = StreamingLineChartOneItem(window_seconds=30, data_label="Forward Acceleration")
+        self.forward_accel_chart.resize(425, 150)
+        self.chart_layout.addWidget(self.forward_accel_chart)
+
+        self.throttle_brake_chart = StreamingLineChartOneItem(window_seconds=30, data_label="Vertical Acceleration")
+        self.throttle_brake_chart.resize(425, 150)
+        self.chart_layout.addWidget(self.throttle_brake_chart)
+
     def getMapLocations(self):
         """
         This loads the data for the maps in from a .csv configuration file, with the map names, filenames, and coordinates/size info
@@ -305,61 +328,59 @@ class Data(QWidget):
 
         #finally, return the location dictionary {name --> filename, lat_1, lon_1, lat_2, lon_2}
         return map_locations
+
+    def getTimingLines(self):
+        """
+        This loads the start/finish and sector lines for each track from a .csv configuration file
+
+        The first line listed for a track is the start/finish line, and the rest are the sector lines in driving order
+        """
+        timing_lines = {}
+
+        with open('./maps/timing_lines.csv', newline='') as csvfile:
+            reader = csv.reader(csvfile, delimiter=',')
+            for row in reader:
+                if row and row[0] != 'Name':
+                    # Name, Line, Lat_1, Lon_1, Lat_2, Lon_2
+                    timing_lines.setdefault(row[0], []).append((row[1],float(row[2]),float(row[3]),float(row[4]),float(row[5])))
+
+        # {name --> [(line name, lat_1, lon_1, lat_2, lon_2), ...]}
+        return timing_lines
     
     def map_up_pressed(self):
         """
         This function provides functionality for when the up arrow is pressed on the map navigation
         """
-        minimum = self.map_zoom_factor*(self.map_dimensions[1]/2)
-        self.map_center[1] = max(self.map_center[1] - self.map_dimensions[1]*self.map_zoom_factor*0.1, minimum)
+        self.gps_map.pan(0, -0.1)
 
     def map_down_pressed(self):
         """
         This function provides functionality for when the down arrow is pressed on the map navigation
         """
-        maximum = (self.map_dimensions[1])-self.map_zoom_factor*(self.map_dimensions[1]/2)
-        self.map_center[1] = min(self.map_center[1] + self.map_dimensions[1]*self.map_zoom_factor*0.1, maximum)
+        self.gps_map.pan(0, 0.1)
 
     def map_left_pressed(self):
         """
         This function provides functionality for when the left arrow is pressed on the map navigation
         """
-        minimum = self.map_zoom_factor*(self.map_dimensions[0]/2)
-        self.map_center[0] = max(self.map_center[0] - self.map_dimensions[0]*self.map_zoom_factor*0.1, minimum)
+        self.gps_map.pan(-0.1, 0)
 
     def map_right_pressed(self):
         """
         This function provides functionality for when the right arrow is pressed on the map navigation
         """
-        maximum = (self.map_dimensions[0])-self.map_zoom_factor*(self.map_dimensions[0]/2)
-        self.map_center[0] = min(self.map_center[0] + self.map_dimensions[0]*self.map_zoom_factor*0.1, maximum)
+        self.gps_map.pan(0.1, 0)
 
     def map_zoom_in_pressed(self):
         """
         This function provides functionality for when the 'zoom in' arrow is pressed on the map navigation
         """
-        # modify the zoom value, with a lower limit at 0.1-- decrease by 10 percent
-        self.map_zoom_factor = max(self.map_zoom_factor*0.9, 0.1)
+        # decrease the zoom value by 10 percent, the view keeps it between 0.1 and 1 and the map in view
+        self.gps_map.zoom(0.9)
 
     def map_zoom_out_pressed(self):
         """
         This function provides functionality for when the 'zoom out' arrow is pressed on the map navigation
         """
-        # modify the zoom value, with an upper limit at 1-- increase by 11 percent
-        self.map_zoom_factor = min(self.map_zoom_factor*1.11, 1)
-
-        # calculate the minimum possible value for the 'y' value, and make sure that we adjust the center to match
-        x_minimum = self.map_zoom_factor*(self.map_dimensions[0]/2)
-        self.map_center[0] = max(self.map_center[0], x_minimum)
-
-        # calculate the maximum possible value for the 'y' value, and make sure that we adjust the center to match
-        x_maximum = (self.map_dimensions[0])-self.map_zoom_factor*(self.map_dimensions[0]/2)
-        self.map_center[0] = min(self.map_center[0], x_maximum)
-
-        # calculate the minimum possible value for the 'x' value, and make sure that we adjust the center to match
-        y_minimum = self.map_zoom_factor*(self.map_dimensions[1]/2)
-        self.map_center[1] = max(self.map_center[1], y_minimum)
-
-        # calculate the maximum possible value for the 'x' value, and make sure that we adjust the center to match
-        y_maximum = (self.map_dimensions[1])-self.map_zoom_factor*(self.map_dimensions[1]/2)
-        self.map_center[1] = min(self.map_center[1], y_maximum)
\ No newline at end of file
+        # increase the zoom value by 11 percent
+        self.gps_map.zoom(1.11)
\ No newline at end of file
@@ -0,0 +1,177 @@
+import numpy as np
+
+from message_schema import SCHEMA
+
+# standard gravity, to turn the IMU accelerations in m/s^2 into G
+GRAVITY = 9.80665
+
+
+class DerivedChannel:
+    """
+    A channel computed from other channels (raw or derived) by a function of NumPy arrays
+
+    The function is called with one array per input, in the order the inputs are listed, and returns an array of the
+    same length
+    """
+
+    def __init__(self, name, inputs, function, description=""):
+        self.name = name
+        self.inputs = list(inputs)
+        self.function = function
+        self.description = description
+
+
+class WindowedRate:
+    """
+    Rate of change of a channel over a trailing time window, carried across batches
+
+    The samples from the last `window` seconds of the previous batch are kept, so splitting the same data into different
+    batches (one message at a time live, a whole log offline) gives the same answer
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.tail_values = np.empty(0)
+        self.tail_times = np.empty(0)
+
+    def __call__(self, values, times):
+        values = np.asarray(values, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+
+        all_values = np.concatenate((self.tail_values, values))
+        all_times = np.concatenate((self.tail_times, times))
+        own = np.arange(len(self.tail_values), len(all_values))
+
+        # the newest sample at least `window` seconds older than each sample, and always at least one sample back
+        previous = np.searchsorted(all_times, times - self.window, side='right') - 1
+        previous = np.minimum(previous, own - 1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rate = np.where(previous >= 0,
+                            (values - all_values[np.maximum(previous, 0)]) / (times - all_times[np.maximum(previous, 0)]),
+                            np.nan)
+
+        # keep the samples a later batch could still need: everything inside the window of the newest sample, plus the
+        # newest sample older than that
+        if len(all_times):
+            keep_from = max(np.searchsorted(all_times, all_times[-1] - self.window, side='right') - 1, 0)
+            self.tail_values = all_values[keep_from:]
+            self.tail_times = all_times[keep_from:]
+
+        return rate
+
+
+class DerivedChannelRegistry:
+    """
+    Registry of derived channels, evaluated in dependency order on batches of samples
+
+    evaluate() takes a batch of raw channels ({name: array}) that share a time base and adds every derived channel whose
+    inputs are all available, computing each one exactly once per batch however many widgets read it
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self._order = None
+
+    def register(self, name, inputs, function, description=""):
+        if name in self.channels:
+            raise ValueError(f"Derived channel {name} is already registered")
+        self.channels[name] = DerivedChannel(name, inputs, function, description)
+        self._order = None
+
+    def order(self):
+        """
+        The derived channels sorted so every channel comes after the derived channels it depends on
+        """
+        if self._order is None:
+            order = []
+            state = {}
+
+            def visit(name, path):
+                if state.get(name) == 'done':
+                    return
+                if state.get(name) == 'visiting':
+                    raise ValueError(f"Derived channels have a dependency cycle: {' -> '.join(path + [name])}")
+                state[name] = 'visiting'
+                for dependency in self.channels[name].inputs:
+                    if dependency in self.channels:
+                        visit(dependency, path + [name])
+                state[name] = 'done'
+                order.append(self.channels[name])
+
+            for name in self.channels:
+                visit(name, [])
+            self._order = order
+
+        return self._order
+
+    def evaluate(self, batch):
+        """
+        Returns a new dictionary with the batch's channels plus every derived channel that can be computed from them
+
+        Channels already present in the batch are not recomputed, so a log that stores a derived value (car.csv stores
+        Engine RPM, not the period) can still feed the channels that depend on it
+        """
+        results = dict(batch)
+        for channel in self.order():
+            if channel.name in results:
+                continue
+            if all(name in results for name in channel.inputs):
+                results[channel.name] = channel.function(*[results[name] for name in channel.inputs])
+        return results
+
+    def derived_names(self, batch):
+        return [channel.name for channel in self.order() if channel.name not in batch]
+
+
+def rpm_from_period(period):
+    """
+    Engine RPM from the period between pulses in microseconds, 0 while the engine is stopped (a period of 0, or NaN when the
+    firmware counted no pulses)
+    """
+    running = period > 0
+    return np.where(running, 60000000/np.where(running, period, 1), 0.0)
+
+
+def default_registry():
+    """
+    The derived channels used by the dashboard and the analysis tools
+
+    Stateful channels (rates) keep their state in the registry, so each consumer should make its own with this function
+    """
+    registry = DerivedChannelRegistry()
+
+    # the firmware sends the average period between RPM pulses in microseconds
+    registry.register('rpm', ['rpm_period'], rpm_from_period, "Engine RPM")
+    # the steering sensor is centered on half of the 12 bit ADC range
+    registry.register('steering_angle', ['steering_raw'], lambda raw: raw - 2048, "Steering input, centered")
+
+    # Y is lateral and Z is forward on the dashboard charts, so combined G is the magnitude in that plane
+    registry.register('combined_g', ['accel_y', 'accel_z'], lambda y, z: np.hypot(y, z)/GRAVITY,
+                      "Combined lateral and longitudinal acceleration (G)")
+
+    registry.register('steering_rate', ['steering_angle', 'driver_time'], WindowedRate(0.05),
+                      "Steering rate (ADC counts per second)")
+
+    # the fuel gauge is noisy, so its rate is taken over a minute and reported per minute
+    fuel_rate = WindowedRate(60.0)
+    registry.register('fuel_rate', ['fuel_gauge', 'car_time'], lambda fuel, t: -60*fuel_rate(fuel, t),
+                      "Fuel use (gauge counts per minute)")
+
+    return registry
+
+
+# names of the raw channels for each column of the csv logs written by Vehicle, for evaluating derived channels offline
+LOG_CHANNELS = SCHEMA.log_channels()
+
+
+def evaluate_log(log, columns, registry=None):
+    """
+    Evaluates the derived channels over a whole log offline, in one batch
+
+    columns maps the csv column names to arrays (a pandas DataFrame or a session_cache log both work)
+    """
+    registry = registry or default_registry()
+    batch = {channel: np.asarray(columns[column], dtype=np.float64)
+             for column, channel in LOG_CHANNELS[log].items() if column in columns}
+    return registry.evaluate(batch)
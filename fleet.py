@@ -0,0 +1,91 @@
+import threading
+
+from connection import Vehicle
+
+
+class Fleet:
+    """
+    Several Vehicle connections ingested at once, one per car and radio
+
+    Each vehicle has its own port, parser state, log folder and counters, and is read by its own worker thread blocking
+    on its port, so the GUI thread only reads the decoded values and adding a car doesn't add any polling to it
+
+    Given an asyncio event loop instead (the Qt loop through qasync), every car is read by an AsyncTransport on that loop
+    and no threads are started at all
+    """
+
+    def __init__(self, read_timeout=0.5, loop=None):
+        # the longest a worker waits in a read before checking whether it should stop
+        self.read_timeout = read_timeout
+        self.loop = loop
+        self.vehicles = {}
+        self.workers = {}
+        self.stopping = {}
+        self.transports = {}
+
+    def add(self, name, port, baud, verbose=False):
+        """
+        Starts ingesting a car, returns the Vehicle
+
+        The port is opened in the background by the worker (or the transport), which keeps retrying until it opens and
+        reopens it whenever it fails, so this returns straight away
+        """
+        if name in self.vehicles:
+            raise ValueError(f"A vehicle named {name} is already connected")
+
+        vehicle = Vehicle(port=port, baud=baud, verbose=verbose, read_timeout=self.read_timeout, connect=False)
+
+        self.vehicles[name] = vehicle
+
+        if self.loop is not None:
+            # only imported when running on an event loop, asyncio adds to the dashboard's startup time otherwise
+            from async_transport import AsyncTransport
+
+            self.transports[name] = AsyncTransport(vehicle, self.loop)
+            self.transports[name].start()
+            return vehicle
+
+        stop = threading.Event()
+        worker = threading.Thread(target=self.ingest, args=(vehicle, stop), name=f"ingest-{name}", daemon=True)
+        self.stopping[name] = stop
+        self.workers[name] = worker
+        worker.start()
+        return vehicle
+
+    def ingest(self, vehicle, stop):
+        while not stop.is_set():
+            vehicle.update(block=True)
+        # finished on this thread, so nothing else touches the vehicle while a read is still going: the samples decoded
+        # since the last batch haven't been logged yet
+        vehicle.evaluate_derived()
+        vehicle.close_port()
+
+    def remove(self, name):
+        vehicle = self.vehicles.pop(name)
+        if name in self.transports:
+            # the transport reads on the event loop, this thread, so it has stopped reading once it is stopped
+            self.transports.pop(name).stop()
+            vehicle.evaluate_derived()
+            vehicle.close_port()
+        else:
+            self.stopping.pop(name).set()
+            worker = self.workers.pop(name)
+            worker.join(timeout=2*self.read_timeout)
+            if worker.is_alive():
+                print(f"{name} is still finishing a read, its logs are flushed and its port closed once it has")
+
+    def names(self):
+        return list(self.vehicles)
+
+    def __getitem__(self, name):
+        return self.vehicles[name]
+
+    def __contains__(self, name):
+        return name in self.vehicles
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def stop(self):
+        for name in self.names():
+            self.remove(name)
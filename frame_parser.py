@@ -0,0 +1,178 @@
+"""
+Frame parser for the car's telemetry stream
+
+Two versions of frame, told apart by their start byte:
+
+    version 2:  <0xFD> <LENGTH BYTE> <MSG ID BYTE> <PAYLOAD> <CRC-16, little endian>
+    version 1:  <0xFE> <LENGTH BYTE> <MSG ID BYTE> <PAYLOAD> <0xAB> <0xCD>
+
+The length byte is the length of the whole frame, the same for both versions. The CRC is CRC-16/CCITT-FALSE (polynomial
+0x1021, starting from 0xFFFF) over everything before it, start byte included. Version 1 frames, from older firmware and
+old captures, only end in a constant, so a corrupted payload can't be told apart from a good one.
+
+Every message the car sends has a fixed size, so a header only counts as one if its length is the known length for its ID.
+Anything else (radio noise, a dropped byte, a corrupt length, a bad CRC) is skipped by moving on to the next start byte,
+never by waiting for more data or trusting the length.
+"""
+import binascii
+import re
+
+import numpy as np
+
+from message_schema import SCHEMA
+
+START_BYTE_CRC = 0xFD
+START_BYTE = 0xFE
+TRAILER = b'\xAB\xCD'
+# start byte, length and ID
+HEADER_LENGTH = 3
+
+# total length of each message, from the payload layouts in messages.csv (plus 5)
+FRAME_LENGTHS = SCHEMA.frame_lengths()
+MAX_FRAME_LENGTH = max(FRAME_LENGTHS.values())
+
+CRC16_INITIAL = 0xFFFF
+
+
+def crc16_table(polynomial=0x1021):
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ polynomial if crc & 0x8000 else crc << 1) & 0xFFFF
+        table[byte] = crc
+    return table
+
+
+CRC16_TABLE = crc16_table()
+
+
+def crc16(data):
+    """
+    CRC-16/CCITT-FALSE of a bytes-like object (binascii's table driven CRC-CCITT, which runs in C)
+    """
+    return binascii.crc_hqx(data, CRC16_INITIAL)
+
+
+def crc16_batch(frames):
+    """
+    CRC-16 of each row of a 2D uint8 array (frames of the same length, without their CRC), a byte column at a time
+    """
+    crc = np.full(len(frames), CRC16_INITIAL, dtype=np.uint16)
+    for column in frames.T:
+        crc = (crc << 8) ^ CRC16_TABLE[(crc >> 8) ^ column]
+    return crc
+
+
+def encode_frame(msg_id, payload):
+    """
+    Builds a version 2 frame, as send_telemetry() does in the firmware
+    """
+    frame = bytes([START_BYTE_CRC, len(payload) + 5, msg_id]) + bytes(payload)
+    return frame + crc16(frame).to_bytes(2, 'little')
+
+
+def check_frame(frame):
+    """
+    Whether a whole frame (of either version) has a known ID, that ID's length and a good CRC or trailer
+    """
+    if len(frame) < HEADER_LENGTH or FRAME_LENGTHS.get(frame[2]) != len(frame) or frame[1] != len(frame):
+        return False
+    if frame[0] == START_BYTE_CRC:
+        return crc16(frame[:-2]) == int.from_bytes(frame[-2:], 'little')
+    return frame[0] == START_BYTE and frame[-2:] == TRAILER
+
+
+def check_frames(frames):
+    """
+    check_frame() for a list of frames at once, with the CRCs of each length of version 2 frame computed together, returns
+    a numpy array of booleans
+    """
+    results = np.zeros(len(frames), dtype=bool)
+    batches = {}
+    for index, frame in enumerate(frames):
+        if frame[0] == START_BYTE_CRC and len(frame) > HEADER_LENGTH and FRAME_LENGTHS.get(frame[2]) == len(frame) == frame[1]:
+            batches.setdefault(len(frame), []).append(index)
+        else:
+            results[index] = check_frame(frame)
+
+    for length, indices in batches.items():
+        block = np.frombuffer(b''.join(frames[index] for index in indices), dtype=np.uint8).reshape(-1, length)
+        received = block[:, -2].astype(np.uint16) | (block[:, -1].astype(np.uint16) << 8)
+        results[indices] = crc16_batch(block[:, :-2]) == received
+    return results
+
+
+class FrameParser:
+    """
+    Splits a byte stream into frames, resynchronizing on the next start byte whenever a frame doesn't check out
+
+    Each byte is considered as the start of a frame at most once, and checking a candidate only reads its header and then
+    the frame itself once, so the work per byte received is bounded whatever arrives. Nothing is kept but the bytes of one
+    (possibly) incomplete frame, so the buffer never holds more than MAX_FRAME_LENGTH bytes between calls.
+
+    Initiated with a dict of counters to add to (see Vehicle.counters): checksum_failures for frames with a valid header
+    but a bad CRC or trailer, and discarded_bytes for every byte skipped while resynchronizing. With legacy set to False
+    version 1 frames are ignored, once every car sends version 2 their weaker check is only a way for noise to get in.
+    """
+
+    def __init__(self, counters=None, legacy=True):
+        self.buffer = bytearray()
+        self.counters = counters if counters is not None else {}
+        self.counters.setdefault('checksum_failures', 0)
+        self.counters.setdefault('discarded_bytes', 0)
+        self.start_bytes = re.compile(b'[\xFD\xFE]' if legacy else b'\xFD')
+
+    def reset(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Adds received bytes and returns the complete, valid frames they finish (as bytes objects)
+        """
+        buffer = self.buffer
+        buffer += data
+        end = len(buffer)
+        frames = []
+        position = 0
+        discarded = 0
+
+        while True:
+            # searching: skip to the next start byte
+            start = self.start_bytes.search(buffer, position)
+            if start is None:
+                discarded += end - position
+                position = end
+                break
+            discarded += start.start() - position
+            position = start.start()
+
+            # header: the ID must be known and the length must be that ID's length
+            if end - position < HEADER_LENGTH:
+                break
+            length = FRAME_LENGTHS.get(buffer[position+2])
+            if length is None or buffer[position+1] != length:
+                position += 1
+                discarded += 1
+                continue
+
+            # body: wait for the rest of the frame, which is never more than MAX_FRAME_LENGTH bytes away
+            if end - position < length:
+                break
+            if buffer[position] == START_BYTE_CRC:
+                good = crc16(buffer[position:position+length-2]) == buffer[position+length-2] | buffer[position+length-1] << 8
+            else:
+                good = buffer[position+length-2:position+length] == TRAILER
+            if not good:
+                # the start byte could have been part of the noise, so the search carries on from the byte after it
+                self.counters['checksum_failures'] += 1
+                position += 1
+                discarded += 1
+                continue
+
+            frames.append(bytes(buffer[position:position+length]))
+            position += length
+
+        del buffer[:position]
+        self.counters['discarded_bytes'] += discarded
+        return frames
@@ -0,0 +1,187 @@
+import math
+
+import numpy as np
+
+from lap_alignment import EARTH_RADIUS
+
+# the GPS module reports speed in mph
+MPH_TO_MPS = 0.44704
+
+
+class FusionFilter:
+    """
+    Complementary filter fusing the 100 Hz IMU with the 1 Hz GPS, for position, heading and speed at the IMU rate
+
+    Between GPS fixes the state is dead reckoned from the forward acceleration (IMU Z) and yaw rate (gyro X, the axis
+    pointing up), and each GPS fix pulls the state back towards the measurement with a fixed gain, so the IMU provides
+    the smooth short term motion and the GPS removes the long term drift. Every sample costs a constant amount of work.
+
+    Positions are kept in meters east/north of the first GPS fix.
+    """
+
+    def __init__(self, position_gain=0.6, speed_gain=0.5, heading_gain=0.5, yaw_sign=-1.0, min_heading_speed=2.0):
+        self.position_gain = position_gain
+        self.speed_gain = speed_gain
+        self.heading_gain = heading_gain
+        # sign between gyro X and heading (degrees clockwise from north), depends on how the board is mounted
+        self.yaw_sign = yaw_sign
+        # GPS heading is noise when the car is nearly stopped, so it is only used above this speed (m/s)
+        self.min_heading_speed = min_heading_speed
+
+        self.initialized = False
+        self.lat0 = 0.0
+        self.lon0 = 0.0
+        self.meters_per_deg_lat = EARTH_RADIUS*math.pi/180
+        self.meters_per_deg_lon = self.meters_per_deg_lat
+
+        self.time = None
+        self.east = 0.0
+        self.north = 0.0
+        self.speed = 0.0     # m/s
+        self.heading = 0.0   # radians clockwise from north
+
+    def predict(self, t, forward_accel, yaw_rate):
+        """
+        Dead reckons the state forward to time t with one IMU sample
+        """
+        if not self.initialized:
+            return
+        dt = t - self.time
+        if dt <= 0:
+            return
+        self.time = t
+
+        self.heading += self.yaw_sign*yaw_rate*dt
+        self.speed = max(self.speed + forward_accel*dt, 0.0)
+        self.east += self.speed*math.sin(self.heading)*dt
+        self.north += self.speed*math.cos(self.heading)*dt
+
+    def correct(self, t, lat, lon, speed_mph, heading_deg):
+        """
+        Blends a GPS fix into the state
+        """
+        if not self.initialized:
+            # the first fix sets the origin of the local coordinate system and the starting state
+            self.lat0 = lat
+            self.lon0 = lon
+            self.meters_per_deg_lon = self.meters_per_deg_lat*math.cos(math.radians(lat))
+            self.time = t
+            self.speed = speed_mph*MPH_TO_MPS
+            self.heading = math.radians(heading_deg)
+            self.initialized = True
+            return
+
+        east = (lon - self.lon0)*self.meters_per_deg_lon
+        north = (lat - self.lat0)*self.meters_per_deg_lat
+        self.east += self.position_gain*(east - self.east)
+        self.north += self.position_gain*(north - self.north)
+
+        speed = speed_mph*MPH_TO_MPS
+        self.speed += self.speed_gain*(speed - self.speed)
+
+        if speed > self.min_heading_speed:
+            # blend along the shortest way around the circle
+            error = (math.radians(heading_deg) - self.heading + math.pi) % (2*math.pi) - math.pi
+            self.heading += self.heading_gain*error
+
+        self.time = max(self.time, t)
+
+    @property
+    def lat(self):
+        return self.lat0 + self.north/self.meters_per_deg_lat
+
+    @property
+    def lon(self):
+        return self.lon0 + self.east/self.meters_per_deg_lon
+
+    @property
+    def speed_mph(self):
+        return self.speed/MPH_TO_MPS
+
+    @property
+    def heading_deg(self):
+        return math.degrees(self.heading) % 360
+
+
+def fuse_log(filter, imu_time, forward_accel, yaw_rate, gps_time, lat, lon, speed_mph, heading_deg):
+    """
+    Runs the filter over whole logs offline, returning (time, lat, lon, speed in mph, heading in degrees) at the IMU rate
+
+    The dead reckoning between two GPS fixes is done with cumulative sums over all of the IMU samples in between, which
+    is the same explicit Euler step as FusionFilter.predict, so offline reprocessing matches what the dashboard showed.
+    Only the (1 Hz) GPS corrections are a Python loop.
+    """
+    imu_time = np.asarray(imu_time, dtype=np.float64)
+    forward_accel = np.asarray(forward_accel, dtype=np.float64)
+    yaw_rate = np.asarray(yaw_rate, dtype=np.float64)
+
+    out_east = np.full(len(imu_time), np.nan)
+    out_north = np.full(len(imu_time), np.nan)
+    out_speed = np.full(len(imu_time), np.nan)
+    out_heading = np.full(len(imu_time), np.nan)
+
+    # IMU sample index where each GPS fix falls, so each interval between fixes is one slice
+    boundaries = np.searchsorted(imu_time, gps_time, side='right')
+    boundaries = np.append(boundaries, len(imu_time))
+
+    for i in range(len(gps_time)):
+        filter.correct(gps_time[i], lat[i], lon[i], speed_mph[i], heading_deg[i])
+
+        first, last = boundaries[i], boundaries[i+1]
+        if last <= first:
+            continue
+
+        times = imu_time[first:last]
+        dt = np.diff(times, prepend=filter.time)
+        dt[dt < 0] = 0.0
+
+        heading = filter.heading + np.cumsum(filter.yaw_sign*yaw_rate[first:last]*dt)
+        # the live filter clamps speed at zero every step, which a plain cumulative sum can't do exactly, so the
+        # clamp is applied to the running sum (identical whenever the car doesn't try to drive backwards)
+        speed = np.maximum(filter.speed + np.cumsum(forward_accel[first:last]*dt), 0.0)
+        east = filter.east + np.cumsum(speed*np.sin(heading)*dt)
+        north = filter.north + np.cumsum(speed*np.cos(heading)*dt)
+
+        out_east[first:last] = east
+        out_north[first:last] = north
+        out_speed[first:last] = speed
+        out_heading[first:last] = heading
+
+        filter.time = times[-1]
+        filter.heading = heading[-1]
+        filter.speed = speed[-1]
+        filter.east = east[-1]
+        filter.north = north[-1]
+
+    out_lat = filter.lat0 + out_north/filter.meters_per_deg_lat
+    out_lon = filter.lon0 + out_east/filter.meters_per_deg_lon
+    return imu_time, out_lat, out_lon, out_speed/MPH_TO_MPS, np.degrees(out_heading) % 360
+
+
+# if this script is called directly, reprocess a logged session into a fused track at the IMU rate
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from pathlib import Path
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Fuse a logged session's IMU and GPS logs into fused.csv")
+    parser.add_argument("session", help="log folder of the session")
+    args = parser.parse_args()
+
+    folder = Path(args.session)
+    if not (folder / "imu.csv").exists() or not (folder / "gps.csv").exists():
+        print(f"{folder} needs both imu.csv and gps.csv")
+        sys.exit(1)
+
+    imu = pd.read_csv(folder / "imu.csv").sort_values("Time")
+    gps = pd.read_csv(folder / "gps.csv").sort_values("Time")
+
+    time, lat, lon, speed, heading = fuse_log(FusionFilter(), imu["Time"].to_numpy(), imu["Z dot"].to_numpy(),
+                                              imu["Omega X"].to_numpy(), gps["Time"].to_numpy(), gps["Lat"].to_numpy(),
+                                              gps["Lon"].to_numpy(), gps["Speed"].to_numpy(), gps["Heading"].to_numpy())
+
+    fused = pd.DataFrame({"Time": time, "Lat": lat, "Lon": lon, "Speed": speed, "Heading": heading}).dropna()
+    fused.to_csv(folder / "fused.csv", index=False)
+    print(f"Wrote {len(fused)} fused samples to {folder / 'fused.csv'}")
@@ -0,0 +1,91 @@
+"""
+Heatmaps of speed and G force over the track, accumulated into a raster grid laid over the selected map
+
+The grid covers the map's area from maps/locations.csv, and every sample adds its value to the sum of the cell it falls in,
+so the work per sample is constant and the memory doesn't grow with the length of the session. Each cell's colour is the
+mean of the samples in it, which over a stint shows where the car brakes and how hard it corners in each corner.
+"""
+import numpy as np
+
+# the channels kept in every heatmap: (label, value at the bottom of the colour scale, value at the top, diverging)
+HEATMAP_CHANNELS = {
+    'speed': ("Speed (mph)", 0.0, 100.0, False),
+    # cornering either way, so the magnitude
+    'lateral_g': ("Lateral G", 0.0, 1.5, False),
+    # forward acceleration as a proxy for throttle and brake, braking is negative
+    'longitudinal_g': ("Throttle / Brake (G)", -1.0, 1.0, True),
+}
+
+# colour stops for the sequential scale (blue, cyan, green, yellow, red) and the diverging one (red, white, green)
+SEQUENTIAL = np.array([[48, 18, 160], [30, 180, 230], [60, 200, 60], [250, 220, 40], [220, 30, 30]], dtype=np.float64)
+DIVERGING = np.array([[220, 30, 30], [255, 255, 255], [40, 170, 60]], dtype=np.float64)
+# opacity of the cells with samples, the map shows through a little
+ALPHA = 190
+
+
+def colorize(values, low, high, diverging=False):
+    """
+    RGBA colours (uint8, shape + (4,)) for an array of values, transparent where a value is NaN
+    """
+    stops = DIVERGING if diverging else SEQUENTIAL
+    position = np.clip((values - low)/(high - low), 0.0, 1.0)*(len(stops) - 1)
+    position = np.nan_to_num(position)
+    below = np.minimum(position.astype(np.int64), len(stops) - 2)
+    fraction = (position - below)[..., None]
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = stops[below]*(1 - fraction) + stops[below + 1]*fraction
+    rgba[..., 3] = np.where(np.isnan(values), 0, ALPHA)
+    return rgba
+
+
+class Heatmap:
+    """
+    Running sums of every channel in HEATMAP_CHANNELS over a grid laid over one map
+
+    Initiated with the map's corners (top lat, left lon, bottom lat, right lon) and the grid's (rows, columns). version goes
+    up with every sample added, so a drawing of the heatmap can tell when it is out of date
+    """
+
+    def __init__(self, bounds, shape=(148, 237)):
+        self.top_lat, self.left_lon, self.bottom_lat, self.right_lon = bounds
+        self.rows, self.columns = shape
+        self.sums = np.zeros((len(HEATMAP_CHANNELS),) + shape, dtype=np.float64)
+        self.counts = np.zeros(shape, dtype=np.uint32)
+        self.version = 0
+
+    def cell(self, lat, lon):
+        """
+        (row, column) of the cell a position falls in, or None if it is off the map
+        """
+        row = int((lat - self.top_lat)/(self.bottom_lat - self.top_lat)*self.rows)
+        column = int((lon - self.left_lon)/(self.right_lon - self.left_lon)*self.columns)
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            return row, column
+        return None
+
+    def add(self, lat, lon, values):
+        """
+        Adds one sample, values in the order of HEATMAP_CHANNELS
+        """
+        cell = self.cell(lat, lon)
+        if cell is None:
+            return
+        row, column = cell
+        self.sums[:, row, column] += values
+        self.counts[row, column] += 1
+        self.version += 1
+
+    def means(self, channel):
+        """
+        The mean of a channel in every cell, NaN where there are no samples
+        """
+        sums = self.sums[list(HEATMAP_CHANNELS).index(channel)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 0, sums/self.counts, np.nan)
+
+    def colors(self, channel):
+        """
+        The heatmap of a channel as an RGBA (rows, columns, 4) uint8 array
+        """
+        label, low, high, diverging = HEATMAP_CHANNELS[channel]
+        return colorize(self.means(channel), low, high, diverging)
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtGui import QImage, QPixmap
+
+
+class ImageCache(QObject):
+    """
+    Images (map screenshots, the logo) decoded on a background thread and kept in memory as QPixmaps
+
+    Decoding a large map image takes a noticeable fraction of a second, and the map used to be read from disk on every
+    redraw. Here each image is decoded once into a QImage by a worker thread (a QPixmap can only be made on the GUI thread),
+    and handed back to the GUI thread through a queued signal, where it becomes a QPixmap and any waiting callbacks run.
+    """
+
+    # emitted from the worker thread with the path and decoded image, delivered on the GUI thread
+    decoded = Signal(str, QImage)
+
+    def __init__(self, workers=2):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-cache")
+        self.pixmaps = {}
+        self.pending = set()
+        # images that couldn't be loaded, so a missing map isn't tried again on every redraw
+        self.failed = set()
+        # images discarded while they were still being decoded, dropped when they arrive rather than kept
+        self.dropped = set()
+        self.callbacks = {}
+        self.decoded.connect(self.store)
+
+    def warm(self, paths):
+        """
+        Starts decoding the images that aren't cached or already being decoded
+        """
+        for path in paths:
+            path = str(path)
+            # wanted again before it arrived
+            self.dropped.discard(path)
+            if path in self.pixmaps or path in self.pending or path in self.failed:
+                continue
+            self.pending.add(path)
+            self.executor.submit(self.decode, path)
+
+    def decode(self, path):
+        # runs on a worker thread
+        self.decoded.emit(path, QImage(path))
+
+    def store(self, path, image):
+        self.pending.discard(path)
+        if path in self.dropped:
+            self.dropped.discard(path)
+            return
+        if image.isNull():
+            print(f"Could not load image {path}")
+            self.failed.add(path)
+            self.callbacks.pop(path, None)
+            return
+
+        self.pixmaps[path] = QPixmap.fromImage(image)
+        for callback in self.callbacks.pop(path, []):
+            callback(self.pixmaps[path])
+
+    def get(self, path):
+        """
+        Returns the image as a QPixmap, or None (and starts decoding it) if it isn't ready yet
+        """
+        path = str(path)
+        if path not in self.pixmaps:
+            self.warm([path])
+        return self.pixmaps.get(path)
+
+    def discard(self, paths):
+        """
+        Drops images from memory (map tiles that are no longer in view), they are decoded again if they are needed
+        """
+        for path in paths:
+            path = str(path)
+            self.pixmaps.pop(path, None)
+            self.callbacks.pop(path, None)
+            if path in self.pending:
+                self.dropped.add(path)
+
+    def when_ready(self, path, callback):
+        """
+        Calls callback with the QPixmap once the image is ready, straight away if it already is
+        """
+        path = str(path)
+        if path in self.pixmaps:
+            callback(self.pixmaps[path])
+            return
+        if path in self.failed:
+            return
+        self.callbacks.setdefault(path, []).append(callback)
+        self.warm([path])
+
+
+_cache = None
+
+
+def image_cache():
+    """
+    The application's shared image cache, made on first use since it needs the QApplication to exist
+    """
+    global _cache
+    if _cache is None:
+        _cache = ImageCache()
+    return _cache
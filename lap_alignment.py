@@ -0,0 +1,309 @@
+import numpy as np
+
+# mean radius of the earth in meters, used to turn GPS coordinates into a flat local coordinate system
+EARTH_RADIUS = 6371000.0
+
+# channels resampled onto the distance grid by default, as (log file, column) pairs written by Vehicle.__init__
+DEFAULT_CHANNELS = {
+    "Y dot": ("imu", "Y dot"),
+    "Speed": ("gps", "Speed"),
+    "Engine RPM": ("car", "Engine RPM"),
+}
+
+
+# =========================
+# GEOMETRY HELPERS
+# =========================
+def to_local_xy(lat, lon, lat0, lon0):
+    """
+    Equirectangular projection of GPS coordinates to meters east (x) and north (y) of (lat0, lon0)
+
+    This is accurate to well under a meter over the size of a race track, and it is fully vectorized
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+
+    x = np.radians(lon - lon0) * EARTH_RADIUS * np.cos(np.radians(lat0))
+    y = np.radians(lat - lat0) * EARTH_RADIUS
+    return x, y
+
+
+class ReferenceLine:
+    """
+    A polyline (usually one clean lap) that every other lap gets projected onto
+
+    Initiated with the latitude and longitude of the points along the line, in driving order
+    """
+
+    def __init__(self, lat, lon):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+
+        # the first point of the line is the origin of the local coordinate system
+        self.lat0 = lat[0]
+        self.lon0 = lon[0]
+
+        self.x, self.y = to_local_xy(lat, lon, self.lat0, self.lon0)
+
+        # segment start points and direction vectors
+        self.seg_x = self.x[:-1]
+        self.seg_y = self.y[:-1]
+        self.seg_dx = np.diff(self.x)
+        self.seg_dy = np.diff(self.y)
+        self.seg_len2 = self.seg_dx**2 + self.seg_dy**2
+        # avoid dividing by zero for repeated points (the car sitting still)
+        self.seg_len2[self.seg_len2 == 0] = np.finfo(np.float64).eps
+
+        # cumulative distance along the line at the start of each point
+        self.distance = np.concatenate(([0.0], np.cumsum(np.sqrt(self.seg_len2))))
+        self.length = self.distance[-1]
+
+    def project(self, lat, lon, chunk=4096):
+        """
+        Projects points onto the nearest segment of the line, returning the distance along the line for each point
+
+        Done in chunks so memory stays bounded at (chunk x number of segments) even for a full race
+        """
+        px, py = to_local_xy(lat, lon, self.lat0, self.lon0)
+        result = np.empty(px.shape, dtype=np.float64)
+
+        for start in range(0, len(px), chunk):
+            cx = px[start:start+chunk, None]
+            cy = py[start:start+chunk, None]
+
+            # parametric position of the closest point on every segment, clamped to the segment
+            t = ((cx - self.seg_x)*self.seg_dx + (cy - self.seg_y)*self.seg_dy) / self.seg_len2
+            t = np.clip(t, 0.0, 1.0)
+
+            dist2 = (self.seg_x + t*self.seg_dx - cx)**2 + (self.seg_y + t*self.seg_dy - cy)**2
+            nearest = np.argmin(dist2, axis=1)
+
+            rows = np.arange(len(nearest))
+            result[start:start+chunk] = self.distance[nearest] + t[rows, nearest]*np.sqrt(self.seg_len2[nearest])
+
+        return result
+
+
+# =========================
+# LAP SPLITTING
+# =========================
+def split_laps(gps_time, lat, lon, start_lat, start_lon, gate_radius=15.0):
+    """
+    Finds the times the car passed the start/finish point
+
+    Each pass through the circle of gate_radius meters around the start/finish point counts once, at the fix
+    closest to the point. Returns the crossing times, so lap i runs from crossings[i] to crossings[i+1]
+    """
+    gps_time = np.asarray(gps_time, dtype=np.float64)
+    x, y = to_local_xy(lat, lon, start_lat, start_lon)
+    dist = np.hypot(x, y)
+
+    inside = dist < gate_radius
+    if not inside.any():
+        return np.empty(0)
+
+    # find the start and end index of each run of fixes inside the gate
+    edges = np.diff(inside.astype(np.int8), prepend=0, append=0)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+
+    # the closest fix of each run is the crossing (there is only one run per lap, so this loop is short)
+    crossings = [gps_time[start + np.argmin(dist[start:end])] for start, end in zip(run_starts, run_ends)]
+
+    return np.array(crossings)
+
+
+# =========================
+# RESAMPLING
+# =========================
+def lap_distance(reference, gps_time, lat, lon, lap_start, lap_end):
+    """
+    Returns the GPS times and the monotonic distance along the reference line for the fixes inside one lap
+    """
+    # include one fix either side of the lap, so the grid is covered right up to the start/finish point
+    first = max(np.searchsorted(gps_time, lap_start) - 1, 0)
+    last = min(np.searchsorted(gps_time, lap_end, side='right') + 1, len(gps_time))
+    times = np.asarray(gps_time)[first:last]
+    dist = reference.project(np.asarray(lat)[first:last], np.asarray(lon)[first:last])
+
+    if len(dist) == 0:
+        return times, dist
+
+    # fixes just before the start/finish project onto the end of the line, and fixes just after it onto the start,
+    # so the leading and trailing fixes on the wrong half of the line are wrapped around by one line length
+    near_end = dist > 0.5*reference.length
+    first_low = np.argmax(~near_end) if (~near_end).any() else len(dist)
+    last_high = len(dist) - 1 - np.argmax(near_end[::-1]) if near_end.any() else -1
+    dist[:first_low] -= reference.length
+    if last_high >= first_low:
+        dist[last_high+1:] += reference.length
+
+    # GPS noise can make the car appear to move backwards, distance along the lap is forced to be non-decreasing
+    dist = np.maximum.accumulate(dist)
+    return times, dist
+
+
+def time_on_grid(times, dist, grid):
+    """
+    Interpolates the time the car reached each distance in grid, NaN outside of the distance covered
+    """
+    if len(dist) < 2:
+        return np.full(grid.shape, np.nan)
+
+    # np.interp needs strictly increasing x values, drop the repeated distances from stationary fixes
+    keep = np.concatenate(([True], np.diff(dist) > 0))
+    t = np.interp(grid, dist[keep], times[keep], left=np.nan, right=np.nan)
+    return t
+
+
+def resample_channel(grid_times, channel_time, channel_values):
+    """
+    Resamples a channel logged on its own time base (IMU at 100 Hz, car data at 50 Hz, GPS at 1 Hz) onto the
+    times the car reached each point of the distance grid, all NaN if nothing was logged on the channel
+    """
+    if len(channel_time) == 0:
+        return np.full(grid_times.shape, np.nan)
+
+    out = np.interp(grid_times, channel_time, channel_values)
+    out[np.isnan(grid_times)] = np.nan
+    return out
+
+
+# =========================
+# LAP SETS
+# =========================
+class LapSet:
+    """
+    Every lap of a set of sessions resampled onto the same distance grid
+
+    elapsed is an (n_laps, n_grid) array of time since the start of the lap at each grid distance, and channels maps
+    each channel name to an array of the same shape
+    """
+
+    def __init__(self, reference, grid, labels, elapsed, channels):
+        self.reference = reference
+        self.grid = grid
+        self.labels = labels
+        self.elapsed = elapsed
+        self.channels = channels
+
+    @property
+    def lap_times(self):
+        # the time at the last grid point is the lap time, NaN if the lap did not cover the full reference line
+        return self.elapsed[:, -1]
+
+    def fastest_lap(self):
+        if np.isnan(self.lap_times).all():
+            raise ValueError("No lap covers the whole reference line")
+        return int(np.nanargmin(self.lap_times))
+
+    def delta_time(self, lap_a, lap_b):
+        """
+        Running delta time of lap_b relative to lap_a along the grid, positive when lap_b is behind
+        """
+        return self.elapsed[lap_b] - self.elapsed[lap_a]
+
+    def compare_to_reference(self, reference_lap=None):
+        """
+        Running delta time of every lap against reference_lap (the fastest lap by default) in one broadcast
+
+        Returns an (n_laps, n_grid) array
+        """
+        if reference_lap is None:
+            reference_lap = self.fastest_lap()
+        return self.elapsed - self.elapsed[reference_lap]
+
+
+def align_laps(sessions, reference, start_lat, start_lon, grid_step=1.0, channels=DEFAULT_CHANNELS, gate_radius=15.0):
+    """
+    Splits every session into laps and resamples each one onto a distance grid along the reference line
+
+    sessions is a list of (label, logs) pairs, where logs maps 'imu', 'gps' and 'car' to pandas DataFrames holding
+    the columns written by Vehicle.__init__
+    """
+    grid = np.arange(0.0, reference.length, grid_step)
+
+    labels = []
+    elapsed_rows = []
+    channel_rows = {name: [] for name in channels}
+
+    for label, logs in sessions:
+        gps = logs["gps"]
+        gps_time = gps["Time"].to_numpy(dtype=np.float64)
+        lat = gps["Lat"].to_numpy(dtype=np.float64)
+        lon = gps["Lon"].to_numpy(dtype=np.float64)
+
+        crossings = split_laps(gps_time, lat, lon, start_lat, start_lon, gate_radius)
+
+        for lap_number, (lap_start, lap_end) in enumerate(zip(crossings[:-1], crossings[1:])):
+            times, dist = lap_distance(reference, gps_time, lat, lon, lap_start, lap_end)
+            grid_times = time_on_grid(times, dist, grid)
+
+            labels.append(f"{label} lap {lap_number+1}")
+            # timed from the crossing, as a lap missing the fixes around the start/finish has no time at grid 0
+            elapsed_rows.append(grid_times - lap_start)
+
+            for name, (log, column) in channels.items():
+                frame = logs[log]
+                channel_rows[name].append(resample_channel(grid_times,
+                                                           frame["Time"].to_numpy(dtype=np.float64),
+                                                           frame[column].to_numpy(dtype=np.float64)))
+
+    elapsed = np.array(elapsed_rows).reshape(len(labels), len(grid))
+    channel_arrays = {name: np.array(rows).reshape(len(labels), len(grid)) for name, rows in channel_rows.items()}
+
+    return LapSet(reference, grid, labels, elapsed, channel_arrays)
+
+
+def reference_from_lap(gps, start_lat, start_lon, lap_index=0, gate_radius=15.0):
+    """
+    Builds a reference line from one lap of a session's GPS log
+    """
+    gps_time = gps["Time"].to_numpy(dtype=np.float64)
+    lat = gps["Lat"].to_numpy(dtype=np.float64)
+    lon = gps["Lon"].to_numpy(dtype=np.float64)
+
+    crossings = split_laps(gps_time, lat, lon, start_lat, start_lon, gate_radius)
+    if len(crossings) < lap_index + 2:
+        raise ValueError(f"Session only has {max(len(crossings)-1, 0)} complete laps")
+
+    mask = (gps_time >= crossings[lap_index]) & (gps_time <= crossings[lap_index+1])
+    return ReferenceLine(lat[mask], lon[mask])
+
+
+# if this script is called directly, plot the delta time of every lap in the given sessions against the fastest one
+if __name__ == "__main__":
+    import sys
+
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    if len(sys.argv) < 2:
+        print("Usage: python lap_alignment.py <log folder> [<log folder> ...]")
+        sys.exit(1)
+
+    sessions = []
+    for folder in sys.argv[1:]:
+        logs = {name: pd.read_csv(f"{folder}/{name}.csv").sort_values("Time") for name in ("imu", "gps", "car")}
+        sessions.append((folder, logs))
+
+    # use the first GPS fix of the first session as the start/finish point, and its first lap as the reference line
+    first_gps = sessions[0][1]["gps"]
+    start_lat, start_lon = first_gps["Lat"].iloc[0], first_gps["Lon"].iloc[0]
+    reference = reference_from_lap(first_gps, start_lat, start_lon)
+
+    laps = align_laps(sessions, reference, start_lat, start_lon)
+    deltas = laps.compare_to_reference()
+    best = laps.fastest_lap()
+
+    fig, (ax_delta, ax_ydot) = plt.subplots(2, 1, sharex=True)
+    for i, label in enumerate(laps.labels):
+        ax_delta.plot(laps.grid, deltas[i], label=label)
+        ax_ydot.plot(laps.grid, laps.channels["Y dot"][i])
+
+    ax_delta.set_ylabel(f"Delta to {laps.labels[best]} (s)")
+    ax_ydot.set_ylabel("Y dot")
+    ax_ydot.set_xlabel("Distance (m)")
+    ax_delta.legend()
+
+    plt.show()
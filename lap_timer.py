@@ -0,0 +1,184 @@
+import math
+
+from lap_alignment import EARTH_RADIUS
+
+# width of a start/finish line dropped at the car's position from the dashboard, in meters
+DEFAULT_LINE_WIDTH = 40.0
+
+
+class TimingLine:
+    """
+    A start/finish or sector line between two GPS points
+
+    The points are converted once into a flat local coordinate system (meters east/north of the line's midpoint), so
+    checking whether the car crossed it between two fixes is a handful of multiplications
+    """
+
+    def __init__(self, name, lat_1, lon_1, lat_2, lon_2):
+        self.name = name
+        self.lat0 = (lat_1 + lat_2)/2
+        self.lon0 = (lon_1 + lon_2)/2
+        self.meters_per_deg_lat = EARTH_RADIUS*math.pi/180
+        self.meters_per_deg_lon = self.meters_per_deg_lat*math.cos(math.radians(self.lat0))
+
+        self.x1, self.y1 = self.to_local(lat_1, lon_1)
+        self.x2, self.y2 = self.to_local(lat_2, lon_2)
+
+    @classmethod
+    def across(cls, name, lat, lon, heading, width=DEFAULT_LINE_WIDTH):
+        """
+        Creates a line of the given width centered on (lat, lon), perpendicular to heading (degrees from north)
+        """
+        meters_per_deg_lat = EARTH_RADIUS*math.pi/180
+        meters_per_deg_lon = meters_per_deg_lat*math.cos(math.radians(lat))
+
+        # the line runs along heading + 90 degrees, half of the width either side of the car
+        angle = math.radians(heading + 90)
+        d_north = math.cos(angle)*width/2
+        d_east = math.sin(angle)*width/2
+
+        return cls(name,
+                   lat + d_north/meters_per_deg_lat, lon + d_east/meters_per_deg_lon,
+                   lat - d_north/meters_per_deg_lat, lon - d_east/meters_per_deg_lon)
+
+    def to_local(self, lat, lon):
+        return (lon - self.lon0)*self.meters_per_deg_lon, (lat - self.lat0)*self.meters_per_deg_lat
+
+    def crossing_fraction(self, previous, current):
+        """
+        Returns how far (0 to 1) along the path from previous to current (local x, y tuples) the line was crossed,
+        or None if the path does not cross the line
+        """
+        px, py = previous
+        cx, cy = current
+        dx, dy = cx - px, cy - py
+        lx, ly = self.x2 - self.x1, self.y2 - self.y1
+
+        denominator = dx*ly - dy*lx
+        if denominator == 0:
+            # the car moved parallel to the line (or didn't move)
+            return None
+
+        # solve previous + t*(current - previous) = line start + u*(line end - line start)
+        t = ((self.x1 - px)*ly - (self.y1 - py)*lx)/denominator
+        u = ((self.x1 - px)*dy - (self.y1 - py)*dx)/denominator
+
+        if 0 <= t <= 1 and 0 <= u <= 1:
+            return t
+        return None
+
+
+class LapTimer:
+    """
+    Incremental lap and sector timer, fed one GPS fix at a time
+
+    Each fix only tests the segment from the previous fix against the start/finish line and the sector lines, so the
+    work per fix is constant no matter how long the session has run. Sector splits are measured from the start of the
+    lap, and the live delta is the difference to the best lap at the most recent line crossed.
+    """
+
+    def __init__(self, start_finish=None, sectors=None, min_lap_time=20.0):
+        # ignore start/finish crossings closer together than this, so GPS jitter on the line doesn't count as a lap
+        self.min_lap_time = min_lap_time
+        self.set_lines(start_finish, sectors)
+
+    def set_lines(self, start_finish, sectors=None):
+        """
+        Sets (or replaces) the timing lines, which resets all of the timing
+        """
+        self.start_finish = start_finish
+        self.sectors = list(sectors) if sectors else []
+
+        self.previous_fix = None   # (time, lat, lon) of the last fix
+        self.lap_start = None      # time the current lap started, None until the first start/finish crossing
+        self.lap_number = 0
+
+        self.current_splits = []   # split times of the current lap, from the start of the lap
+        self.last_lap = None
+        self.last_splits = []
+        self.best_lap = None
+        self.best_splits = []
+        self.delta = None          # current lap minus best lap, at the last line crossed
+
+    @property
+    def configured(self):
+        return self.start_finish is not None
+
+    def add_fix(self, t, lat, lon):
+        """
+        Processes a new GPS fix, returns the name of the line crossed (if any)
+        """
+        if not self.configured:
+            return None
+
+        previous_fix = self.previous_fix
+        self.previous_fix = (t, lat, lon)
+        if previous_fix is None:
+            return None
+
+        pt, plat, plon = previous_fix
+
+        # sector lines only matter once a lap is running, and only the next sector in order can be crossed
+        if self.lap_start is not None and len(self.current_splits) < len(self.sectors):
+            line = self.sectors[len(self.current_splits)]
+            fraction = line.crossing_fraction(line.to_local(plat, plon), line.to_local(lat, lon))
+            if fraction is not None:
+                split = pt + fraction*(t - pt) - self.lap_start
+                self.current_splits.append(split)
+                self.update_delta(split, len(self.current_splits) - 1)
+                return line.name
+
+        line = self.start_finish
+        fraction = line.crossing_fraction(line.to_local(plat, plon), line.to_local(lat, lon))
+        if fraction is None:
+            return None
+
+        crossing_time = pt + fraction*(t - pt)
+        if self.lap_start is not None:
+            lap_time = crossing_time - self.lap_start
+            if lap_time < self.min_lap_time:
+                return None
+            self.complete_lap(lap_time)
+
+        self.lap_start = crossing_time
+        self.lap_number += 1
+        self.current_splits = []
+        return line.name
+
+    def complete_lap(self, lap_time):
+        self.last_lap = lap_time
+        self.last_splits = self.current_splits
+
+        # the delta at the finish line is the full lap difference
+        if self.best_lap is not None:
+            self.delta = lap_time - self.best_lap
+
+        # only laps that crossed every sector are complete enough to be the best lap
+        if (self.best_lap is None or lap_time < self.best_lap) and len(self.current_splits) == len(self.sectors):
+            self.best_lap = lap_time
+            self.best_splits = self.current_splits
+
+    def update_delta(self, split, sector):
+        if sector < len(self.best_splits):
+            self.delta = split - self.best_splits[sector]
+
+    def current_lap_time(self, now):
+        if self.lap_start is None:
+            return None
+        return now - self.lap_start
+
+
+def format_lap_time(seconds):
+    """
+    Formats a lap time as m:ss.s, or '--' if there isn't one
+    """
+    if seconds is None:
+        return "--"
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes)}:{seconds:04.1f}"
+
+
+def format_delta(seconds):
+    if seconds is None:
+        return "--"
+    return f"{seconds:+.2f}"
@@ -0,0 +1,209 @@
+"""
+Multi-resolution tile pyramids of the map images, built in the background and cached on disk
+
+Each map image is halved again and again until it fits the un-zoomed map on screen, and every level is cut into
+TILE_SIZE tiles saved as PNGs under maps/pyramid/<hash of the image file>/<level>/<row>_<column>.png, with a pyramid.json
+manifest of the levels' sizes. Keying the folder on the file's contents means a map replaced by a better screenshot gets a
+new pyramid, and an unchanged one is never built again.
+
+The map view (map_view.py) then shows the coarsest level that still has a pixel for every pixel on screen at the current
+zoom, and only the tiles of it that are in view, so a high resolution satellite image of a large circuit costs about the
+same to pan and zoom around as a small one. The coarsest level is always shown underneath, so there is never a gap while
+the finer tiles are decoded.
+
+    python map_pyramid.py
+    python map_pyramid.py --force
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PySide6.QtCore import QObject, Qt, Signal
+from PySide6.QtGui import QImage
+
+PYRAMID_FOLDER = Path("./maps/pyramid")
+MANIFEST_NAME = "pyramid.json"
+TILE_SIZE = 512
+# halving stops once a level is no wider than this, the width of the un-zoomed map on screen
+COARSEST_WIDTH = 950
+
+
+def file_hash(path):
+    """
+    SHA-1 of a file's contents, read in blocks
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        while block := file.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(folder):
+    """
+    The manifest of a finished pyramid, or None if there isn't one
+    """
+    manifest = Path(folder) / MANIFEST_NAME
+    if not manifest.exists():
+        return None
+    with open(manifest) as file:
+        return json.load(file)
+
+
+def tile_path(folder, level, row, column):
+    return Path(folder) / str(level) / f"{row}_{column}.png"
+
+
+def build_pyramid(image_path, folder, coarsest_width=COARSEST_WIDTH):
+    """
+    Builds the levels and tiles of one image into folder and returns its manifest
+
+    Safe to run on a worker thread, it only uses QImage
+    """
+    image = QImage(str(image_path))
+    if image.isNull():
+        raise ValueError(f"Could not load image {image_path}")
+
+    # build into a temporary folder and swap it in at the end, so a reader never sees a half built pyramid
+    folder = Path(folder)
+    building = folder.with_name(folder.name + ".building")
+    shutil.rmtree(building, ignore_errors=True)
+
+    levels = []
+    while True:
+        width, height = image.width(), image.height()
+        rows, columns = math.ceil(height/TILE_SIZE), math.ceil(width/TILE_SIZE)
+        (building / str(len(levels))).mkdir(parents=True)
+        for row in range(rows):
+            for column in range(columns):
+                tile = image.copy(column*TILE_SIZE, row*TILE_SIZE,
+                                  min(TILE_SIZE, width - column*TILE_SIZE), min(TILE_SIZE, height - row*TILE_SIZE))
+                tile.save(str(tile_path(building, len(levels), row, column)))
+        levels.append({"width": width, "height": height, "rows": rows, "columns": columns})
+
+        if width <= coarsest_width:
+            break
+        # smooth scaling by exactly half averages each 2x2 block of pixels
+        image = image.scaled(max(width//2, 1), max(height//2, 1), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    manifest = {"source": str(image_path), "tile_size": TILE_SIZE, "levels": levels}
+    with open(building / MANIFEST_NAME, "w") as file:
+        json.dump(manifest, file)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(building, folder)
+    return manifest
+
+
+def prepare_pyramid(image_path, force=False):
+    """
+    The manifest of an image's pyramid, built first if it isn't cached, with the pyramid's folder added as "folder"
+    """
+    folder = PYRAMID_FOLDER / file_hash(image_path)
+    manifest = None if force else load_manifest(folder)
+    if manifest is None:
+        print(f"Building map pyramid for {image_path}")
+        manifest = build_pyramid(image_path, folder)
+    manifest["folder"] = str(folder)
+    return manifest
+
+
+def level_for(manifest, zoom_factor, view_width=COARSEST_WIDTH):
+    """
+    The coarsest level with (nearly) a pixel for every pixel on screen, with the given fraction of the map's width in a
+    view view_width pixels wide
+    """
+    needed = view_width/zoom_factor
+    chosen = 0
+    for index, level in enumerate(manifest["levels"]):
+        # a little short of a pixel each is close enough, rather than reading a level with four times the pixels
+        if level["width"] >= needed*0.9:
+            chosen = index
+    return chosen
+
+
+class MapPyramids(QObject):
+    """
+    Pyramids of the map images, hashed, loaded or built one at a time on a background thread
+
+    ready is emitted on the GUI thread with the image path and its manifest once a pyramid can be used
+    """
+
+    # emitted from the worker thread, delivered on the GUI thread
+    ready = Signal(str, object)
+
+    def __init__(self):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="map-pyramid")
+        self.manifests = {}
+        self.pending = set()
+        self.ready.connect(self.store)
+
+    def build(self, paths):
+        """
+        Starts preparing the pyramids of the images that aren't ready or already being prepared, in the order given
+        """
+        for path in paths:
+            path = str(path)
+            if path in self.manifests or path in self.pending or not os.path.exists(path):
+                continue
+            self.pending.add(path)
+            self.executor.submit(self.prepare, path)
+
+    def prepare(self, path):
+        # runs on the worker thread
+        try:
+            manifest = prepare_pyramid(path)
+        except Exception as error:
+            print(f"Could not build map pyramid for {path}: {error}")
+            manifest = None
+        self.ready.emit(path, manifest)
+
+    def store(self, path, manifest):
+        self.pending.discard(path)
+        # a map that couldn't be built is left to the full image, and not tried again
+        self.manifests[path] = manifest
+
+    def get(self, path):
+        """
+        The manifest of an image's pyramid, or None while it is being prepared (or if it couldn't be)
+        """
+        return self.manifests.get(str(path))
+
+
+_pyramids = None
+
+
+def map_pyramids():
+    """
+    The application's map pyramids, made on first use since the signal needs the QApplication to exist
+    """
+    global _pyramids
+    if _pyramids is None:
+        _pyramids = MapPyramids()
+    return _pyramids
+
+
+# if this script is called directly, build (or check) the pyramid of every map in maps/locations.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the tile pyramids of the map images")
+    parser.add_argument("--force", action="store_true", help="rebuild pyramids that are already cached")
+    args = parser.parse_args()
+
+    with open("./maps/locations.csv", newline="") as csvfile:
+        for row in csv.reader(csvfile):
+            if not row or row[0] == "Name":
+                continue
+            path = Path("./maps") / row[1]
+            if not path.exists():
+                print(f"{path} is missing")
+                continue
+            manifest = prepare_pyramid(path, force=args.force)
+            sizes = ", ".join(f"{level['width']}x{level['height']}" for level in manifest["levels"])
+            print(f"{row[0]}: {manifest['folder']} ({sizes})")
@@ -0,0 +1,545 @@
+"""
+The GPS map as a QGraphicsScene, with each layer of the map its own item
+
+The map image, the session's track, the heatmap, the car marker, the compass and the lap progress bar are separate items,
+and each keeps its own cached drawing (QGraphicsItem.setCacheMode). A new fix only invalidates the items it changes: the car
+marker moves, the unsimplified end of the track grows, the compass arrow turns, and everything else is copied from its cache.
+Panning (dragging, or the arrow buttons) and zooming (the mouse wheel, or the +/- buttons) change the view's transform
+instead of cropping and scaling the map image again.
+
+The scene is the un-zoomed map, map_dimensions (950 x 594) units across whatever the image's resolution, and positions are
+placed on it linearly between the map's corners from maps/locations.csv, as they always have been.
+"""
+import math
+import time
+
+from PySide6.QtCore import Qt, QPoint, QPointF, QRectF
+from PySide6.QtGui import QColor, QImage, QPen, QPixmap, QPolygonF, QTransform
+from PySide6.QtWidgets import QFrame, QGraphicsEllipseItem, QGraphicsItem, QGraphicsPixmapItem, QGraphicsScene, QGraphicsView
+
+from image_cache import image_cache
+from map_pyramid import level_for, tile_path
+from profiler import PROFILER, profiled
+
+# length of a degree of latitude (and of longitude at the equator), for the scale of the map
+METRES_PER_DEGREE = 111195.0
+# seconds between redrawing the heatmap for new samples
+HEATMAP_REFRESH = 1.0
+# the furthest the map can be zoomed in, as the fraction of the map's width in view
+MIN_ZOOM_FACTOR = 0.1
+# scene units around the end of the track for the width of its line
+TAIL_MARGIN = 4
+
+
+def track_pen():
+    # cosmetic, so the line stays 3 pixels wide at any zoom
+    pen = QPen(QColor(255,0,0), 3)
+    pen.setCosmetic(True)
+    return pen
+
+
+class TrackItem(QGraphicsItem):
+    """
+    The finished chunks of the session's track (see TrackStore), at the level of detail for the view's zoom
+
+    Only redrawn when a chunk is finished (every CHUNK fixes) or the zoom changes, the fixes since are drawn by TailItem
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.track = None
+        self.chunks = 0
+        self.pen = track_pen()
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        # for the exposed rectangle, so the chunks out of view are skipped
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return self.view.sceneRect().adjusted(-TAIL_MARGIN, -TAIL_MARGIN, TAIL_MARGIN, TAIL_MARGIN)
+
+    def set_track(self, track):
+        chunks = len(track.levels[0])
+        if track is not self.track or chunks != self.chunks:
+            self.track = track
+            self.chunks = chunks
+            self.update()
+
+    @profiled("map track")
+    def paint(self, painter, option, widget=None):
+        if self.track is None or self.view.corners is None:
+            return
+        # the view's scale, which is also what the cached drawing is made at
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        metres_per_pixel = self.view.metres_per_unit()/scale
+
+        painter.setPen(self.pen)
+        for line in self.track.polylines(metres_per_pixel, self.view.scene_bounds(option.exposedRect), tail=False):
+            painter.drawPolyline(self.view.polygon(line))
+
+
+class TailItem(QGraphicsItem):
+    """
+    The fixes of the track since its last finished chunk, as they arrive
+
+    Its bounding rectangle is kept to the fixes it has, so a new fix only repaints that small part of the view
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.track = None
+        self.count = 0
+        self.line = QPolygonF()
+        self.rect = QRectF()
+        self.pen = track_pen()
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+    def boundingRect(self):
+        return self.rect
+
+    def set_track(self, track):
+        count = len(track)
+        if track is self.track and count == self.count:
+            return
+        self.track = track
+        self.count = count
+
+        self.prepareGeometryChange()
+        tail = track.tail()
+        if len(tail) >= 2 and self.view.corners is not None:
+            self.line = self.view.polygon(tail)
+            self.rect = self.line.boundingRect().adjusted(-TAIL_MARGIN, -TAIL_MARGIN, TAIL_MARGIN, TAIL_MARGIN)
+        else:
+            self.line = QPolygonF()
+            self.rect = QRectF()
+        self.update()
+
+    def paint(self, painter, option, widget=None):
+        painter.setPen(self.pen)
+        painter.drawPolyline(self.line)
+
+
+class HeatmapItem(QGraphicsPixmapItem):
+    """
+    The selected channel of a Heatmap, one pixel per cell stretched over the map with no smoothing
+
+    The colours are only worked out again when the channel or heatmap changes, or at most every HEATMAP_REFRESH seconds
+    while new samples are coming in
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.key = None
+        self.version = None
+        self.drawn = 0.0
+        self.setTransformationMode(Qt.FastTransformation)
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+    def set_heatmap(self, heatmap, channel, size):
+        if heatmap is None or channel is None:
+            self.key = None
+            self.hide()
+            return
+
+        key = (id(heatmap), channel)
+        now = time.time()
+        if key == self.key and (self.version == heatmap.version or now - self.drawn < HEATMAP_REFRESH):
+            return
+
+        self.version = heatmap.version
+        self.key = key
+        self.drawn = now
+        colors = heatmap.colors(channel)
+        image = QImage(colors.data, heatmap.columns, heatmap.rows, heatmap.columns*4, QImage.Format_RGBA8888)
+        # fromImage copies the pixels, so the array can go
+        self.setPixmap(QPixmap.fromImage(image))
+        self.setTransform(QTransform.fromScale(size[0]/heatmap.columns, size[1]/heatmap.rows))
+        self.show()
+
+
+class CompassItem(QGraphicsItem):
+    """
+    The compass in the top left corner of the view, its arrow (a child item) turned to the car's heading
+
+    Both ignore the view's transform, and the ring is only ever drawn once. The arrow is cached in its own coordinates, so
+    turning it only redraws the cached image rotated
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.arrow = CompassArrowItem(self)
+        self.arrow.setPos(50, 50)
+
+    def boundingRect(self):
+        return QRectF(0, 0, 100, 100)
+
+    def set_heading(self, heading):
+        # the arrow is drawn pointing up, and turned anticlockwise by the heading as the map always has been
+        self.arrow.setRotation(-heading)
+
+    def paint(self, painter, option, widget=None):
+        # a thicker black background for the white compass
+        for color, width in ((QColor(0,0,0), 8), (QColor(255,255,255), 2.5)):
+            pen = QPen(color)
+            pen.setWidthF(width)
+            painter.setPen(pen)
+            painter.drawEllipse(10, 10, 80, 80)
+
+            # this is to add some decoration to the circle in each cardinal direction
+            painter.drawLine(QPoint(50,95), QPoint(50,85))
+            painter.drawLine(QPoint(95,50), QPoint(85,50))
+            painter.drawLine(QPoint(5,50), QPoint(15,50))
+            painter.drawLine(QPoint(50,5), QPoint(50,15))
+        # change the color to red to indicate this direction is north
+        pen.setColor(QColor(2,0,0))
+        painter.setPen(pen)
+        painter.drawLine(QPoint(50,5), QPoint(50,15))
+
+
+class CompassArrowItem(QGraphicsItem):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setCacheMode(QGraphicsItem.ItemCoordinateCache)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+
+    def boundingRect(self):
+        return QRectF(-40, -40, 80, 80)
+
+    def paint(self, painter, option, widget=None):
+        tip, tail = QPointF(0, -35), QPointF(0, 35)
+        left, right = QPointF(-5, -20), QPointF(5, -20)
+        for color, width in ((QColor(0,0,0), 8), (QColor(255,255,255), 2.5)):
+            pen = QPen(color)
+            pen.setWidthF(width)
+            painter.setPen(pen)
+            painter.drawLine(tip, tail)
+            painter.drawLine(tip, left)
+            painter.drawLine(tip, right)
+
+
+class ProgressItem(QGraphicsItem):
+    """
+    The lap progress bar along the bottom of the view, for tracks with a reference centerline
+    """
+
+    def __init__(self, dimensions):
+        super().__init__()
+        self.width, self.height = dimensions
+        self.fraction = None
+        self.distance = None
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.hide()
+
+    def boundingRect(self):
+        return QRectF(0, self.height - 40, self.width, 40)
+
+    def set_progress(self, fraction, distance):
+        if fraction is None:
+            self.hide()
+            return
+        self.show()
+        # redrawn when the bar or its text would change
+        if self.fraction is None or round(fraction*100) != round(self.fraction*100) or \
+                round(distance) != round(self.distance) or int((self.width - 20)*fraction) != int((self.width - 20)*self.fraction):
+            self.fraction = fraction
+            self.distance = distance
+            self.update()
+
+    def paint(self, painter, option, widget=None):
+        if self.fraction is None:
+            return
+        bar_height = 10
+        bar_top = self.height - bar_height - 10
+        bar_width = self.width - 20
+
+        painter.setPen(QPen(QColor(0,0,0), 2))
+        painter.drawRect(10, bar_top, bar_width, bar_height)
+        painter.fillRect(10, bar_top, int(bar_width*self.fraction), bar_height, QColor(255,0,0))
+        painter.drawText(10, bar_top - 4, 'Lap progress: {:.0f}%  ({:.0f} m)'.format(self.fraction*100, self.distance))
+
+
+class MapView(QGraphicsView):
+    """
+    The map and everything drawn on it, see the top of this file
+
+    Initiated with the size of the map in pixels when it isn't zoomed, which is also the size of the scene. Map images are
+    stretched to fill the scene, so maps must have an aspect ratio of 8:5
+    """
+
+    def __init__(self, dimensions=(950, 594)):
+        super().__init__()
+        self.dimensions = dimensions
+        # the map image's pyramid (see map_pyramid.py), its level for the current zoom, and the tiles of it in the scene as
+        # {(level, row, column): (item, path)}
+        self.pyramid = None
+        self.level = None
+        self.tiles = {}
+        # parented to the view, or it would be garbage collected
+        self.setScene(QGraphicsScene(0, 0, *dimensions, self))
+        # (top lat, left lon, bottom lat, right lon) of the map shown, and the image of it
+        self.corners = None
+        self.map_pixmap = None
+
+        self.setFixedSize(*dimensions)
+        self.setFrameShape(QFrame.NoFrame)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        # the map only changes where an item has, so only those parts are repainted
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setOptimizationFlag(QGraphicsView.DontSavePainterState)
+
+        # the layers, from the bottom up
+        self.base = QGraphicsPixmapItem()
+        self.base.setTransformationMode(Qt.SmoothTransformation)
+        self.base.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self.track = TrackItem(self)
+        self.tail = TailItem(self)
+        self.heatmap = HeatmapItem()
+        self.car = QGraphicsEllipseItem(-8, -8, 16, 16)
+        self.car.setPen(QPen(QColor(255,0,0), 4))
+        self.car.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.car.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self.car.hide()
+        self.compass = CompassItem()
+        self.progress = ProgressItem(dimensions)
+        for z, item in enumerate((self.base, self.track, self.tail, self.heatmap, self.car, self.compass, self.progress)):
+            item.setZValue(z)
+            self.scene().addItem(item)
+        self.place_overlays()
+
+    # -------------------------------------------------------------------------
+    #
+    # what is shown
+    #
+    # -------------------------------------------------------------------------
+
+    def set_map(self, corners, pixmap=None, pyramid=None):
+        """
+        Shows a map covering the given corners, from the tiles of its pyramid's manifest, or failing that from the whole
+        image as a pixmap (None while the image is still being decoded)
+        """
+        corners = tuple(corners)
+        if corners != self.corners:
+            self.corners = corners
+            self.map_pixmap = None
+            self.base.setPixmap(QPixmap())
+            self.set_pyramid(None)
+            # everything placed by latitude and longitude has to be placed again
+            self.track.track = None
+            self.tail.track = None
+            self.heatmap.key = None
+
+        if pyramid is not None:
+            if pyramid is not self.pyramid:
+                self.map_pixmap = None
+                self.base.setPixmap(QPixmap())
+                self.set_pyramid(pyramid)
+        elif pixmap is not None and pixmap is not self.map_pixmap:
+            self.map_pixmap = pixmap
+            self.base.setPixmap(pixmap)
+            self.base.setTransform(QTransform.fromScale(self.dimensions[0]/pixmap.width(),
+                                                        self.dimensions[1]/pixmap.height()))
+
+    def set_pyramid(self, pyramid):
+        self.remove_tiles(list(self.tiles))
+        self.pyramid = pyramid
+        self.level = None
+        self.update_tiles()
+
+    def update_tiles(self):
+        """
+        Adds the tiles in view of the pyramid level for the current zoom, and drops the ones panned away from and those of
+        the level before
+        """
+        if self.pyramid is None:
+            return
+        with PROFILER.stage("map tiles"):
+            coarsest = len(self.pyramid["levels"]) - 1
+            level = level_for(self.pyramid, self.zoom_factor(), self.viewport().width())
+            if level != self.level:
+                # the coarsest level stays, so there is something under the finer tiles while they are decoded
+                self.remove_tiles([key for key in self.tiles if key[0] not in (level, coarsest)])
+                self.level = level
+
+            self.add_tiles(coarsest, self.sceneRect())
+            if level != coarsest:
+                view = self.mapToScene(self.viewport().rect()).boundingRect()
+                # tiles within a tile of the view are kept, so panning back and forth over a tile's edge doesn't decode
+                # it again and again, and the tiles in memory stay bounded by the size of the view
+                width, height = self.tile_size(level)
+                kept = view.adjusted(-width, -height, width, height)
+                self.remove_tiles([key for key in self.tiles
+                                   if key[0] == level and not self.tile_rect(*key).intersects(kept)])
+                self.add_tiles(level, view)
+
+    def level_scale(self, level):
+        """
+        Pixels of a pyramid level per unit of the scene, (x, y)
+        """
+        size = self.pyramid["levels"][level]
+        return size["width"]/self.dimensions[0], size["height"]/self.dimensions[1]
+
+    def tile_size(self, level):
+        """
+        Size of a full tile of a level in the scene, (width, height)
+        """
+        x_scale, y_scale = self.level_scale(level)
+        tile_size = self.pyramid["tile_size"]
+        return tile_size/x_scale, tile_size/y_scale
+
+    def tile_rect(self, level, row, column):
+        """
+        The rectangle of the scene a tile covers (a full tile's, the last row and column may be smaller)
+        """
+        width, height = self.tile_size(level)
+        return QRectF(column*width, row*height, width, height)
+
+    def add_tiles(self, level, rect):
+        """
+        Adds the tiles of a level that cover a rectangle of the scene and aren't already there, each decoded in the
+        background and shown once it is ready
+        """
+        size = self.pyramid["levels"][level]
+        tile_size = self.pyramid["tile_size"]
+        # pixels of the level per unit of the scene
+        x_scale, y_scale = self.level_scale(level)
+
+        columns = range(max(int(rect.left()*x_scale//tile_size), 0),
+                        min(int(rect.right()*x_scale//tile_size), size["columns"] - 1) + 1)
+        rows = range(max(int(rect.top()*y_scale//tile_size), 0),
+                     min(int(rect.bottom()*y_scale//tile_size), size["rows"] - 1) + 1)
+        for row in rows:
+            for column in columns:
+                if (level, row, column) in self.tiles:
+                    continue
+                item = QGraphicsPixmapItem()
+                item.setTransformationMode(Qt.SmoothTransformation)
+                item.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+                item.setTransform(QTransform.fromScale(1/x_scale, 1/y_scale))
+                item.setPos(column*tile_size/x_scale, row*tile_size/y_scale)
+                # under everything else, and finer levels over coarser ones
+                item.setZValue(-1 - level)
+                self.scene().addItem(item)
+
+                path = str(tile_path(self.pyramid["folder"], level, row, column))
+                self.tiles[(level, row, column)] = (item, path)
+                image_cache().when_ready(path, item.setPixmap)
+
+    def remove_tiles(self, keys):
+        paths = []
+        for key in keys:
+            item, path = self.tiles.pop(key)
+            self.scene().removeItem(item)
+            paths.append(path)
+        # decoded again if the view comes back to them
+        image_cache().discard(paths)
+
+    def set_car(self, lat, lon):
+        x, y = self.to_scene(lat, lon)
+        self.car.setPos(x, y)
+        self.car.show()
+
+    # -------------------------------------------------------------------------
+    #
+    # coordinates
+    #
+    # -------------------------------------------------------------------------
+
+    def to_scene(self, lat, lon):
+        """
+        Scene coordinates (x, y) of a position, or of arrays of positions
+        """
+        top_lat, left_lon, bottom_lat, right_lon = self.corners
+        x = (lon - left_lon)*(self.dimensions[0]/(right_lon - left_lon))
+        y = (lat - top_lat)*(self.dimensions[1]/(bottom_lat - top_lat))
+        return x, y
+
+    def polygon(self, latlon):
+        """
+        A QPolygonF in scene coordinates from an (n, 2) array of lat, lon
+        """
+        xs, ys = self.to_scene(latlon[:, 0], latlon[:, 1])
+        return QPolygonF([QPointF(x, y) for x, y in zip(xs.tolist(), ys.tolist())])
+
+    def scene_bounds(self, rect):
+        """
+        (min lat, min lon, max lat, max lon) of a rectangle of the scene
+        """
+        top_lat, left_lon, bottom_lat, right_lon = self.corners
+        lats = (top_lat + rect.top()/self.dimensions[1]*(bottom_lat - top_lat),
+                top_lat + rect.bottom()/self.dimensions[1]*(bottom_lat - top_lat))
+        lons = (left_lon + rect.left()/self.dimensions[0]*(right_lon - left_lon),
+                left_lon + rect.right()/self.dimensions[0]*(right_lon - left_lon))
+        return min(lats), min(lons), max(lats), max(lons)
+
+    def metres_per_unit(self):
+        """
+        Metres across one unit of the scene (one pixel of the un-zoomed map)
+        """
+        top_lat, left_lon, bottom_lat, right_lon = self.corners
+        return abs(right_lon - left_lon)*METRES_PER_DEGREE*math.cos(math.radians((top_lat + bottom_lat)/2))/self.dimensions[0]
+
+    # -------------------------------------------------------------------------
+    #
+    # navigation
+    #
+    # -------------------------------------------------------------------------
+
+    def zoom_factor(self):
+        """
+        The fraction of the map's width in view, 1 when the whole map is shown
+        """
+        return 1/self.transform().m11()
+
+    def center(self):
+        """
+        The scene coordinates (x, y) at the middle of the view
+        """
+        center = self.mapToScene(self.viewport().rect().center())
+        return center.x(), center.y()
+
+    def set_zoom_factor(self, zoom_factor):
+        zoom_factor = min(max(zoom_factor, MIN_ZOOM_FACTOR), 1)
+        # anchored under the mouse when it is over the map, otherwise on the middle of the view
+        self.setTransform(QTransform.fromScale(1/zoom_factor, 1/zoom_factor))
+        self.place_overlays()
+        self.update_tiles()
+
+    def zoom(self, factor):
+        """
+        Multiplies the zoom factor, less than 1 zooms in
+        """
+        self.set_zoom_factor(self.zoom_factor()*factor)
+
+    def pan(self, dx, dy):
+        """
+        Moves the view by fractions of its width and height, stopping at the edges of the map
+        """
+        self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() + round(dx*self.viewport().width()))
+        self.verticalScrollBar().setValue(self.verticalScrollBar().value() + round(dy*self.viewport().height()))
+
+    def place_overlays(self):
+        # the compass and progress bar are drawn in the view's own pixels, from its top left corner
+        corner = self.mapToScene(QPoint(0, 0))
+        self.compass.setPos(corner)
+        self.progress.setPos(corner)
+
+    def wheelEvent(self, event):
+        # 10% a notch, the same as the buttons
+        notches = event.angleDelta().y()/120
+        if notches:
+            self.zoom(0.9**notches)
+        event.accept()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.place_overlays()
+        self.update_tiles()
@@ -0,0 +1,228 @@
+"""
+The car's telemetry messages, defined once in messages.csv
+
+Every field of every message is a row of the schema: the message's ID and name, the field's name (which is also the name
+of its channel and of the Vehicle attribute holding its latest value), its type, its offset in the frame (counted from
+the start byte, so the payload starts at 3, the same numbers the firmware copies into tx_buffer at), its unit and scale,
+the column it is logged under in <message>.csv, and the panel, label and format it is shown with in the flight view.
+A message with no fields (the heartbeat) is a row with the field left blank. Fields of type "derived" aren't sent by the
+car, they are channels of derived_channels.py listed only so they get a column in the message's log.
+
+From the schema the dashboard builds, once at startup, a precompiled struct decoder per message, the frame lengths the
+parser checks headers against, the raw channel groups the derived channels are evaluated over, the headers and columns of
+the csv logs, and the flight view's labels. Adding a sensor is then a row here, a memcpy in the firmware, and nothing else.
+
+The firmware's offsets can be generated from the same file, so the two ends can't disagree about the layout:
+
+    python message_schema.py
+    python message_schema.py --header "Lemons Telemetry Computer/src/telemetry_messages.h"
+"""
+import argparse
+import csv
+import struct
+from pathlib import Path
+
+SCHEMA_PATH = Path(__file__).with_name("messages.csv")
+
+# the start byte, length and ID come before the payload, and the two checksum bytes after it
+PAYLOAD_START = 3
+FRAME_OVERHEAD = 5
+
+# struct format characters of the field types, everything on the ESP32 is little endian
+FIELD_TYPES = {
+    'uint8': 'B', 'int8': 'b', 'uint16': 'H', 'int16': 'h', 'uint32': 'I', 'int32': 'i',
+    'float32': 'f', 'float64': 'd',
+}
+DERIVED = 'derived'
+
+
+class Field:
+    """
+    One field of a message, or with type "derived" a derived channel logged alongside the message
+    """
+
+    def __init__(self, name, type, offset=None, unit="", scale=1.0, log=None, panel=None, label=None, format=None):
+        if type != DERIVED and type not in FIELD_TYPES:
+            raise ValueError(f"Field {name}: unknown type '{type}'")
+        if type != DERIVED and offset is None:
+            raise ValueError(f"Field {name}: needs an offset")
+
+        self.name = name
+        self.type = type
+        self.offset = offset
+        self.unit = unit
+        self.scale = scale
+        # column of the message's log, None if it isn't logged
+        self.log = log
+        # flight view panel and label it is shown with, None if it isn't shown
+        self.panel = panel
+        self.label = label
+        self.format = format or "{}"
+
+    @property
+    def derived(self):
+        return self.type == DERIVED
+
+    @property
+    def size(self):
+        return 0 if self.derived else struct.calcsize(FIELD_TYPES[self.type])
+
+
+class Message:
+    """
+    A message ID and its fields, in the order of the schema (which is the order they are logged and shown in)
+
+    decode() unpacks a whole frame's payload with one precompiled struct, returning the values in the order of names
+    """
+
+    def __init__(self, id, name, fields=None):
+        self.id = id
+        self.name = name
+        self.fields = list(fields or [])
+        self.time_channel = f"{name}_time"
+
+        # the fields the car sends, in the order they are in the payload
+        sent = sorted((field for field in self.fields if not field.derived), key=lambda field: field.offset)
+        layout = '<'
+        position = PAYLOAD_START
+        for field in sent:
+            if field.offset < position:
+                raise ValueError(f"Message {name}: field {field.name} at {field.offset} overlaps the field before it")
+            # padding for any bytes nothing is defined in
+            layout += 'x'*(field.offset - position) + FIELD_TYPES[field.type]
+            position = field.offset + field.size
+
+        self.struct = struct.Struct(layout)
+        self.names = tuple(field.name for field in sent)
+        self.payload_length = position - PAYLOAD_START
+        self.frame_length = self.payload_length + FRAME_OVERHEAD
+        # (index, scale) of the values that aren't sent in their final units
+        self.scales = [(i, field.scale) for i, field in enumerate(sent) if field.scale != 1.0]
+
+    def decode(self, frame):
+        values = self.struct.unpack_from(frame, PAYLOAD_START)
+        if self.scales:
+            values = list(values)
+            for i, scale in self.scales:
+                values[i] *= scale
+        return values
+
+    def log_columns(self):
+        """
+        {column: channel} of the message's log, time first, empty if the message isn't logged
+        """
+        columns = {field.log: field.name for field in self.fields if field.log}
+        if not columns:
+            return {}
+        return {'Time': self.time_channel, **columns}
+
+
+class MessageSchema:
+    """
+    Every message the car sends, by ID
+    """
+
+    def __init__(self, messages):
+        self.messages = {message.id: message for message in messages}
+        self.by_name = {message.name: message for message in messages}
+
+    @classmethod
+    def from_file(cls, path=SCHEMA_PATH):
+        """
+        Loads the schema from a .csv file, in the same style as alerts.csv
+        """
+        messages = {}
+        with open(path, newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                # ID, Message, Field, Type, Offset, Unit, Scale, Log, Panel, Label, Format
+                id = int(row['ID'], 0)
+                name, fields = messages.setdefault(id, (row['Message'], []))
+                if row['Message'] != name:
+                    raise ValueError(f"Message {id:#04x} is called both {name} and {row['Message']}")
+                if not row['Field']:
+                    continue
+                fields.append(Field(row['Field'], row['Type'], int(row['Offset'], 0) if row['Offset'] else None,
+                                    row['Unit'], float(row['Scale'] or 1), row['Log'] or None, row['Panel'] or None,
+                                    row['Label'] or None, row['Format'] or None))
+
+        return cls([Message(id, name, fields) for id, (name, fields) in messages.items()])
+
+    def frame_lengths(self):
+        """
+        {ID: total length of the frame}
+        """
+        return {id: message.frame_length for id, message in self.messages.items()}
+
+    def names(self):
+        return {id: message.name for id, message in self.messages.items()}
+
+    def fields(self):
+        """
+        Every field the car sends, across all the messages
+        """
+        return [field for message in self.messages.values() for field in message.fields if not field.derived]
+
+    def raw_channels(self):
+        """
+        {message: (time channel, *decoded channels)} of every message with fields, in the order decode() returns them
+        """
+        return {message.name: (message.time_channel, *message.names)
+                for message in self.messages.values() if message.names}
+
+    def log_channels(self):
+        """
+        {message: {column: channel}} of every message that is logged
+        """
+        return {message.name: columns for message in self.messages.values() if (columns := message.log_columns())}
+
+    def panel(self, panel):
+        """
+        The fields shown in a panel of the flight view, in order
+        """
+        return [field for field in self.fields() if field.panel == panel and field.label]
+
+    def bindings(self):
+        """
+        (channel, formatter) of every field shown in the flight view, the formatter being the bound format method
+        """
+        return [(field.name, field.format.format) for field in self.fields() if field.panel and field.label]
+
+    def c_header(self):
+        """
+        The schema as C #defines of the message IDs, payload lengths and field offsets, for the firmware
+        """
+        lines = ["// generated from messages.csv by message_schema.py, don't edit by hand", "",
+                 "#ifndef telemetry_messages_h", "#define telemetry_messages_h", ""]
+        for message in self.messages.values():
+            prefix = message.name.upper()
+            lines.append(f"#define MSG_{prefix} {message.id:#04x}")
+            lines.append(f"#define MSG_{prefix}_LENGTH {message.payload_length}")
+            for field in message.fields:
+                if not field.derived:
+                    unit = f", {field.unit}" if field.unit else ""
+                    lines.append(f"#define {prefix}_{field.name.upper()} {field.offset} // {field.type}{unit}")
+            lines.append("")
+        lines.append("#endif")
+        return "\n".join(lines) + "\n"
+
+
+# the schema of the messages, loaded once when first imported
+SCHEMA = MessageSchema.from_file()
+
+
+# if this script is called directly, print the layout of every message (or write it out for the firmware)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the telemetry message layouts, or write them as a C header")
+    parser.add_argument("--header", help="write the #defines for the firmware to this file")
+    args = parser.parse_args()
+
+    if args.header:
+        with open(args.header, 'w') as file:
+            file.write(SCHEMA.c_header())
+        print(f"Wrote {args.header}")
+    else:
+        for message in SCHEMA.messages.values():
+            print(f"{message.id:#04x} {message.name}: {message.frame_length} bytes, struct '{message.struct.format}'")
+            for field in message.fields:
+                offset = "" if field.derived else field.offset
+                print(f"    {field.name:<26}{field.type:<9}{offset:<4}{field.unit:<12}{field.log or ''}")
@@ -0,0 +1,205 @@
+"""
+Fuzz corpus and throughput benchmark for the frame parser
+
+Builds a set of adversarial byte streams (radio noise, runs of start bytes, headers with zero and oversized lengths,
+plausible headers that never finish, truncated and corrupted frames) in both frame versions, feeds each one through
+FrameParser in random sized chunks, and checks that:
+
+    every frame it returns has a known ID, that ID's length and a good CRC (or trailer)
+    every intact frame in the stream is found, however much noise is around it
+    no corrupted or made up frame gets through, for frames with a CRC
+    its buffer never holds more than one frame's worth of bytes
+
+and reports the throughput on each stream, which should stay within a small factor of the clean stream's. The corpus can be
+saved to (and replayed from) a folder of .bin files, so a capture of a misbehaving radio can be added to it.
+
+    python parser_fuzz.py
+    python parser_fuzz.py --save fuzz_corpus
+    python parser_fuzz.py --corpus fuzz_corpus --size 1000000
+"""
+import argparse
+import random
+import struct
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from frame_parser import (FRAME_LENGTHS, MAX_FRAME_LENGTH, START_BYTE, START_BYTE_CRC, TRAILER, FrameParser, check_frames,
+                          encode_frame)
+
+
+def make_frame(rng, msg_id, version):
+    payload = rng.randbytes(FRAME_LENGTHS[msg_id] - 5)
+    if version == 2:
+        return encode_frame(msg_id, payload)
+    return struct.pack('<BBB', START_BYTE, FRAME_LENGTHS[msg_id], msg_id) + payload + TRAILER
+
+
+def frames(rng, count, version):
+    ids = list(FRAME_LENGTHS)
+    return [make_frame(rng, rng.choice(ids), version) for _ in range(count)]
+
+
+def build_streams(rng, size, version):
+    """
+    Returns {name: (stream, frames that must be found in it, whether nothing else may be found)} for one frame version
+
+    Version 2 frames carry a CRC, so every stream of them must give exactly the frames that were sent. A version 1 frame
+    only ends in a constant, so noise and corruption can make frames the parser has no way to reject.
+    """
+    start_byte = START_BYTE_CRC if version == 2 else START_BYTE
+    strict = version == 2
+    streams = {}
+
+    clean = frames(rng, size // 25, version)
+    streams['clean'] = (b''.join(clean), clean, strict)
+
+    streams['noise'] = (rng.randbytes(size), [], strict)
+    streams['start_bytes'] = (bytes([start_byte]) * size, [], strict)
+    # a zero length used to extract an empty message and never move on
+    streams['zero_length'] = (bytes([start_byte, 0x00, 0x02]) * (size // 3), [], strict)
+    streams['oversized_length'] = (bytes([start_byte, 0xFF, 0x02]) * (size // 3), [], strict)
+    # the worst case: every start byte has a good header, so each one waits for a whole frame before its check fails
+    streams['plausible_headers'] = (bytes([start_byte, FRAME_LENGTHS[0x02], 0x02]) * (size // 3), [], strict)
+
+    # good frames with noise (biased towards start bytes) between them
+    noisy, kept = [], []
+    for frame in frames(rng, size // 60, version):
+        noisy.append(bytes(rng.choice((start_byte, rng.randrange(256))) for _ in range(rng.randrange(40))))
+        noisy.append(frame)
+        kept.append(frame)
+    streams['noise_between_frames'] = (b''.join(noisy), kept, strict)
+
+    # some frames cut short, as if the radio dropped the end of them
+    truncated, kept = [], []
+    length = 0
+    truncated_at = -MAX_FRAME_LENGTH
+    for frame in frames(rng, size // 25, version):
+        if rng.random() < 0.2:
+            truncated_at = length
+            frame = frame[:rng.randrange(1, len(frame))]
+        # a version 1 trailer is a constant, so a truncated frame whose length happens to end on a later frame's trailer is
+        # taken as a frame, and the frames it covers are lost with it
+        elif strict or length + len(frame) > truncated_at + MAX_FRAME_LENGTH:
+            kept.append(frame)
+        truncated.append(frame)
+        length += len(frame)
+    streams['truncated_frames'] = (b''.join(truncated), kept, strict)
+
+    # random bytes corrupted, a corrupted frame is lost (or for version 1, only if its header or trailer was hit) but must
+    # not take its neighbours with it
+    corrupted, kept = [], []
+    for frame in frames(rng, size // 25, version):
+        damaged = bytearray(frame)
+        for index in range(len(damaged)):
+            if rng.random() < 0.005:
+                damaged[index] = rng.randrange(256)
+        damaged = bytes(damaged)
+        corrupted.append(damaged)
+        if damaged == frame or not strict and check_frames([damaged])[0]:
+            kept.append(damaged)
+    streams['bit_errors'] = (b''.join(corrupted), kept, strict)
+
+    return streams
+
+
+def build_corpus(size, seed=0):
+    """
+    Returns {name: (stream, frames that must be found in it, whether nothing else may be found)}, each stream about size
+    bytes long, for both frame versions
+    """
+    rng = random.Random(seed)
+    corpus = {}
+    for version, prefix in ((2, 'crc'), (1, 'legacy')):
+        for name, stream in build_streams(rng, size, version).items():
+            corpus[f"{prefix}_{name}"] = stream
+    # a car still on old firmware alongside a new one, or a firmware update part way through a capture
+    mixed = frames(rng, size // 50, 1) + frames(rng, size // 50, 2)
+    rng.shuffle(mixed)
+    corpus['mixed_versions'] = (b''.join(mixed), mixed, False)
+    return corpus
+
+
+def missing(found, expected):
+    """
+    How many of the expected frames are not in found
+    """
+    return sum((Counter(expected) - Counter(found)).values())
+
+
+def unexpected(found, expected):
+    """
+    How many of the frames found weren't sent (made up by noise, or corrupted frames that got through)
+    """
+    return sum((Counter(found) - Counter(expected)).values())
+
+
+def run(stream, expected, strict=False, seed=0, max_chunk=256):
+    """
+    Feeds the stream through a new parser in random sized chunks, returns (seconds, frames found, list of problems)
+    """
+    rng = random.Random(seed)
+    chunks = []
+    position = 0
+    while position < len(stream):
+        size = rng.randint(1, max_chunk)
+        chunks.append(stream[position:position+size])
+        position += size
+
+    parser = FrameParser()
+    found = []
+    largest_buffer = 0
+    started = time.perf_counter()
+    for chunk in chunks:
+        found.extend(parser.feed(chunk))
+        largest_buffer = max(largest_buffer, len(parser.buffer))
+    elapsed = time.perf_counter() - started
+
+    problems = []
+    invalid = len(found) - int(check_frames(found).sum()) if found else 0
+    if invalid:
+        problems.append(f"{invalid} invalid frames returned")
+    lost = missing(found, expected)
+    if lost:
+        problems.append(f"{lost} of {len(expected)} frames lost")
+    extra = unexpected(found, expected) if strict else 0
+    if extra:
+        problems.append(f"{extra} frames accepted that weren't sent")
+    if largest_buffer > MAX_FRAME_LENGTH:
+        problems.append(f"buffer grew to {largest_buffer} bytes")
+    return elapsed, found, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fuzz and benchmark the telemetry frame parser")
+    parser.add_argument("--size", type=int, default=200000, help="approximate length of each generated stream in bytes")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated streams and chunk sizes")
+    parser.add_argument("--save", default=None, help="folder to save the generated corpus to, as .bin files")
+    parser.add_argument("--corpus", default=None, help="folder of .bin files to run as well (only checked for invalid "
+                                                       "frames and buffer growth)")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.seed)
+    if args.save:
+        Path(args.save).mkdir(parents=True, exist_ok=True)
+        for name, (stream, expected, strict) in corpus.items():
+            (Path(args.save) / f"{name}.bin").write_bytes(stream)
+    if args.corpus:
+        for path in sorted(Path(args.corpus).glob("*.bin")):
+            corpus.setdefault(path.stem, (path.read_bytes(), [], False))
+
+    failed = False
+    clean_rate = None
+    print(f"{'Stream':<28}{'Bytes':>10}{'Frames':>10}{'MB/s':>10}{'ns/byte':>10}  Result")
+    for name, (stream, expected, strict) in corpus.items():
+        elapsed, found, problems = run(stream, expected, strict, args.seed)
+        rate = len(stream) / elapsed
+        if clean_rate is None:
+            clean_rate = rate
+        failed |= bool(problems)
+        print(f"{name:<28}{len(stream):>10}{len(found):>10}{rate/1e6:>10.1f}{elapsed/len(stream)*1e9:>10.0f}  "
+              + ("; ".join(problems) if problems else "ok")
+              + (f" ({clean_rate/rate:.1f}x slower than clean)" if rate < clean_rate/2 else ""))
+
+    sys.exit(1 if failed else 0)
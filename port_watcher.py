@@ -0,0 +1,122 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+
+# USB IDs of the radios and boards the car uses, a port with one of these is selected automatically when it appears
+RADIOS_PATH = './radios.csv'
+
+
+def load_radios(path=RADIOS_PATH):
+    """
+    Reads the known radios from a csv with Name, VID, PID and Baud columns (the IDs in hex), returns {(vid, pid): (name, baud)}
+    """
+    radios = {}
+    try:
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                radios[(int(row['VID'], 16), int(row['PID'], 16))] = (row['Name'], int(row['Baud']))
+    except FileNotFoundError:
+        pass
+    return radios
+
+
+class PortWatcher(QObject):
+    """
+    Keeps the list of serial ports up to date in the background
+
+    Enumerating ports can take a noticeable time on a computer with a lot of USB devices, so it happens on a worker thread,
+    and the result is compared with the last one so only the ports that appeared or went away are reported. A rescan runs
+    whenever /dev changes (a USB device being plugged in or pulled out adds or removes its node there), and on a timer where
+    there is no /dev to watch (Windows).
+    """
+
+    # emitted on the GUI thread with the ports that appeared and the devices that went away, each port as a dict of
+    # device, description, vid and pid
+    changed = Signal(list, list)
+    # emitted from the worker thread with the full list of ports (None if listing failed), delivered on the GUI thread
+    scanned = Signal(object)
+
+    # seconds to wait after a change in /dev before rescanning, plugging in a device makes several nodes in quick succession
+    DEBOUNCE = 0.3
+    # seconds between rescans when /dev can't be watched
+    POLL_INTERVAL = 2.0
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="port-watcher")
+        self.ports = {}
+        self.scanning = False
+        # another change came in while a scan was already running
+        self.rescan = False
+        self.scanned.connect(self.compare)
+
+        self.debounce = QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(int(self.DEBOUNCE*1000))
+        self.debounce.timeout.connect(self.scan)
+
+        self.watcher = None
+        self.poll = None
+
+    def start(self):
+        """
+        Runs a first scan and starts watching for ports being plugged in or pulled out
+        """
+        if os.path.isdir('/dev'):
+            self.watcher = QFileSystemWatcher(['/dev'], self)
+            self.watcher.directoryChanged.connect(self.debounce.start)
+
+        if self.watcher is None or not self.watcher.directories():
+            self.poll = QTimer(self)
+            self.poll.setInterval(int(self.POLL_INTERVAL*1000))
+            self.poll.timeout.connect(self.scan)
+            self.poll.start()
+
+        self.scan()
+
+    def stop(self):
+        self.debounce.stop()
+        if self.poll is not None:
+            self.poll.stop()
+        if self.watcher is not None:
+            self.watcher.removePaths(self.watcher.directories())
+        self.executor.shutdown(wait=False)
+
+    def scan(self):
+        """
+        Starts enumerating the ports on the worker thread, unless a scan is already running
+        """
+        if self.scanning:
+            self.rescan = True
+            return
+        self.scanning = True
+        self.executor.submit(self.enumerate)
+
+    def enumerate(self):
+        # runs on the worker thread, which is also where the serial library is first imported, off the dashboard's startup
+        from serial.tools import list_ports
+
+        try:
+            ports = [{"device": str(port.device), "description": port.description, "vid": port.vid, "pid": port.pid}
+                     for port in list_ports.comports()]
+        except Exception as error:
+            print(f"Could not list serial ports: {error}")
+            ports = None
+        self.scanned.emit(ports)
+
+    def compare(self, ports):
+        self.scanning = False
+        if self.rescan:
+            self.rescan = False
+            self.scan()
+        if ports is None:
+            return
+
+        ports = {port["device"]: port for port in ports}
+        added = [port for device, port in ports.items() if device not in self.ports]
+        removed = [device for device in self.ports if device not in ports]
+        self.ports = ports
+        if added or removed:
+            self.changed.emit(added, removed)
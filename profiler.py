@@ -0,0 +1,162 @@
+"""
+Per stage timing of the ingest and drawing pipeline
+
+Stages are timed with
+
+    with PROFILER.stage("parse"):
+        ...
+
+or by decorating a method with @profiled("chart redraw"). While profiling is off, stage() hands back one shared object
+whose enter and exit do nothing, so leaving the instrumentation in costs a method call per stage.
+
+While it is on, each stage keeps its last few thousand durations for rolling percentiles (summary(), shown by the
+dashboard's overlay), and every span is kept in a bounded buffer that export_trace() writes out as Chrome trace_event
+JSON, to be opened in chrome://tracing or https://ui.perfetto.dev. Stages inside other stages show up nested in the trace.
+Spans are recorded from any thread (the fleet's ingest workers as well as the GUI thread), each on its own track.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+import numpy as np
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exception):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Profiler:
+    """
+    Rolling per stage timings and a trace of recent spans
+
+    Initiated with the number of durations kept per stage for the percentiles, and the number of spans kept for the trace
+    (the oldest are dropped first, so a long session keeps its most recent minutes)
+    """
+
+    def __init__(self, window=2000, trace_size=200000):
+        self.enabled = False
+        self.window = window
+        self.durations = {}
+        self.spans = deque(maxlen=trace_size)
+        self.thread_names = {}
+        # perf_counter_ns() has no fixed origin, trace times are relative to when profiling started
+        self.origin = time.perf_counter_ns()
+
+    def start(self):
+        self.origin = time.perf_counter_ns()
+        self.clear()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+        return self.enabled
+
+    def clear(self):
+        self.durations = {}
+        self.spans.clear()
+
+    def stage(self, name):
+        if not self.enabled:
+            return NO_SPAN
+        return _Span(self, name)
+
+    def record(self, name, start, duration):
+        """
+        Records a span, start from time.perf_counter_ns() and duration in nanoseconds
+        """
+        if name not in self.durations:
+            self.durations[name] = deque(maxlen=self.window)
+        self.durations[name].append(duration)
+
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        self.spans.append((name, start, duration, thread))
+
+    def summary(self):
+        """
+        Returns {stage: (count, p50, p95, p99, max)} over each stage's recent durations, in milliseconds
+        """
+        summary = {}
+        for name, durations in list(self.durations.items()):
+            values = np.array(durations, dtype=np.float64)/1e6
+            if len(values):
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                summary[name] = (len(values), p50, p95, p99, values.max())
+        return summary
+
+    def format_summary(self):
+        lines = [f"{'Stage':<20}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}  (ms)"]
+        for name, (count, p50, p95, p99, maximum) in sorted(self.summary().items()):
+            lines.append(f"{name:<20}{count:>6}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}{maximum:>8.2f}")
+        return "\n".join(lines)
+
+    def export_trace(self, path):
+        """
+        Writes the recorded spans as Chrome trace_event JSON (complete "X" events, times in microseconds)
+        """
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}}
+                  for thread, name in self.thread_names.items()]
+        events.extend({"name": name, "cat": "pipeline", "ph": "X", "pid": pid, "tid": thread,
+                       "ts": (start - self.origin)/1000, "dur": duration/1000}
+                      for name, start, duration, thread in list(self.spans))
+
+        with open(path, 'w') as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        return len(events)
+
+
+# the process's profiler, LEMONS_PROFILE=1 turns it on from the start
+PROFILER = Profiler()
+if os.environ.get("LEMONS_PROFILE"):
+    PROFILER.start()
+
+
+def profiled(name):
+    """
+    Decorator timing every call of a function as the stage name
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with _Span(PROFILER, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,38 @@
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import QLabel
+
+from profiler import PROFILER
+
+
+class ProfilerOverlay(QLabel):
+    """
+    The profiler's rolling percentiles drawn over the top right corner of the window, refreshed twice a second while shown
+    """
+
+    REFRESH_INTERVAL = 500  # ms
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setObjectName("profiler_overlay")
+        # clicks go through to whatever is underneath
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.hide()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_INTERVAL)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def set_shown(self, shown):
+        if shown:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+            self.hide()
+
+    def refresh(self):
+        self.setText(PROFILER.format_summary() if PROFILER.enabled else "Profiling is off")
+        self.adjustSize()
+        self.move(self.parentWidget().width() - self.width() - 10, 10)
@@ -0,0 +1,190 @@
+"""
+Multi-resolution min/max/mean pyramid over the cached session logs, for plotting any time range with a bounded
+number of points
+
+Every level summarises blocks of FACTOR samples of the level below it (level 0 is the raw column), keeping the first
+and last time, min, max, sum and count of each block. A query picks the finest level that fits in max_points, so
+showing a whole 24 hour session costs the same as showing 20 seconds.
+
+    from pyramid import query
+    t, y = query("./logs/1777836759.181342", "Y dot", t0, t1, max_points=2000)
+"""
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from session_cache import CACHE_FOLDER, MANIFEST_NAME, Session
+
+PYRAMID_FOLDER = "pyramid"
+FACTOR = 8
+# stop adding levels once a level has this few blocks
+MIN_BLOCKS = 256
+
+# columns of each level's array
+T_FIRST, T_LAST, MIN, MAX, SUM, COUNT = range(6)
+
+
+def build_levels(time, values):
+    """
+    Builds every level above the raw data, returning a list of (n_blocks, 6) float64 arrays
+    """
+    levels = []
+
+    # level 1 comes straight from the raw samples, NaNs (unparseable csv values) are left out of min/max/mean
+    starts = np.arange(0, len(values), FACTOR)
+    if len(starts) == 0:
+        return levels
+
+    valid = ~np.isnan(values)
+    level = np.empty((len(starts), 6))
+    level[:, T_FIRST] = time[starts]
+    level[:, T_LAST] = time[np.minimum(starts + FACTOR, len(time)) - 1]
+    level[:, MIN] = np.minimum.reduceat(np.where(valid, values, np.inf), starts)
+    level[:, MAX] = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+    level[:, SUM] = np.add.reduceat(np.where(valid, values, 0.0), starts, dtype=np.float64)
+    level[:, COUNT] = np.add.reduceat(valid, starts, dtype=np.float64)
+    levels.append(level)
+
+    # every level above that is built from the one below it, so the raw data is only read once
+    while len(level) > MIN_BLOCKS:
+        starts = np.arange(0, len(level), FACTOR)
+        above = np.empty((len(starts), 6))
+        above[:, T_FIRST] = level[starts, T_FIRST]
+        above[:, T_LAST] = level[np.minimum(starts + FACTOR, len(level)) - 1, T_LAST]
+        above[:, MIN] = np.minimum.reduceat(level[:, MIN], starts)
+        above[:, MAX] = np.maximum.reduceat(level[:, MAX], starts)
+        above[:, SUM] = np.add.reduceat(level[:, SUM], starts)
+        above[:, COUNT] = np.add.reduceat(level[:, COUNT], starts)
+        levels.append(above)
+        level = above
+
+    return levels
+
+
+class ChannelPyramid:
+    """
+    The pyramid of one channel of a session, memory mapped from the session cache
+    """
+
+    def __init__(self, session, log, channel):
+        self.session = session
+        self.log = log
+        self.channel = channel
+        self.path = session.folder / CACHE_FOLDER / PYRAMID_FOLDER / log / channel.replace("/", "_")
+
+        # rebuild if the column cache has been rebuilt since the pyramid was made
+        source = session.folder / CACHE_FOLDER / log / MANIFEST_NAME
+        manifest = self.path / MANIFEST_NAME
+        if not manifest.exists() or manifest.stat().st_mtime < source.stat().st_mtime:
+            self.build()
+
+        with open(manifest) as file:
+            count = json.load(file)["levels"]
+        self.levels = [np.load(self.path / f"level_{i+1}.npy", mmap_mode="r") for i in range(count)]
+
+    def build(self):
+        print(f"Building pyramid for {self.session.name} {self.log}/{self.channel}")
+        columns = self.session[self.log]
+        levels = build_levels(columns["Time"], columns[self.channel])
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True)
+        for i, level in enumerate(levels):
+            np.save(self.path / f"level_{i+1}.npy", level)
+        # the manifest is written last, so it only exists for a complete pyramid
+        with open(self.path / MANIFEST_NAME, "w") as file:
+            json.dump({"levels": len(levels), "factor": FACTOR}, file)
+
+    def select(self, t0, t1, max_points, points_per_block):
+        """
+        Returns the raw (time, value) samples in [t0, t1] if they fit in max_points, otherwise the rows of the finest
+        level whose blocks in the range fit
+        """
+        time = self.session[self.log]["Time"]
+        first, last = np.searchsorted(time, [t0, t1], side="left")
+        last = min(last + 1, len(time))
+
+        if last - first <= max_points or not self.levels:
+            return np.asarray(time[first:last]), np.asarray(self.session[self.log][self.channel][first:last])
+
+        # each level is FACTOR times smaller, so the number of blocks in the range at level k is known up front
+        for level_number, level in enumerate(self.levels, start=1):
+            block_size = FACTOR**level_number
+            if points_per_block*((last - first)//block_size + 2) <= max_points:
+                break
+
+        return level[first//block_size:min(-(-last//block_size), len(level))]
+
+    def query(self, t0, t1, max_points):
+        """
+        Returns (time, value) arrays covering [t0, t1] with at most max_points points
+
+        Raw samples are returned when they fit, otherwise each block of the chosen level contributes its min and max,
+        so spikes survive any amount of zooming out
+        """
+        selected = self.select(t0, t1, max_points, 2)
+        if isinstance(selected, tuple):
+            return selected
+
+        # interleave (first time, min) and (last time, max) for every block
+        t = np.empty(2*len(selected))
+        y = np.empty(2*len(selected))
+        t[0::2] = selected[:, T_FIRST]
+        t[1::2] = selected[:, T_LAST]
+        y[0::2] = selected[:, MIN]
+        y[1::2] = selected[:, MAX]
+        return t, y
+
+    def query_mean(self, t0, t1, max_points):
+        """
+        Like query, but one mean value per block instead of the min/max envelope
+        """
+        selected = self.select(t0, t1, max_points, 1)
+        if isinstance(selected, tuple):
+            return selected
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return 0.5*(selected[:, T_FIRST] + selected[:, T_LAST]), selected[:, SUM] / selected[:, COUNT]
+
+
+# pyramids already opened, so repeated queries (every slider move) don't touch the disk metadata again
+_pyramids = {}
+_sessions = {}
+
+
+def open_session(session):
+    if isinstance(session, Session):
+        return session
+    key = str(Path(session).resolve())
+    if key not in _sessions:
+        _sessions[key] = Session(session)
+    return _sessions[key]
+
+
+def get_pyramid(session, channel):
+    """
+    Finds the log containing channel ('Y dot', or 'imu/Y dot' to be explicit) and returns its pyramid
+    """
+    session = open_session(session)
+    key = (str(session.folder.resolve()), channel)
+    if key not in _pyramids:
+        if "/" in channel:
+            log, column = channel.split("/", 1)
+        else:
+            matches = [log for log in session.logs if channel in session[log]]
+            if not matches:
+                raise KeyError(f"No log in {session.name} has a column named {channel}")
+            log, column = matches[0], channel
+        _pyramids[key] = ChannelPyramid(session, log, column)
+    return _pyramids[key]
+
+
+def query(session, channel, t0, t1, max_points=2000):
+    """
+    Returns at most max_points (time, value) points of channel between t0 and t1, from the finest pyramid level that fits
+
+    session can be a session_cache.Session or the path of a session's log folder
+    """
+    return get_pyramid(session, channel).query(t0, t1, max_points)
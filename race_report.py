@@ -0,0 +1,348 @@
+"""
+Post-race report generator
+
+Computes per-lap and per-stint aggregates for a session in vectorized passes over the cached logs (lap time,
+lateral and forward acceleration, RPM histogram, coolant/oil/battery ranges and GPS top speed) and renders them to a
+static HTML report with small-multiple plots. Each group of aggregates is cached under the session's cache folder,
+keyed by the logs it reads and the options it uses, so rerunning after a small change only recomputes what changed.
+
+    python race_report.py ./logs/1777836759.181342 --output report.html
+"""
+import argparse
+import base64
+import hashlib
+import html
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+
+from lap_alignment import split_laps
+from session_cache import CACHE_FOLDER, MANIFEST_NAME, load_session
+
+REPORT_FOLDER = "report"
+
+# default options, every one of these ends up in the cache key of the aggregates that use it
+DEFAULT_OPTIONS = {
+    "start": None,          # (lat, lon) of the start/finish point, the first GPS fix if None
+    "gate_radius": 15.0,    # meters around the start/finish point that count as crossing it
+    "stint_gap": 60.0,      # seconds without GPS fixes, or stopped, that end a stint (pit stops, driver changes)
+    "stopped_speed": 5.0,   # GPS speed (mph) below which the car counts as stopped
+    "rpm_bins": list(range(0, 8001, 500)),
+}
+
+
+# =========================
+# CACHING
+# =========================
+class AggregateCache:
+    """
+    Stores each group of aggregates as a .npz file, reused while the logs and options it depends on are unchanged
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.path = session.folder / CACHE_FOLDER / REPORT_FOLDER
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def key(self, logs, options):
+        # the column cache manifests are rewritten whenever a csv changes, so their mtimes track the logs
+        sources = {log: (self.session.folder / CACHE_FOLDER / log / MANIFEST_NAME).stat().st_mtime_ns for log in logs}
+        return hashlib.sha1(json.dumps([sources, options], sort_keys=True).encode()).hexdigest()
+
+    def get(self, name, logs, options, compute):
+        key = self.key(logs, options)
+        path = self.path / f"{name}.npz"
+
+        if path.exists():
+            with np.load(path) as cached:
+                if str(cached["key"]) == key:
+                    return {field: cached[field] for field in cached.files if field != "key"}
+
+        print(f"Computing {name}")
+        result = compute()
+        np.savez(path, key=key, **result)
+        return result
+
+
+# =========================
+# AGGREGATES
+# =========================
+def lap_boundaries(session, options):
+    gps = session["gps"]
+    if options["start"] is not None:
+        start_lat, start_lon = options["start"]
+    else:
+        start_lat, start_lon = gps["Lat"][0], gps["Lon"][0]
+
+    crossings = split_laps(gps["Time"], gps["Lat"], gps["Lon"], start_lat, start_lon, options["gate_radius"])
+    return {"crossings": crossings}
+
+
+def stint_boundaries(session, options):
+    """
+    A new stint starts after a gap in the GPS log or a long stop, found in one pass over the GPS times and speeds
+    """
+    gps = session["gps"]
+    time = np.asarray(gps["Time"])
+    moving = np.asarray(gps["Speed"]) >= options["stopped_speed"]
+    if len(time) == 0:
+        return {"starts": np.empty(0), "ends": np.empty(0)}
+
+    # only the fixes where the car is moving matter, a stop shows up as a long gap between two moving fixes
+    moving_time = time[moving]
+    if len(moving_time) == 0:
+        return {"starts": np.empty(0), "ends": np.empty(0)}
+
+    breaks = np.flatnonzero(np.diff(moving_time) > options["stint_gap"])
+    starts = np.concatenate(([moving_time[0]], moving_time[breaks + 1]))
+    ends = np.concatenate((moving_time[breaks], [moving_time[-1]]))
+    return {"starts": starts, "ends": ends}
+
+
+def interval_stats(time, values, edges, stats):
+    """
+    Computes the requested statistics of values over each interval [edges[i], edges[i+1]) at once
+
+    The edges are turned into sample indices with one searchsorted, and each statistic is a single reduceat, so the
+    cost is one pass over the samples no matter how many laps there are. Empty intervals come out as NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = np.searchsorted(time, edges)
+    n = len(edges) - 1
+    if n < 1 or index[-1] == 0:
+        return {stat: np.full(max(n, 0), np.nan) for stat in stats}
+
+    # reduceat runs the last interval to the end of the array, so cut the samples off at the final edge. It needs
+    # in-range indices and ends each interval where the next index starts, so it only runs over the intervals with
+    # samples (an empty interval starts where the next one with samples does), and the empty ones are NaN
+    values = values[:index[-1]]
+    counts = np.diff(index)
+    filled = counts > 0
+    if not filled.any():
+        return {stat: np.full(n, np.nan) for stat in stats}
+    starts = index[:-1][filled]
+
+    results = {}
+    for stat in stats:
+        if stat == "max":
+            out = np.maximum.reduceat(values, starts)
+        elif stat == "min":
+            out = np.minimum.reduceat(values, starts)
+        elif stat == "mean":
+            out = np.add.reduceat(values, starts) / counts[filled]
+        elif stat == "absmax":
+            out = np.maximum.reduceat(np.abs(values), starts)
+        else:
+            raise ValueError(f"Unknown statistic {stat}")
+        results[stat] = np.full(n, np.nan)
+        results[stat][filled] = out
+
+    return results
+
+
+def interval_histograms(time, values, edges, bins):
+    """
+    Histogram of values in each interval [edges[i], edges[i+1]), as an (n_intervals, n_bins) array built with one
+    bincount over (interval, bin) pairs
+    """
+    n = len(edges) - 1
+    n_bins = len(bins) - 1
+    if n < 1:
+        return np.zeros((0, n_bins), dtype=np.int64)
+
+    values = np.asarray(values, dtype=np.float64)
+    index = np.searchsorted(time, edges)
+
+    # the interval each sample belongs to, and its bin
+    interval = np.searchsorted(index, np.arange(index[0], index[-1]), side="right") - 1
+    which_bin = np.digitize(values[index[0]:index[-1]], bins) - 1
+
+    # samples outside of the bins (and NaNs) are dropped
+    valid = (which_bin >= 0) & (which_bin < n_bins)
+    flat = interval[valid]*n_bins + which_bin[valid]
+    return np.bincount(flat, minlength=n*n_bins).reshape(n, n_bins)
+
+
+def stint_edges(stints):
+    # interleaving the stint starts and ends gives the intervals inside stints at the even positions
+    edges = np.empty(2*len(stints["starts"]))
+    edges[0::2] = stints["starts"]
+    edges[1::2] = stints["ends"]
+    return edges
+
+
+def channel_aggregates(session, log, edges, columns, take_every=1):
+    """
+    Statistics of each (column, stats) pair of one log over every interval, keyed '<column>/<stat>'
+    """
+    frame = session[log]
+    time = frame["Time"]
+    results = {}
+    for column, stats in columns.items():
+        for stat, values in interval_stats(time, frame[column], edges, stats).items():
+            results[f"{column}/{stat}"] = values[::take_every]
+    return results
+
+
+# statistics computed per lap and per stint, by log
+IMU_COLUMNS = {"Y dot": ("absmax", "mean"), "Z dot": ("max", "min", "mean")}
+CAR_COLUMNS = {"Coolant Temperature": ("min", "max"), "Oil Pressure": ("min", "max"),
+               "Battery Voltage": ("min", "max"), "Engine RPM": ("max", "mean")}
+GPS_COLUMNS = {"Speed": ("max",)}
+
+
+def compute_report(session, options=None):
+    """
+    Computes (or loads from the cache) every aggregate the report needs
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    cache = AggregateCache(session)
+    lap_options = {key: options[key] for key in ("start", "gate_radius")}
+    stint_options = {key: options[key] for key in ("stint_gap", "stopped_speed")}
+
+    laps = cache.get("laps", ["gps"], lap_options, lambda: lap_boundaries(session, options))
+    stints = cache.get("stints", ["gps"], stint_options, lambda: stint_boundaries(session, options))
+    lap_edges = laps["crossings"]
+    edges_of_stints = stint_edges(stints)
+
+    report = {"lap_edges": lap_edges, "lap_time": np.diff(lap_edges),
+              "stint_starts": stints["starts"], "stint_ends": stints["ends"], "rpm_bins": np.array(options["rpm_bins"])}
+
+    for log, columns in (("imu", IMU_COLUMNS), ("car", CAR_COLUMNS), ("gps", GPS_COLUMNS)):
+        if log not in session.logs:
+            continue
+        report.update({f"lap/{key}": value for key, value in cache.get(
+            f"{log}_laps", [log, "gps"], lap_options,
+            lambda: channel_aggregates(session, log, lap_edges, columns)).items()})
+        report.update({f"stint/{key}": value for key, value in cache.get(
+            f"{log}_stints", [log, "gps"], stint_options,
+            lambda: channel_aggregates(session, log, edges_of_stints, columns, take_every=2)).items()})
+
+    if "car" in session.logs:
+        report["lap/rpm_histogram"] = cache.get(
+            "rpm_histogram", ["car", "gps"], {**lap_options, "rpm_bins": options["rpm_bins"]},
+            lambda: {"counts": interval_histograms(session["car"]["Time"], session["car"]["Engine RPM"],
+                                                   lap_edges, options["rpm_bins"])})["counts"]
+
+    return report
+
+
+# =========================
+# RENDERING
+# =========================
+def figure_to_html(fig):
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=90, bbox_inches="tight")
+    plt.close(fig)
+    return f'<img src="data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}">'
+
+
+def lap_plots(report):
+    """
+    Small multiples of the per-lap aggregates, one little bar chart per statistic sharing the lap axis
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    panels = [("Lap time (s)", report["lap_time"])]
+    panels += [(key.removeprefix("lap/"), report[key]) for key in report
+               if key.startswith("lap/") and key != "lap/rpm_histogram"]
+
+    columns = 4
+    rows = -(-len(panels) // columns)
+    fig, axes = plt.subplots(rows, columns, figsize=(3*columns, 2*rows), sharex=True, squeeze=False)
+    laps = np.arange(1, len(report["lap_time"]) + 1)
+    for ax, (title, values) in zip(axes.flat, panels):
+        ax.bar(laps, values, color="k")
+        ax.set_title(title, fontsize=9)
+        ax.tick_params(labelsize=7)
+    for ax in axes.flat[len(panels):]:
+        ax.set_visible(False)
+    fig.tight_layout()
+    return figure_to_html(fig)
+
+
+def rpm_histogram_plots(report):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    histograms = report["lap/rpm_histogram"]
+    bins = report["rpm_bins"]
+    columns = 6
+    rows = max(-(-len(histograms) // columns), 1)
+    fig, axes = plt.subplots(rows, columns, figsize=(2*columns, 1.5*rows), sharex=True, sharey=True, squeeze=False)
+    for lap, (ax, counts) in enumerate(zip(axes.flat, histograms), start=1):
+        # the car logs at 50 Hz, so a count of samples is a time in bins of 20 ms
+        ax.bar(bins[:-1], counts*0.02, width=np.diff(bins), align="edge", color="k")
+        ax.set_title(f"Lap {lap}", fontsize=8)
+        ax.tick_params(labelsize=6)
+    for ax in axes.flat[len(histograms):]:
+        ax.set_visible(False)
+    fig.tight_layout()
+    return figure_to_html(fig)
+
+
+def table_html(header, rows):
+    head = "".join(f"<th>{html.escape(str(cell))}</th>" for cell in header)
+    body = "".join("<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>" for row in rows)
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+def format_value(value):
+    return "--" if np.isnan(value) else f"{value:.2f}"
+
+
+def render_html(session, report):
+    lap_keys = [key for key in report if key.startswith("lap/") and key != "lap/rpm_histogram"]
+    stint_keys = [key for key in report if key.startswith("stint/")]
+
+    lap_rows = [[i+1, format_value(report["lap_time"][i])] + [format_value(report[key][i]) for key in lap_keys]
+                for i in range(len(report["lap_time"]))]
+    stint_rows = [[i+1, format_value(end - start)] + [format_value(report[key][i]) for key in stint_keys]
+                  for i, (start, end) in enumerate(zip(report["stint_starts"], report["stint_ends"]))]
+
+    sections = [f"<h1>Race report: {html.escape(session.name)}</h1>",
+                "<h2>Stints</h2>",
+                table_html(["Stint", "Duration (s)"] + [key.removeprefix("stint/") for key in stint_keys], stint_rows),
+                "<h2>Laps</h2>",
+                table_html(["Lap", "Lap time (s)"] + [key.removeprefix("lap/") for key in lap_keys], lap_rows)]
+
+    if len(report["lap_time"]):
+        sections += ["<h2>Per-lap statistics</h2>", lap_plots(report)]
+        if "lap/rpm_histogram" in report:
+            sections += ["<h2>Time at RPM per lap (s)</h2>", rpm_histogram_plots(report)]
+
+    style = ("body { font-family: Helvetica; font-weight: 300; } "
+             "table { border-collapse: collapse; font-size: 10pt; } "
+             "td, th { border: 1px solid #999; padding: 2px 6px; text-align: right; }")
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'><style>{style}</style></head><body>{''.join(sections)}</body></html>"
+
+
+def generate_report(session_folder, output=None, options=None):
+    session = load_session(session_folder)
+    report = compute_report(session, options)
+
+    output = Path(output) if output else session.folder / "report.html"
+    output.write_text(render_html(session, report))
+    print(f"Wrote report to {output}")
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a post-race HTML report for a logged session")
+    parser.add_argument("session", help="log folder of the session")
+    parser.add_argument("--output", default=None, help="report file (default: report.html in the session folder)")
+    parser.add_argument("--start", type=float, nargs=2, metavar=("LAT", "LON"), default=None,
+                        help="start/finish point for splitting laps (default: first GPS fix)")
+    parser.add_argument("--gate-radius", type=float, default=DEFAULT_OPTIONS["gate_radius"])
+    parser.add_argument("--stint-gap", type=float, default=DEFAULT_OPTIONS["stint_gap"])
+    args = parser.parse_args()
+
+    generate_report(args.session, args.output, {"start": args.start, "gate_radius": args.gate_radius,
+                                                "stint_gap": args.stint_gap})
@@ -0,0 +1,148 @@
+"""
+Headless recorder, logs everything the car sends without the dashboard
+
+Blocks on the serial port instead of polling it, so it can run all race on a low power box in the pit while dashboards
+come and go. Prints a line of counters every --stats seconds and keeps them in recorder.json in the session's log
+folder. On SIGTERM or Ctrl+C it flushes the pending samples, closes the port and converts the logs to the session
+cache. If the radio is unplugged or the link goes quiet, the port is reopened into the same session.
+
+With --publish it also fans the telemetry out to dashboards and other tools (see telemetry_server.py), so any number of
+laptops get live data from the one radio.
+
+    python recorder.py /dev/ttyUSB0 57600 --publish tcp://0.0.0.0:5760
+
+With --profile the time spent in each stage of ingest is included in the reports, and saved as a Chrome trace
+(trace.json in the log folder) when the recorder stops.
+"""
+import argparse
+import json
+import os
+import signal
+import time
+
+from connection import Vehicle
+from profiler import PROFILER
+from session_cache import build_cache
+from telemetry_server import TelemetryServer
+
+# name of the status file written to the session's log folder
+STATUS_NAME = "recorder.json"
+
+
+class Recorder:
+    """
+    Runs a Vehicle on a serial port until stopped
+
+    stop() only sets a flag, so it is safe to call from a signal handler-- the loop notices it within the port's read
+    timeout and shuts down from the main thread
+    """
+
+    def __init__(self, port, baud, verbose=False, stats_interval=10.0, read_timeout=0.5, publish=()):
+        # the longest a blocking read waits for the first byte is also how long stopping can take
+        self.vehicle = Vehicle(port=port, baud=baud, verbose=verbose, read_timeout=read_timeout)
+        self.stats_interval = stats_interval
+        self.running = False
+
+        # frames are only queued for the subscribers from the ingest loop, the sockets are serviced on their own thread
+        self.server = TelemetryServer(publish) if publish else None
+        if self.server is not None:
+            self.vehicle.frame_callbacks.append(self.server.publish)
+
+        self.start_time = time.time()
+        self.last_stats = time.monotonic()
+
+    @property
+    def status_path(self):
+        return os.path.join(self.vehicle.log_folder, STATUS_NAME)
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        if self.server is not None:
+            self.server.start()
+
+        self.running = True
+        while self.running:
+            self.vehicle.update(block=True)
+
+            if time.monotonic() - self.last_stats >= self.stats_interval:
+                self.last_stats = time.monotonic()
+                self.report()
+
+        self.shutdown()
+
+    def status(self):
+        status = {"port": self.vehicle.port,
+                  "baud": self.vehicle.baud,
+                  "log_folder": self.vehicle.log_folder,
+                  "started": self.start_time,
+                  "updated": time.time(),
+                  "heartbeat_age": self.vehicle.heartbeat_time,
+                  "counters": dict(self.vehicle.counters)}
+        if self.server is not None:
+            status["server"] = self.server.status()
+        if PROFILER.enabled:
+            status["stages"] = {name: dict(zip(("count", "p50_ms", "p95_ms", "p99_ms", "max_ms"), values))
+                                for name, values in PROFILER.summary().items()}
+        return status
+
+    def report(self):
+        status = self.status()
+        counters = status["counters"]
+        print(f"[{time.strftime('%H:%M:%S')}] {counters['frames']} frames, {counters['bytes']} bytes, "
+              f"{counters['checksum_failures']} bad, {counters['discarded_bytes']} bytes skipped, "
+              f"heartbeat {status['heartbeat_age']:.1f} s ago"
+              + (f", {len(status['server']['subscribers'])} subscribers" if self.server is not None else ""))
+        if PROFILER.enabled:
+            print(PROFILER.format_summary())
+
+        # written to a temporary file first so anything watching it never reads half a file
+        temporary = self.status_path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(status, file, indent=1)
+        os.replace(temporary, self.status_path)
+
+    def shutdown(self):
+        print("Stopping recorder")
+        # samples decoded since the last batch haven't been logged yet
+        self.vehicle.evaluate_derived()
+        self.report()
+        self.vehicle.close_port()
+        if self.server is not None:
+            self.server.stop()
+        if PROFILER.enabled:
+            PROFILER.export_trace(self.vehicle.log_folder + "/trace.json")
+
+        try:
+            build_cache(self.vehicle.log_folder)
+        except Exception as error:
+            # the csv logs are complete either way, the cache can be built later
+            print(f"Could not build the session cache: {error}")
+
+        print(f"Session recorded to {self.vehicle.log_folder}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record the car's telemetry without the dashboard")
+    parser.add_argument("port", help="serial port the radio is connected to, e.g. /dev/ttyUSB0 or COM3")
+    parser.add_argument("baud", type=int, help="baud rate of the radio, e.g. 57600")
+    parser.add_argument("--stats", type=float, default=10.0, help="seconds between counter reports")
+    parser.add_argument("--publish", action="append", default=[], metavar="ADDRESS",
+                        help="publish the telemetry on tcp://host:port or unix:///path, can be given more than once")
+    parser.add_argument("--verbose", action="store_true", help="print every frame received")
+    parser.add_argument("--profile", action="store_true", help="time each stage of ingest, and save a Chrome trace")
+    args = parser.parse_args()
+
+    if args.profile:
+        PROFILER.start()
+
+    # if the port can't be opened yet (radio not plugged in), the recorder keeps retrying until it can
+    recorder = Recorder(args.port, args.baud, verbose=args.verbose, stats_interval=args.stats,
+                        publish=args.publish)
+
+    signal.signal(signal.SIGTERM, recorder.stop)
+    signal.signal(signal.SIGINT, recorder.stop)
+
+    print(f"Recording {args.port} to {recorder.vehicle.log_folder}, stop with Ctrl+C or SIGTERM")
+    recorder.run()
@@ -3,6 +3,8 @@ from collections import deque
 from PySide6.QtWidgets import QWidget, QVBoxLayout
 import pyqtgraph as pg
 
+from profiler import profiled
+
 
 class StreamingLineChart(QWidget):
     """
@@ -118,6 +120,7 @@ class StreamingLineChart(QWidget):
     # -----------------------------
     # Plot update
     # -----------------------------
+    @profiled("chart redraw")
     def _update_plot(self, current_time):
 
         if not self.data1 and not self.data2:
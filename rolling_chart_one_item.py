@@ -3,6 +3,8 @@ from collections import deque
 from PySide6.QtWidgets import QWidget, QVBoxLayout
 import pyqtgraph as pg
 
+from profiler import profiled
+
 
 class StreamingLineChartOneItem(QWidget):
     """
@@ -74,6 +76,7 @@ class StreamingLineChartOneItem(QWidget):
         self._update_plot(t_rel)
 
 
+    @profiled("chart redraw")
     def _update_plot(self, current_time):
 
         if not self.data:
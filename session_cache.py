@@ -0,0 +1,198 @@
+"""
+Columnar binary cache of the csv logs written by Vehicle, for loading sessions without parsing text
+
+Each log of a session (imu.csv, gps.csv, car.csv) is converted once into one .npy file per column under
+<session>/cache/<log>/, and loaded back as read-only memory maps, so only the pages that are actually used get read
+from disk. The cache is rebuilt automatically whenever the csv is newer than it.
+
+Rows are stamped with the wall clock as they are received, which can step backwards (a clock adjustment), so the cached
+columns are sorted by Time if the csv's rows aren't in order. Anything reading the cache can rely on the time order.
+
+    python session_cache.py ./logs/1777836759.181342
+"""
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+LOG_NAMES = ("imu", "gps", "car")
+CACHE_FOLDER = "cache"
+MANIFEST_NAME = "columns.json"
+
+# columns that need double precision-- times are unix timestamps and coordinates need better than float32's ~1 m
+# resolution, everything else is a sensor reading that float32 holds comfortably
+FLOAT64_COLUMNS = {"Time", "Lat", "Lon"}
+
+# rows parsed at once when converting, so conversion memory doesn't grow with the length of the log
+CHUNK_ROWS = 500_000
+
+
+def column_filename(column):
+    # column names like 'Y dot' are fine as file names, just keep slashes out of them
+    return column.replace("/", "_") + ".npy"
+
+
+def count_rows(csv_path):
+    """
+    Counts the data rows of a csv by counting newlines in large binary blocks, much faster than parsing it
+    """
+    lines = 0
+    last = b"\n"
+    with open(csv_path, "rb") as file:
+        while block := file.read(1 << 24):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    # a final line without a trailing newline still counts, and the header isn't a data row
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def cache_is_current(csv_path, cache_path):
+    manifest = cache_path / MANIFEST_NAME
+    return manifest.exists() and manifest.stat().st_mtime >= csv_path.stat().st_mtime
+
+
+def convert_log(csv_path, cache_path):
+    """
+    Converts one csv log into typed column files, streaming it in chunks
+    """
+    rows = count_rows(csv_path)
+    columns = list(pd.read_csv(csv_path, nrows=0).columns)
+
+    # build into a temporary folder and swap it in at the end, so a reader never sees a half written cache
+    building = cache_path.with_name(cache_path.name + ".building")
+    shutil.rmtree(building, ignore_errors=True)
+    building.mkdir(parents=True)
+
+    arrays = {}
+    for column in columns:
+        dtype = np.float64 if column in FLOAT64_COLUMNS else np.float32
+        arrays[column] = np.lib.format.open_memmap(building / column_filename(column), mode="w+",
+                                                   dtype=dtype, shape=(rows,))
+
+    written = 0
+    for chunk in pd.read_csv(csv_path, chunksize=CHUNK_ROWS):
+        # a log that is still being written can grow between counting and reading, ignore the extra rows
+        chunk = chunk.iloc[:rows - written]
+        for column in columns:
+            arrays[column][written:written+len(chunk)] = pd.to_numeric(chunk[column], errors="coerce").to_numpy()
+        written += len(chunk)
+
+    # the rows are nearly always in order already, so checking is all it usually costs
+    if "Time" in arrays and np.any(np.diff(arrays["Time"][:written]) < 0):
+        order = np.argsort(arrays["Time"][:written], kind="stable")
+        for array in arrays.values():
+            array[:written] = array[:written][order]
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    with open(building / MANIFEST_NAME, "w") as file:
+        json.dump({"rows": written, "columns": {column: column_filename(column) for column in columns}}, file)
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(building, cache_path)
+
+
+def build_cache(session_folder, force=False):
+    """
+    Converts every csv log of a session that is missing from the cache or newer than it
+    """
+    session_folder = Path(session_folder)
+    for name in LOG_NAMES:
+        csv_path = session_folder / f"{name}.csv"
+        if not csv_path.exists():
+            continue
+
+        cache_path = session_folder / CACHE_FOLDER / name
+        if force or not cache_is_current(csv_path, cache_path):
+            print(f"Building cache for {csv_path}")
+            convert_log(csv_path, cache_path)
+
+
+class LogColumns:
+    """
+    Read-only, dictionary-like access to the columns of one cached log
+
+    Columns are memory mapped the first time they are accessed, so opening a log costs nothing until it is used
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = Path(cache_path)
+        with open(self.cache_path / MANIFEST_NAME) as file:
+            manifest = json.load(file)
+        self.rows = manifest["rows"]
+        self.files = manifest["columns"]
+        self._columns = {}
+
+    @property
+    def columns(self):
+        return list(self.files)
+
+    def __contains__(self, column):
+        return column in self.files
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, column):
+        if column not in self._columns:
+            if column not in self.files:
+                raise KeyError(f"{column} is not a column of {self.cache_path.name} (columns: {self.columns})")
+            # the files are sized from a count of the csv's lines, which can be more than the rows that were parsed
+            self._columns[column] = np.load(self.cache_path / self.files[column], mmap_mode="r")[:self.rows]
+        return self._columns[column]
+
+    def to_frame(self, columns=None):
+        """
+        Copies the requested columns into a pandas DataFrame, for code that still wants one
+        """
+        return pd.DataFrame({column: np.asarray(self[column]) for column in (columns or self.columns)})
+
+
+class Session:
+    """
+    A logged session, with each log loaded lazily from the columnar cache
+
+    session["imu"]["Y dot"] gives the memory mapped Y acceleration column
+    """
+
+    def __init__(self, session_folder, rebuild=True):
+        self.folder = Path(session_folder)
+        self.name = self.folder.name
+        self._logs = {}
+
+        # converting is only done when a csv has changed, so this is near-instant for sessions already cached
+        if rebuild:
+            build_cache(self.folder)
+
+    @property
+    def logs(self):
+        return [name for name in LOG_NAMES if (self.folder / CACHE_FOLDER / name / MANIFEST_NAME).exists()]
+
+    def __getitem__(self, name):
+        if name not in self._logs:
+            self._logs[name] = LogColumns(self.folder / CACHE_FOLDER / name)
+        return self._logs[name]
+
+
+def load_session(session_folder, rebuild=True):
+    return Session(session_folder, rebuild)
+
+
+# if this script is called directly, build (or rebuild) the cache of the given sessions
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python session_cache.py [--force] <log folder> [<log folder> ...]")
+        sys.exit(1)
+
+    force = "--force" in sys.argv
+    for folder in sys.argv[1:]:
+        if folder != "--force":
+            build_cache(folder, force=force)
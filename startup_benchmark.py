@@ -0,0 +1,67 @@
+"""
+Startup benchmark for the dashboard: time from launching app.py to its first frame, and to fully ready
+
+Launches the dashboard several times with LEMONS_STARTUP_BENCHMARK set, which makes it report its startup times and close
+itself once startup has finished, and prints the spread over the runs. Results can be appended to a csv to keep track of
+startup time across changes.
+
+    python startup_benchmark.py --runs 5 --output startup_times.csv
+"""
+import argparse
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+def run_once(offscreen=False, timeout=60):
+    """
+    Launches the dashboard once, returns the seconds from launch to (process start, first frame, ready)
+    """
+    environment = dict(os.environ, LEMONS_STARTUP_BENCHMARK="1")
+    if offscreen:
+        environment["QT_QPA_PLATFORM"] = "offscreen"
+
+    launched = time.time()
+    result = subprocess.run([sys.executable, "app.py"], cwd=Path(__file__).parent, env=environment,
+                            capture_output=True, text=True, timeout=timeout)
+
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            times = dict(item.split("=") for item in line.split()[1:])
+            return (float(times["start"]) - launched,
+                    float(times["first_frame"]) - launched,
+                    float(times["ready"]) - launched)
+
+    raise RuntimeError(f"app.py didn't report its startup time:\n{result.stdout[-2000:]}\n{result.stderr[-2000:]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the dashboard's time to first frame")
+    parser.add_argument("--runs", type=int, default=5, help="number of launches")
+    parser.add_argument("--offscreen", action="store_true", help="run without a display (QT_QPA_PLATFORM=offscreen)")
+    parser.add_argument("--output", default=None, help="csv file to append the results to")
+    args = parser.parse_args()
+
+    results = []
+    for run in range(args.runs):
+        interpreter, first_frame, ready = run_once(args.offscreen)
+        results.append((interpreter, first_frame, ready))
+        print(f"Run {run+1}: interpreter {interpreter*1000:.0f} ms, first frame {first_frame*1000:.0f} ms, "
+              f"ready {ready*1000:.0f} ms")
+
+    for name, column in (("First frame", 1), ("Ready", 2)):
+        values = [result[column]*1000 for result in results]
+        print(f"{name}: median {statistics.median(values):.0f} ms, min {min(values):.0f} ms, max {max(values):.0f} ms")
+
+    if args.output:
+        new_file = not Path(args.output).exists()
+        with open(args.output, 'a', newline='') as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(['Time', 'Run', 'Interpreter (s)', 'First Frame (s)', 'Ready (s)'])
+            for run, (interpreter, first_frame, ready) in enumerate(results):
+                writer.writerow([time.time(), run+1, interpreter, first_frame, ready])
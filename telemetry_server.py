@@ -0,0 +1,331 @@
+"""
+Fan-out of the car's telemetry to any number of local subscribers
+
+The process holding the radio (recorder.py --publish ...) forwards every frame that passes the checksum to each
+subscriber over TCP or UNIX sockets, and the dashboards subscribe by entering the address (tcp://pit-laptop:5760 or
+unix:///tmp/lemons.sock) in place of a serial port.
+
+Each record on the socket is the host time the frame was received, as a little endian double, followed by the frame
+exactly as it came over the radio (FD length id payload CRC, or FE length id payload AB CD from older firmware). The
+frames are already a compact binary encoding of the samples, so subscribers decode them with the same
+Vehicle.process_message as a direct connection, and the timestamps keep every view's samples on the recorder's clock.
+
+Every subscriber has its own bounded queue. When a subscriber can't keep up the oldest records are dropped from its
+queue, so a slow laptop on bad wifi never holds up ingest or the other subscribers.
+"""
+import os
+import select
+import selectors
+import socket
+import struct
+import threading
+from collections import deque
+
+# host receive time of each frame, sent in front of it
+RECORD_HEADER = struct.Struct('<d')
+
+DEFAULT_PORT = 5760
+# records queued per subscriber before the oldest are dropped, about ten seconds of telemetry
+DEFAULT_QUEUE_SIZE = 2000
+
+SUBSCRIPTION_SCHEMES = ('tcp://', 'unix://')
+
+
+def is_subscription(address):
+    return str(address).startswith(SUBSCRIPTION_SCHEMES)
+
+
+def parse_address(address):
+    """
+    Splits tcp://host:port or unix:///path/to/socket into a socket family and a socket address
+    """
+    if address.startswith('tcp://'):
+        host, _, port = address[len('tcp://'):].rpartition(':')
+        if not host:
+            host, port = port, DEFAULT_PORT
+        return socket.AF_INET, (host, int(port))
+    if address.startswith('unix://'):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("UNIX sockets are not available on this platform, use tcp://")
+        return socket.AF_UNIX, address[len('unix://'):]
+    raise ValueError(f"Unknown address {address}, expected tcp://host:port or unix:///path")
+
+
+def encode_record(t, frame):
+    return RECORD_HEADER.pack(t) + bytes(frame)
+
+
+class RecordDecoder:
+    """
+    Splits the byte stream from the server back into (time, frame) records
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer.extend(data)
+
+        records = []
+        start = 0
+        header = RECORD_HEADER.size
+        # a record is the timestamp plus a frame, and the frame's second byte is its total length
+        while len(self.buffer) - start > header + 1:
+            length = header + self.buffer[start + header + 1]
+            if len(self.buffer) - start < length:
+                break
+            t, = RECORD_HEADER.unpack_from(self.buffer, start)
+            records.append((t, bytes(self.buffer[start + header:start + length])))
+            start += length
+
+        del self.buffer[:start]
+        return records
+
+
+class Subscriber:
+    """
+    One connected client and its queue of records waiting to be sent
+    """
+
+    def __init__(self, connection, name, queue_size):
+        self.connection = connection
+        self.name = name
+        self.queue = deque(maxlen=queue_size)
+        # the record currently being sent, which may have only gone out partially
+        self.sending = None
+        self.sent = 0
+        self.dropped = 0
+
+    def push(self, record):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(record)
+
+
+class TelemetryServer:
+    """
+    Publishes frames to every subscriber connected to any of the listening addresses
+
+    publish() is called from the ingest loop and only appends to the subscribers' queues, the sockets are serviced by a
+    background thread
+    """
+
+    def __init__(self, addresses, queue_size=DEFAULT_QUEUE_SIZE):
+        self.addresses = list(addresses)
+        self.queue_size = queue_size
+
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self.listeners = []
+        self.running = False
+        self.thread = None
+        self.published = 0
+
+        # written to whenever there is something new to send, so the thread doesn't have to poll
+        self.wake_receive, self.wake_send = socket.socketpair()
+        self.wake_receive.setblocking(False)
+        self.wake_send.setblocking(False)
+
+    def start(self):
+        for address in self.addresses:
+            family, socket_address = parse_address(address)
+            if family != socket.AF_INET and os.path.exists(socket_address):
+                # a socket file left behind by a previous server that didn't shut down cleanly
+                os.unlink(socket_address)
+
+            listener = socket.socket(family, socket.SOCK_STREAM)
+            if family == socket.AF_INET:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(socket_address)
+            listener.listen()
+            listener.setblocking(False)
+            self.selector.register(listener, selectors.EVENT_READ, 'listener')
+            self.listeners.append((listener, family, socket_address))
+            print(f"Publishing telemetry on {address}")
+
+        self.selector.register(self.wake_receive, selectors.EVENT_READ, 'wake')
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="telemetry-server", daemon=True)
+        self.thread.start()
+
+    def publish(self, t, frame):
+        record = encode_record(t, frame)
+        with self.lock:
+            self.published += 1
+            for subscriber in self.subscribers:
+                subscriber.push(record)
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wake_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # the thread already has a wake up pending
+            pass
+
+    def run(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=1.0):
+                if key.data == 'listener':
+                    self.accept(key.fileobj)
+                elif key.data == 'wake':
+                    try:
+                        while key.fileobj.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                elif events & selectors.EVENT_READ:
+                    # subscribers don't send anything, so a readable socket means it has been closed
+                    try:
+                        closed = not key.fileobj.recv(4096)
+                    except (BlockingIOError, InterruptedError):
+                        closed = False
+                    except OSError:
+                        closed = True
+                    if closed:
+                        self.remove(key.data)
+                        continue
+
+            with self.lock:
+                subscribers = list(self.subscribers)
+            for subscriber in subscribers:
+                self.send(subscriber)
+
+    def accept(self, listener):
+        try:
+            connection, address = listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        connection.setblocking(False)
+        if connection.family == socket.AF_INET:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        subscriber = Subscriber(connection, str(address) or "unix socket", self.queue_size)
+        with self.lock:
+            self.subscribers.append(subscriber)
+        self.selector.register(connection, selectors.EVENT_READ, subscriber)
+        print(f"Subscriber connected: {subscriber.name}")
+
+    def send(self, subscriber):
+        """
+        Sends as much of the subscriber's queue as its socket will take without blocking
+        """
+        while True:
+            if subscriber.sending is None:
+                with self.lock:
+                    if not subscriber.queue:
+                        break
+                    # batch everything queued into one send
+                    subscriber.sending = b''.join(subscriber.queue)
+                    subscriber.queue.clear()
+                subscriber.sent = 0
+
+            try:
+                subscriber.sent += subscriber.connection.send(subscriber.sending[subscriber.sent:])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.remove(subscriber)
+                return
+
+            if subscriber.sent < len(subscriber.sending):
+                # the socket buffer is full, try again once the next record wakes the thread
+                break
+            subscriber.sending = None
+
+        # only wait for the socket to become writable while something is stuck in it
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.sending is not None else 0)
+        try:
+            self.selector.modify(subscriber.connection, events, subscriber)
+        except (KeyError, ValueError):
+            pass
+
+    def remove(self, subscriber):
+        with self.lock:
+            if subscriber not in self.subscribers:
+                return
+            self.subscribers.remove(subscriber)
+        try:
+            self.selector.unregister(subscriber.connection)
+        except (KeyError, ValueError):
+            pass
+        subscriber.connection.close()
+        print(f"Subscriber disconnected: {subscriber.name} ({subscriber.dropped} records dropped)")
+
+    def status(self):
+        with self.lock:
+            return {"published": self.published,
+                    "subscribers": [{"name": subscriber.name, "queued": len(subscriber.queue),
+                                     "dropped": subscriber.dropped} for subscriber in self.subscribers]}
+
+    def stop(self):
+        self.running = False
+        self.wake()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+        for subscriber in list(self.subscribers):
+            self.remove(subscriber)
+        for listener, family, socket_address in self.listeners:
+            listener.close()
+            if family != socket.AF_INET and os.path.exists(socket_address):
+                os.unlink(socket_address)
+        self.listeners = []
+        self.selector.close()
+        self.wake_receive.close()
+        self.wake_send.close()
+
+
+class Subscription:
+    """
+    Client side of the fan-out, used by Vehicle in place of a serial port
+
+    receive() returns the (time, frame) records that have arrived since the last call, waiting up to timeout seconds for
+    the first one
+    """
+
+    def __init__(self, address, connect_timeout=2.0):
+        self.address = address
+        family, socket_address = parse_address(address)
+        self.connection = socket.socket(family, socket.SOCK_STREAM)
+        self.connection.settimeout(connect_timeout)
+        try:
+            self.connection.connect(socket_address)
+        except OSError:
+            self.connection.close()
+            raise
+        self.connection.setblocking(False)
+        self.decoder = RecordDecoder()
+        self.is_open = True
+
+    def receive(self, timeout=0):
+        if not self.is_open:
+            return []
+
+        if timeout:
+            select.select([self.connection], [], [], timeout)
+
+        data = bytearray()
+        while True:
+            try:
+                chunk = self.connection.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as error:
+                print(f"Subscription to {self.address} lost: {error}")
+                self.close()
+                break
+            if not chunk:
+                print(f"Subscription to {self.address} closed by the server")
+                self.close()
+                break
+            data.extend(chunk)
+
+        return self.decoder.feed(data) if data else []
+
+    def close(self):
+        if self.is_open:
+            self.connection.close()
+            self.is_open = False
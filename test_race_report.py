@@ -0,0 +1,23 @@
+import numpy as np
+
+from race_report import interval_stats
+
+
+def test_interval_stats_with_empty_trailing_intervals():
+    # a channel log that ends before the last lap crossings leaves the final intervals empty, which must not cut the
+    # interval before them short
+    samples = np.arange(10, dtype=np.float64)
+    stats = interval_stats(samples, samples, [0, 5, 9.5, 20, 30], ("max", "mean", "min", "absmax"))
+
+    np.testing.assert_array_equal(stats["max"], [4, 9, np.nan, np.nan])
+    np.testing.assert_array_equal(stats["mean"], [2, 7, np.nan, np.nan])
+    np.testing.assert_array_equal(stats["min"], [0, 5, np.nan, np.nan])
+    np.testing.assert_array_equal(stats["absmax"], [4, 9, np.nan, np.nan])
+
+
+def test_interval_stats_with_empty_leading_and_middle_intervals():
+    samples = np.arange(10, dtype=np.float64)
+    stats = interval_stats(samples, samples, [-5, 0, 3, 3, 12], ("max", "mean"))
+
+    np.testing.assert_array_equal(stats["max"], [np.nan, 2, np.nan, 9])
+    np.testing.assert_array_equal(stats["mean"], [np.nan, 1, np.nan, 6])
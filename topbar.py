@@ -1,9 +1,7 @@
-# to get the list of available COM ports to connect to
-from serial.tools import list_ports
-
 # import necessary tools from Qt
+from PySide6.QtCore import Qt
 from PySide6.QtGui import (
-    QPixmap,
+    QImageReader,
 )
 from PySide6.QtWidgets import (
     QLabel,
@@ -16,20 +14,31 @@ from PySide6.QtWidgets import (
     QRadioButton,
 )
 
+from image_cache import image_cache
+from port_watcher import PortWatcher, load_radios
+from telemetry_server import is_subscription
+
+LOGO_PATH = './images/RiceLogo-500pxWide.jpg'
+
 class TopBar(QWidget):
-    def __init__(self):
+    """
+    The logo, title and connection controls across the top of the window
+
+    Initiated with the fleet of connected cars, so a radio plugged in later doesn't replace the port of a connected car
+    """
+
+    def __init__(self, fleet=None):
         # call the parent class's constructor to set up all of the things necessary for a QWidget (provided by Qt)
         super().__init__()
 
         # define a horizontal box layout to contain all of the items in the top bar
         layout = QHBoxLayout()
 
-        # create a QLabel() and then populate it with a QPixmap contianing the logo
-        logo_widget = QLabel()
-        logo = QPixmap()
-        logo.load('./images/RiceLogo-500pxWide.jpg')
-        logo_widget.setPixmap(logo) #this image is already saved at the correct size, so it doesn't need to be scaled, which would lose quality
-        layout.addWidget(logo_widget)
+        # create a QLabel() and then populate it with a QPixmap contianing the logo-- the image is decoded in the background by
+        # load_logo(), but its size is read from the file header now so the top bar doesn't shift when it appears
+        self.logo_widget = QLabel()
+        self.logo_widget.setFixedSize(QImageReader(LOGO_PATH).size())
+        layout.addWidget(self.logo_widget)
 
         # create a verticle box layout for the title acronym and the title below the acronym
         title_layout = QVBoxLayout()
@@ -47,20 +56,42 @@ class TopBar(QWidget):
 
         # this combobox reads all of the port options to provide them as options to the user
         self.port = QComboBox()
+        # editable so the address of a telemetry server (tcp://host:5760) can be typed in to subscribe instead of using a port
+        self.port.setEditable(True)
+        self.port.lineEdit().setPlaceholderText("Port or tcp://host:5760")
         # create a radio button to toggle between the two relevant baud rates, for telemetry radio and for USB cable
         self.baud = QRadioButton("USB COM port - 115200 Baud")
+        # on its own it is a toggle, an auto-exclusive radio button can't be unchecked once checked (by a click or by a radio
+        # being plugged in)
+        self.baud.setAutoExclusive(False)
         # connect the baud radio button to the method that changes the text for it, as well as the method to update the list of ports
         self.baud.clicked.connect(self.change_baud)
         self.baud.clicked.connect(self.get_ports)
 
+        # the list of ports is kept up to date in the background as radios are plugged in and pulled out, see start_port_watcher()
+        self.port_watcher = PortWatcher(self)
+        self.port_watcher.changed.connect(self.update_ports)
+        # a port whose USB ID is one of these is selected automatically when it appears
+        self.radios = load_radios()
+
+        # the cars connected so far, the button adds the selected port to them
+        self.fleet = fleet
         self.connect_button = QPushButton("Connect")
-        self.connect_button.setCheckable(True)
 
         self.heartbeat_time = QLabel("Heartbeat Time: 0ms")
         self.heartbeat_time.setObjectName("small")
-        
+
+        # every connected car is listed here, the selected one is shown in the data view
+        self.vehicle_select = QComboBox()
+        self.vehicle_select.setPlaceholderText("No cars connected")
+        # toggles the side by side comparison of every connected car
+        self.compare_button = QPushButton("Compare Cars")
+        self.compare_button.setCheckable(True)
+
         connection_layout.addWidget(self.port,0,0)
         connection_layout.addWidget(self.baud,1,0)
+        connection_layout.addWidget(self.vehicle_select,0,1)
+        connection_layout.addWidget(self.compare_button,1,1)
         connection_layout.addWidget(self.connect_button,0,2)
         connection_layout.addWidget(self.heartbeat_time,1,2)
 
@@ -70,19 +101,50 @@ class TopBar(QWidget):
         self.setLayout(layout)
         self.setMaximumHeight(100)
 
+    def load_logo(self):
+        # this image is already saved at the correct size, so it doesn't need to be scaled, which would lose quality
+        image_cache().when_ready(LOGO_PATH, self.logo_widget.setPixmap)
+
+    def start_port_watcher(self):
+        self.port_watcher.start()
+
     def get_ports(self):
         """
-        Method to update the list of ports in the comports drop down-- gets all of the ports using a provided python method
+        Method to update the list of ports in the comports drop down-- asks the port watcher to list the ports again in the
+        background, update_ports() is called with whatever changed
+        """
+        self.port_watcher.scan()
+
+    def update_ports(self, added, removed):
+        """
+        Adds and removes only the ports that changed, so the selected port (or a typed in server address) is left alone
         """
-        # get a list of all the ports available on the computer
-        ports = list_ports.comports()
-
-        # clear all of the currently listed ports so we don't double list them
-        self.port.clear()
-        # iterate through the new list of ports and add them as items to the dropdown QComboBox
-        for port in ports:
-            self.port.addItem(str(port.device))
-    
+        for device in removed:
+            index = self.port.findText(device)
+            if index >= 0:
+                self.port.removeItem(index)
+
+        for port in added:
+            if self.port.findText(port["device"]) < 0:
+                self.port.addItem(port["device"])
+                self.port.setItemData(self.port.count()-1, port["description"], Qt.ToolTipRole)
+
+        # a radio that was just plugged in is selected, unless a radio or a server address is already selected or the selected
+        # port's car is connected
+        selected = self.port.currentText()
+        current = self.port_watcher.ports.get(selected)
+        if self.fleet is not None and selected in self.fleet or is_subscription(selected) or \
+                current is not None and (current["vid"], current["pid"]) in self.radios:
+            return
+        for port in added:
+            if (port["vid"], port["pid"]) in self.radios:
+                name, baud = self.radios[(port["vid"], port["pid"])]
+                print(f"Found {name} on {port['device']}")
+                self.port.setCurrentText(port["device"])
+                self.baud.setChecked(baud == 57600)
+                self.change_baud()
+                return
+
     def change_baud(self):
         """
         Toggles the baud between that for USB and for telemetry connections, based on whether the radiobutton is checked or not
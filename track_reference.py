@@ -0,0 +1,151 @@
+import csv
+import math
+import sys
+from pathlib import Path
+
+from lap_alignment import EARTH_RADIUS, ReferenceLine
+
+# size of the grid buckets in meters, and how far from the centerline a fix can be and still be placed on the track
+CELL_SIZE = 25.0
+MAX_OFFSET = 50.0
+
+
+def centerline_path(map_filename):
+    """
+    Each map's centerline lives next to it in maps/, named after the map image: hallett_motor_circuit.png ->
+    maps/hallett_motor_circuit_centerline.csv
+    """
+    return Path("./maps") / (Path(map_filename).stem + "_centerline.csv")
+
+
+class TrackReference:
+    """
+    A track's reference centerline, precomputed into cumulative distance and a grid of buckets so a GPS fix can be placed
+    on the track by checking only the few segments near it
+
+    Initiated with the latitude and longitude of the centerline points in driving order, starting at start/finish
+    """
+
+    def __init__(self, lat, lon):
+        # the cumulative distance and local coordinates come from the same reference line the offline lap alignment uses
+        line = ReferenceLine(lat, lon)
+        self.length = float(line.length)
+        self.lat0 = float(line.lat0)
+        self.lon0 = float(line.lon0)
+        self.meters_per_deg_lat = EARTH_RADIUS*math.pi/180
+        self.meters_per_deg_lon = self.meters_per_deg_lat*math.cos(math.radians(self.lat0))
+
+        # plain python lists, since locating a single fix is faster with scalar math than with numpy calls
+        self.seg_x = line.seg_x.tolist()
+        self.seg_y = line.seg_y.tolist()
+        self.seg_dx = line.seg_dx.tolist()
+        self.seg_dy = line.seg_dy.tolist()
+        self.seg_len2 = line.seg_len2.tolist()
+        self.seg_start = line.distance[:-1].tolist()
+
+        # every segment goes into each bucket its bounding box (grown by MAX_OFFSET) touches, so any fix within
+        # MAX_OFFSET of the centerline finds its nearest segment in its own bucket
+        self.buckets = {}
+        for i in range(len(self.seg_x)):
+            x1, y1 = self.seg_x[i], self.seg_y[i]
+            x2, y2 = x1 + self.seg_dx[i], y1 + self.seg_dy[i]
+            for cx in range(self.cell(min(x1, x2) - MAX_OFFSET), self.cell(max(x1, x2) + MAX_OFFSET) + 1):
+                for cy in range(self.cell(min(y1, y2) - MAX_OFFSET), self.cell(max(y1, y2) + MAX_OFFSET) + 1):
+                    self.buckets.setdefault((cx, cy), []).append(i)
+
+    @staticmethod
+    def cell(value):
+        return int(math.floor(value/CELL_SIZE))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads a centerline from a csv with Lat and Lon columns
+        """
+        lat = []
+        lon = []
+        with open(path, newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                lat.append(float(row["Lat"]))
+                lon.append(float(row["Lon"]))
+        return cls(lat, lon)
+
+    def locate(self, lat, lon):
+        """
+        Places a GPS fix on the track, returning (distance along the centerline in meters, lap fraction from 0 to 1),
+        or None if the fix is further than MAX_OFFSET from the centerline
+        """
+        px = (lon - self.lon0)*self.meters_per_deg_lon
+        py = (lat - self.lat0)*self.meters_per_deg_lat
+
+        segments = self.buckets.get((self.cell(px), self.cell(py)))
+        if not segments:
+            return None
+
+        best_dist2 = MAX_OFFSET*MAX_OFFSET
+        best = None
+        for i in segments:
+            # closest point on the segment, clamped to its ends
+            t = ((px - self.seg_x[i])*self.seg_dx[i] + (py - self.seg_y[i])*self.seg_dy[i])/self.seg_len2[i]
+            t = 0.0 if t < 0.0 else (1.0 if t > 1.0 else t)
+            ex = self.seg_x[i] + t*self.seg_dx[i] - px
+            ey = self.seg_y[i] + t*self.seg_dy[i] - py
+            dist2 = ex*ex + ey*ey
+            if dist2 < best_dist2:
+                best_dist2 = dist2
+                best = self.seg_start[i] + t*math.sqrt(self.seg_len2[i])
+
+        if best is None:
+            return None
+        return best, best/self.length
+
+
+def load_track_reference(map_filename):
+    """
+    Loads the centerline for a map from maps/, or returns None if the track doesn't have one yet
+    """
+    path = centerline_path(map_filename)
+    if not path.exists():
+        return None
+    return TrackReference.from_file(path)
+
+
+def write_centerline(path, lat, lon):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Lat', 'Lon'])
+        writer.writerows(zip(lat, lon))
+
+
+# if this script is called directly, build a track's centerline from a clean lap of a recorded session
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    from lap_alignment import reference_from_lap
+
+    parser = argparse.ArgumentParser(description="Build a track centerline from one lap of a logged session")
+    parser.add_argument("session", help="log folder of the session")
+    parser.add_argument("map_filename", help="map image the centerline belongs to, as listed in maps/locations.csv")
+    parser.add_argument("--lap", type=int, default=1, help="lap to use, counting from 1")
+    parser.add_argument("--start", type=float, nargs=2, metavar=("LAT", "LON"), default=None,
+                        help="start/finish point (default: first GPS fix of the session)")
+    args = parser.parse_args()
+
+    gps = pd.read_csv(Path(args.session) / "gps.csv").sort_values("Time")
+    start_lat, start_lon = args.start if args.start else (gps["Lat"].iloc[0], gps["Lon"].iloc[0])
+
+    try:
+        reference = reference_from_lap(gps, start_lat, start_lon, lap_index=args.lap - 1)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+    # convert the reference line's local coordinates back to GPS coordinates
+    lat = reference.lat0 + reference.y/(EARTH_RADIUS*math.pi/180)
+    lon = reference.lon0 + reference.x/(EARTH_RADIUS*math.pi/180*math.cos(math.radians(reference.lat0)))
+
+    path = centerline_path(args.map_filename)
+    write_centerline(path, lat, lon)
+    print(f"Wrote {len(lat)} point centerline ({reference.length:.0f} m) to {path}")
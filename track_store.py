@@ -0,0 +1,163 @@
+"""
+The car's whole track for the session, kept compactly and simplified for drawing at any zoom
+
+Fixes are stored as rows of (time, lat, lon) in a float64 array that doubles in size when it fills, about 24 bytes per
+fix, so a 24 hour race at 10 Hz is around 20 MB. For drawing, the track is also kept at a few levels of detail, each one
+simplified with Douglas-Peucker to a tolerance in metres. The simplification is done incrementally: the newest fixes wait in
+a short tail, and each time the tail reaches CHUNK fixes it is simplified once per level and appended to that level as a
+chunk, along with the chunk's bounding box. Drawing picks the coarsest level whose tolerance is under a pixel, skips the
+chunks outside the view, and adds the raw tail on the end, so the work per frame depends on the view rather than on how long
+the session has run. A long race laps the same ground hundreds of times though, so a view of the whole session can also be
+capped at a number of vertices, by going to coarser levels and finally by drawing every few laps' worth of chunks.
+"""
+import math
+
+import numpy as np
+
+from lap_alignment import EARTH_RADIUS
+
+# tolerances of each level of detail, in metres
+LEVEL_TOLERANCES = (0.25, 1.0, 4.0, 16.0, 64.0)
+# fixes simplified at a time
+CHUNK = 256
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Indices of the points (an (n, 2) array in metres) kept by Douglas-Peucker simplification, always including both ends
+    """
+    if len(points) < 3:
+        return np.arange(len(points))
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        length = math.hypot(segment[0], segment[1])
+        between = points[first+1:last] - start
+        if length == 0.0:
+            distances = np.hypot(between[:, 0], between[:, 1])
+        else:
+            # perpendicular distance from the line through the ends
+            distances = np.abs(between[:, 0]*segment[1] - between[:, 1]*segment[0])/length
+        furthest = int(np.argmax(distances))
+        if distances[furthest] > tolerance:
+            index = first + 1 + furthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
+
+class TrackStore:
+    """
+    Every fix of the session with level of detail simplification for drawing
+
+    Appended to by whichever thread reads the car while the GUI thread draws, so the arrays are only ever added to: a row is
+    written before the count is increased, and a grown array replaces the old one rather than being resized in place
+    """
+
+    def __init__(self, capacity=4096):
+        self.fixes = np.empty((capacity, 3), dtype=np.float64)
+        self.count = 0
+        # local metres are measured from the first fix
+        self.origin = None
+        # for each level, a list of (lat/lon array of the simplified chunk, (min lat, min lon, max lat, max lon))
+        self.levels = [[] for _ in LEVEL_TOLERANCES]
+        # index of the first fix not yet simplified, every chunk starts on the last fix of the one before it
+        self.tail_start = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, lat, lon):
+        if self.count == len(self.fixes):
+            grown = np.empty((2*len(self.fixes), 3), dtype=np.float64)
+            grown[:self.count] = self.fixes[:self.count]
+            self.fixes = grown
+        self.fixes[self.count] = (t, lat, lon)
+        self.count += 1
+        if self.origin is None:
+            self.origin = (lat, lon, math.cos(math.radians(lat)))
+
+        if self.count - self.tail_start > CHUNK:
+            self.simplify_tail()
+
+    def simplify_tail(self):
+        end = self.count
+        chunk = self.fixes[self.tail_start:end, 1:]
+        metres = self.to_metres(chunk)
+        box = (*chunk.min(axis=0), *chunk.max(axis=0))
+        for level, tolerance in zip(self.levels, LEVEL_TOLERANCES):
+            level.append((chunk[douglas_peucker(metres, tolerance)], box))
+        # the last fix is the first of the next chunk, so the chunks join up
+        self.tail_start = end - 1
+
+    def to_metres(self, latlon):
+        lat0, lon0, cos_lat0 = self.origin
+        scale = math.radians(1)*EARTH_RADIUS
+        return np.column_stack(((latlon[:, 1] - lon0)*cos_lat0*scale, (latlon[:, 0] - lat0)*scale))
+
+    def latlon(self):
+        """
+        Every fix as an (n, 2) array of lat, lon
+        """
+        return self.fixes[:self.count, 1:]
+
+    def last(self):
+        """
+        The latest (lat, lon), or None before the first fix
+        """
+        count = self.count
+        if count == 0:
+            return None
+        return tuple(self.fixes[count-1, 1:])
+
+    def level_for(self, metres_per_pixel):
+        """
+        The coarsest level that is still accurate to half a pixel
+        """
+        chosen = 0
+        for level, tolerance in enumerate(LEVEL_TOLERANCES):
+            if tolerance <= metres_per_pixel/2:
+                chosen = level
+        return chosen
+
+    def tail(self):
+        """
+        The fixes not yet simplified into a chunk, as an (n, 2) array of lat, lon that joins on to the last chunk
+        """
+        return self.fixes[self.tail_start:self.count, 1:]
+
+    def polylines(self, metres_per_pixel, bounds=None, max_vertices=20000, tail=True):
+        """
+        The track to draw at this scale, as a list of (n, 2) lat/lon arrays that each make one polyline
+
+        bounds is (min lat, min lon, max lat, max lon) of the view, chunks entirely outside it are left out. If the chunks
+        in view have more than max_vertices, coarser levels are used, and past the coarsest only every few chunks are drawn
+        (always including the latest). With tail set to False only the finished chunks are returned, for drawing the tail
+        separately as it grows
+        """
+        # read before the chunks, so if a chunk is finished part way through, its fixes are drawn twice rather than not at all
+        count = self.count
+        tail_start = self.tail_start
+
+        for level in range(self.level_for(metres_per_pixel), len(LEVEL_TOLERANCES)):
+            lines = [points for points, box in list(self.levels[level])
+                     if bounds is None or (box[0] <= bounds[2] and box[2] >= bounds[0] and
+                                           box[1] <= bounds[3] and box[3] >= bounds[1])]
+            vertices = sum(len(points) for points in lines)
+            if max_vertices is None or vertices <= max_vertices:
+                break
+        else:
+            stride = math.ceil(vertices/max_vertices)
+            lines = lines[::-1][::stride][::-1]
+
+        if tail and count - tail_start >= 2:
+            lines.append(self.fixes[tail_start:count, 1:])
+        return lines
@@ -1,292 +1,170 @@
+import time
 
-import math # need this to do trigonometry
-
-from PySide6.QtGui import (
-    QPixmap,
-    QPainter,
-    QPen,
-    QColor,
-    QFont,
-)
-from PySide6.QtCore import (
-    QPoint,
-    QRect,
-    QLine,
-)
+from lap_timer import format_lap_time, format_delta
+from message_schema import SCHEMA
+from image_cache import image_cache
+from map_pyramid import map_pyramids
+from profiler import PROFILER, profiled
 
-import time
+# the labels of the message fields in the flight view and their formatters, see messages.csv
+FLIGHT_VIEW_BINDINGS = SCHEMA.bindings()
 
 
 class UpdateInformation():
     @staticmethod
+    @profiled("flight view")
     def updateFlightView(data_source, target):
         """
         Main method for updating the flight view with information-- calls the update HUD method, and edits all the text-based
         information in the flight view
         """
 
-        # go through all of the different text information displays, and get data from the data_source before formatting it into the display
-        # target.mph.setText('{:.1f}'.format(data_source.mph))
-        target.pit_entry.setText(f"{data_source.pit_entry}")
-        target.coolant_temperature.setText(f"{data_source.coolant_temperature}")
-        target.battery_voltage.setText(f"{data_source.battery_voltage}")
-        target.fuel_gauge.setText(f"{data_source.fuel_gauge}")
-        target.oil_pressure.setText(f"{data_source.oil_pressure}")
+        # go through all of the text displays of the message fields (see messages.csv), and get data from the data_source
+        # before formatting it into the display
+        for name, formatter in FLIGHT_VIEW_BINDINGS:
+            getattr(target, name).setText(formatter(getattr(data_source, name)))
 
-        if (data_source.pit_entry > 3900):
-            target.pit_entry.setStyleSheet("background-color: red;")
-        else:
-            target.pit_entry.setStyleSheet("background-color: white;")
+        # alerts are evaluated as samples arrive (see alerts.csv), so only the labels whose alert changed get restyled
+        for rule in data_source.alerts.pop_changed():
+            widget = getattr(target, rule.widget, None) if rule.widget else None
+            if widget is not None:
+                widget.setStyleSheet("background-color: red;" if rule.active else "background-color: white;")
 
-        
-        # if (data_source.tire_pressure < 10):
-        #     target.tire_pressure.setStyleSheet("background-color: red;")
-        
-        # if (data_source.coolant_temperature > 1.5):
-        #     target.tire_pressure.setStyleSheet("background-color: red;")
 
-        # if (data_source.battery_voltage < 10):
-        #     target.battery_voltage.setStyleSheet("background-color: red;")
+        target.combined_g.setText('{:.2f}'.format(data_source.combined_g))
+        target.gps_speed.setText('{:.1f}'.format(data_source.fused_speed))
 
-        # if (data_source.fuel_gauge < 0.5):
-        #     target.fuel_gauge.setStyleSheet("background-color: red;")
+        # lap timing, the current lap time runs off of the wall clock between GPS fixes
+        lap_timer = data_source.lap_timer
+        target.current_lap.setText(format_lap_time(lap_timer.current_lap_time(time.time())))
+        target.last_lap.setText(format_lap_time(lap_timer.last_lap))
+        target.best_lap.setText(format_lap_time(lap_timer.best_lap))
+        target.lap_delta.setText(format_delta(lap_timer.delta))
+        target.sector_splits.setText("  ".join(format_lap_time(split) for split in lap_timer.current_splits) or "--")
 
-        # if (data_source.oil_pressure < 1):
-        #     target.oil_pressure.setStyleSheet("background-color: red;")
-        
+        # update the acceleration charts, once they have been built after startup
+        if target.lateral_accel_chart is None:
+            return
 
-        # target.imu_temperature.setText('{:.1f}'.format(data_source.electronics_temperature)) --> currently not including
-        target.accel_x.setText('{:.2f}'.format(data_source.accel[0]))
-        target.accel_y.setText('{:.2f}'.format(data_source.accel[1]))
-        target.accel_z.setText('{:.2f}'.format(data_source.accel[2]))
-        target.gyro_x.setText('{:.2f}'.format(data_source.gyro[0]))
-        target.gyro_y.setText('{:.2f}'.format(data_source.gyro[1]))
-        target.gyro_z.setText('{:.2f}'.format(data_source.gyro[2]))
+        # each chart redraw is also timed on its own, as "chart redraw"
+        with PROFILER.stage("charts"):
+            target.lateral_accel_chart.add_point_stream1(data_source.imu_time, data_source.accel_y)
+            target.lateral_accel_chart.add_point_stream2(data_source.driver_time, data_source.steering_angle)
 
-        target.hdg.setText('{:.1f} degrees'.format(data_source.hdg))
-        target.lat.setText('{:.5f}'.format(data_source.lat)) #latitude and longitutde are kind of irrelevant for text display, but they might be useful
-        target.lon.setText('{:.5f}'.format(data_source.lon))
-        target.hdop.setText('{:.1f}'.format(data_source.hdop))
-        target.gps_speed.setText('{:.1f}'.format(data_source.gps_speed))
-        target.num_satellites.setText('{:.0f}'.format(data_source.num_satellites))
+            target.forward_accel_chart.add_point(data_source.imu_time, data_source.accel_z) # Z acceleration is forward
 
-        # update the acceleration charts
-        target.lateral_accel_chart.add_point_stream1(data_source.imu_time, data_source.accel[1])
-        target.lateral_accel_chart.add_point_stream2(data_source.driver_time, data_source.steering_angle)
+            target.throttle_brake_chart.add_point(data_source.imu_time, data_source.accel_x)
 
-        target.forward_accel_chart.add_point(data_source.imu_time, data_source.accel[2]) # Z acceleration is forward
+    @staticmethod
+    def restyleAlerts(data_source, target):
+        """
+        Styles every alert label from scratch, for when the data source shown in the view changes
+        """
+        data_source.alerts.pop_changed()
+        for rule in data_source.alerts.rules:
+            widget = getattr(target, rule.widget, None) if rule.widget else None
+            if widget is not None:
+                widget.setStyleSheet("background-color: red;" if rule.active else "background-color: white;")
 
-        target.throttle_brake_chart.add_point(data_source.imu_time, data_source.accel[0])
+    @staticmethod
+    @profiled("comparison")
+    def updateComparison(fleet, target):
+        """
+        Fills in the side by side comparison, one column per connected car
+        """
+        target.set_vehicles(fleet.names())
+        now = time.time()
+
+        for name, labels in target.values.items():
+            data_source = fleet[name]
+            lap_timer = data_source.lap_timer
+
+            labels["speed"].setText('{:.1f}'.format(data_source.fused_speed))
+            labels["rpm"].setText('{:.0f}'.format(data_source.rpm))
+            labels["combined_g"].setText('{:.2f}'.format(data_source.combined_g))
+            labels["lap"].setText(f"{lap_timer.lap_number}")
+            labels["current_lap"].setText(format_lap_time(lap_timer.current_lap_time(now)))
+            labels["last_lap"].setText(format_lap_time(lap_timer.last_lap))
+            labels["best_lap"].setText(format_lap_time(lap_timer.best_lap))
+            labels["delta"].setText(format_delta(lap_timer.delta))
+            labels["track_position"].setText('{:.0%}'.format(data_source.lap_fraction) if data_source.lap_fraction is not None else "--")
+            labels["coolant_temperature"].setText(f"{data_source.coolant_temperature}")
+            labels["oil_pressure"].setText(f"{data_source.oil_pressure}")
+            labels["fuel_gauge"].setText(f"{data_source.fuel_gauge}")
+            labels["battery_voltage"].setText(f"{data_source.battery_voltage}")
+            labels["heartbeat"].setText('{:.2f}'.format(now - data_source.last_heartbeat))
+            labels["frames"].setText(f"{data_source.counters['frames']}")
+
+            # the car's column header turns red while any of its alerts are on
+            labels["header"].setStyleSheet("background-color: red;" if data_source.alerts.active else "")
 
     @staticmethod
+    @profiled("top bar")
     def updateTopBar(data_source, target):
         """
-        This method updates the information on the top bar, specifically the connection button
+        This method updates the information on the top bar, specifically the heartbeat time and the state of the link
 
-        If the heartbeat frequency drops too low, indicating that we have lost connection with the vehicle, it re-enables the button
-         + this is to ensure that the UI doesn't get stuck in a connection that isn't working, however, it doesn't automatically terminate
-           the connection, in case the user wants to wait and see if the current connection will resume working
+        If the heartbeat stops, the vehicle reopens its port by itself (see Vehicle.check_link), so this only shows that it
+        is doing so-- the connect button stays free for connecting more cars
         """
         # get the time since the last heartbeat from the data_source, this is already calculated and updated when the data source's
         # .update() method is called by updateFlightView
         time = data_source.heartbeat_time
+        status = data_source.link_status
 
         # access the QLabel displaying the heartbeat frequency, and modify the text to display the actual value
-        target.heartbeat_time.setText('Heartbeat Time: {:.2f}'.format(time))
-
-        # if the time since the last heartbeat is too high, the system reenables the 'connect' button
-        if time > 3:
-            target.connect_button.setText("Connect")
-            target.connect_button.setDisabled(False)
+        text = 'Heartbeat Time: {:.2f}'.format(time)
+        if status not in ("connected", "no port"):
+            text += f" ({status})"
+        target.heartbeat_time.setText(text)
 
     @staticmethod
-    def updateMap(data_source, target, center = [475,297], zoom_factor = 0.5):
+    @profiled("map")
+    def updateMap(data_source, target):
         """
-        maps must have an aspect ratio of 8:5
-
-        center = (x, y) defined on a width of 950 by height of 594
-        
+        Updates the items of the map (see map_view.py) from the vehicle, each item is only redrawn if what it shows changed
         """
         # -------------------------------------------------------------------------
         #
         # get the map we are using from the QComboBox self.map_location
-        #  - data_source, map_center_lat, map_center_lon, width, height
         #
         # -------------------------------------------------------------------------
         location = str(target.map_location.currentText())
         filename,map_top_lat,map_left_lon,map_bottom_lat,map_right_lon = target.map_locations_dict[location]
 
-        # -------------------------------------------------------------------------
-        #
-        # Create a QPixmap and load in the image information
-        #
-        # -------------------------------------------------------------------------
-        gps_map_data = QPixmap()
-        gps_map_data.load("./maps/"+filename)
-        # get the original size of the image used for the GPS map
-        width = gps_map_data.width()
-        height = gps_map_data.height()
-
-        target_width, target_height = target.map_dimensions
-
-        # create a rectangle bounding box of the 'zoomed in' location on the image
-        crop_rect = QRect(int(center[0]*(width/target_width)-zoom_factor*(width/2)),
-                          int(center[1]*(height/target_height)-zoom_factor*(height/2)),
-                          int(zoom_factor*width), int(zoom_factor*height))
-        # use to bounding box to crop into the image, and then scale to the correct width (and height) of 950 (and 594)
-        gps_map_data = gps_map_data.copy(crop_rect).scaledToWidth(950)
-        
-        if data_source is not None:
-            # find the coordinates of the top left corner on a 950 (height) x 594 (width) scale
-            top_y = center[1] - (target_height//2)*zoom_factor
-            left_x = center[0] - (target_width//2)*zoom_factor
-
-            # load the history of the location into a list
-            hist = list(data_source.location_history)
-
-            # prepare the QPainter object to draw on the map
-            painter = QPainter(gps_map_data)
-            # the QPen is necessary to set the parameters of the shapes drawn using the QPainter
-            pen = QPen()
-            pen.setWidth(3)
-            pen.setColor(QColor(255,0,0)) # set it to draw the drive history in red (so it shows up)
-            painter.setPen(pen)
-
-            for i in range(len(hist)):
-                # check if there is a point after this one
-                if i < len(hist)-1:
-                    # get the latitude and longitude of the current point
-                    lat_1 = hist[i][0]
-                    lon_1 = hist[i][1]
-                    # transform GPS coordinates to match up with the map
-                    y_1 = (lat_1-map_top_lat)*(target_height/(map_bottom_lat-map_top_lat))
-                    x_1 = (lon_1-map_left_lon)*(target_width/(map_right_lon-map_left_lon))  
-
-                    # now we have coordinates from 0-625 and 0-1000 corresponding to the un-zoomed map (as floats)
-                    # get the difference between these coordinates and the top left corner of the zoomed in rectangle
-                    # then scale by 1/zoom_factor
-                    y_1 = (y_1 - top_y)/zoom_factor
-                    x_1 = (x_1 - left_x)/zoom_factor
-
-                    # get the latitude and longitude of the next point
-                    lat_2 = hist[i+1][0]
-                    lon_2 = hist[i+1][1]
-                    # transform the latitude and longitude to useful coordinates on the pixmap
-                    y_2 = (lat_2-map_top_lat)*(target_height/(map_bottom_lat-map_top_lat))
-                    x_2 = (lon_2-map_left_lon)*(target_width/(map_right_lon-map_left_lon))
-
-                    # now we have coordinates from 0-625 and 0-1000 corresponding to the un-zoomed map (as floats)
-                    # get the difference between these coordinates and the top left corner of the zoomed in rectangle
-                    # then scale by 1/zoom_factor
-                    y_2 = (y_2 - top_y)/zoom_factor
-                    x_2 = (x_2 - left_x)/zoom_factor
-
-                    # -------------------------------------------------------------------------
-                    #
-                    # Draw the lines using a QPainter created earlier in the method
-                    #
-                    # -------------------------------------------------------------------------
-                    painter.drawLine(x_1, y_1, x_2, y_2)
-
-            # -------------------------------------------------------------------------
-            #
-            # Draw a circle for the current car location
-            #
-            # -------------------------------------------------------------------------
-            pen.setWidth(4)
-            pen.setColor(QColor(255,0,0)) # set it to draw the current location in white
-            painter.setPen(pen)
-
-            # get the latitude and longitude of the current point
-            if (len(hist) >= 1):
-                lat_1 = hist[-1][0]
-                lon_1 = hist[-1][1]
-                # transform GPS coordinates to match up with the map
-                y_1 = (lat_1-map_top_lat)*(target_height/(map_bottom_lat-map_top_lat))
-                x_1 = (lon_1-map_left_lon)*(target_width/(map_right_lon-map_left_lon))  
-
-                # now we have coordinates from 0-625 and 0-1000 corresponding to the un-zoomed map (as floats)
-                # get the difference between these coordinates and the top left corner of the zoomed in rectangle
-                # then scale by 1/zoom_factor
-                y_1 = (y_1 - top_y)/zoom_factor
-                x_1 = (x_1 - left_x)/zoom_factor
-
-                painter.drawEllipse(x_1-8, y_1-8, 16, 16)
-
-            # -------------------------------------------------------------------------
-            #
-            # Draw a circle with an arrow to represent the current plane heading
-            #
-            # -------------------------------------------------------------------------
-
-            # Draw thicker black background for white compass logo
-            pen.setColor(QColor(0,0,0))
-            pen.setWidth(8)
-            # we need to assign the pen object to the painter again to actually change the color
-            painter.setPen(pen)
-
-            painter.drawEllipse(10, 10, 80, 80)
-            
-            # using the heading, calculate the location of each end of the compass's line
-            # convert the heading to radians, since math.sin and math.cos are in radians
-            hdg = (data_source.hdg+90)*(math.pi/180)
-            tip = QPoint(50+35*math.cos(hdg), 50-35*math.sin(hdg))
-            tail = QPoint(50-35*math.cos(hdg), 50+35*math.sin(hdg))
-
-            # the drawLine method takes two points, the ones just created, and draws a line between them with properties defined by the pen
-            painter.drawLine(tip, tail)
-
-            # now draw the arrow point
-            left = QPoint(50+20*math.cos(hdg)-5*math.sin(hdg), 50-20*math.sin(hdg)-5*math.cos(hdg))
-            right = QPoint(50+20*math.cos(hdg)+5*math.sin(hdg), 50-20*math.sin(hdg)+5*math.cos(hdg))
-            # after calculating the location of the end of each line in the arrow point, we can use those and the tip to draw the lines
-            painter.drawLine(tip, left)
-            painter.drawLine(tip, right)
-
-            # this is to add some decoration to the circle in each cardinal direction
-            painter.drawLine(QPoint(50,95), QPoint(50,85))
-            painter.drawLine(QPoint(95,50), QPoint(85,50))
-            painter.drawLine(QPoint(5,50), QPoint(15,50))
-            # draw the last line
-            painter.drawLine(QPoint(50,5), QPoint(50,15))
-
-            # Draw white symbol
-            pen.setColor(QColor(255,255,255))
-            pen.setWidth(2.5)
-            # we need to assign the pen object to the painter again to actually change the color
-            painter.setPen(pen)
+        # the tiles of the map's pyramid once it has been built (see map_pyramid.py), until then the whole image, decoded once
+        # in the background and then reused, the rest of the map is drawn without it until it is ready
+        map_view = target.gps_map
+        map_path = "./maps/"+filename
+        corners = (map_top_lat,map_left_lon,map_bottom_lat,map_right_lon)
+        pyramid = map_pyramids().get(map_path)
+        if pyramid is None:
+            map_view.set_map(corners, pixmap=image_cache().get(map_path))
+        else:
+            map_view.set_map(corners, pyramid=pyramid)
+            # the whole image isn't needed any more if it was decoded while the pyramid was being built
+            image_cache().discard([map_path])
 
-            painter.drawEllipse(10, 10, 80, 80)
-            
-            # using the heading, calculate the location of each end of the compass's line
-            # convert the heading to radians, since math.sin and math.cos are in radians
-            hdg = (data_source.hdg+90)*(math.pi/180)
-            tip = QPoint(50+35*math.cos(hdg), 50-35*math.sin(hdg))
-            tail = QPoint(50-35*math.cos(hdg), 50+35*math.sin(hdg))
+        if data_source is None:
+            return
 
-            # the drawLine method takes two points, the ones just created, and draws a line between them with properties defined by the pen
-            painter.drawLine(tip, tail)
+        # the whole session's track, only the end of it changes with each fix
+        map_view.track.set_track(data_source.track)
+        map_view.tail.set_track(data_source.track)
 
-            # now draw the arrow point
-            left = QPoint(50+20*math.cos(hdg)-5*math.sin(hdg), 50-20*math.sin(hdg)-5*math.cos(hdg))
-            right = QPoint(50+20*math.cos(hdg)+5*math.sin(hdg), 50-20*math.sin(hdg)+5*math.cos(hdg))
-            # after calculating the location of the end of each line in the arrow point, we can use those and the tip to draw the lines
-            painter.drawLine(tip, left)
-            painter.drawLine(tip, right)
+        # the heatmap over the track it colours
+        map_view.heatmap.set_heatmap(data_source.heatmap, target.heatmap_channel.currentData(), target.map_dimensions)
 
-            # this is to add some decoration to the circle in each cardinal direction
-            painter.drawLine(QPoint(50,95), QPoint(50,85))
-            painter.drawLine(QPoint(95,50), QPoint(85,50))
-            painter.drawLine(QPoint(5,50), QPoint(15,50))
-            # change the color to red to indicate this direction is north
-            pen.setColor(QColor(2,0,0))
-            painter.setPen(pen)
-            # draw the last line
-            painter.drawLine(QPoint(50,5), QPoint(50,15))
+        # a circle for the current car location
+        if len(data_source.track) >= 1:
+            # the fused position moves at the IMU rate, between the 1 Hz GPS fixes in the track
+            if data_source.fusion.initialized:
+                map_view.set_car(data_source.fused_lat, data_source.fused_lon)
+            else:
+                map_view.set_car(*data_source.track.last())
 
-            # make sure to close the painter at the end of each time this method is called, or Qt errors because there are
-            # too many painters active at once
-            painter.end()
+        # the compass arrow turned to the current heading
+        map_view.compass.set_heading(data_source.fused_heading)
 
-        # once the map has been constructed and the information is drawn on it, set the gps_map label to have this pixmap
-        target.gps_map.setPixmap(gps_map_data)
\ No newline at end of file
+        # the lap progress bar along the bottom of the map, if the track has a reference centerline
+        map_view.progress.set_progress(data_source.lap_fraction, data_source.track_distance)